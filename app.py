@@ -1,9 +1,18 @@
 # ----------------------------------------------------------------------------#
 # Imports
 # ----------------------------------------------------------------------------#
+import os
 import json
+from datetime import date, datetime, timedelta
+from itertools import groupby
+import multiprocessing
+import threading
+import random
+import time
+import hmac
 import dateutil.parser
 import babel
+import click
 from flask import (
     Flask,
     render_template,
@@ -12,16 +21,47 @@ from flask import (
     flash,
     redirect,
     url_for,
-    abort
+    abort,
+    jsonify,
+    stream_with_context
 )
+from flask.cli import with_appcontext
 from flask_moment import Moment
+from jinja2 import FileSystemBytecodeCache
 from flask_sqlalchemy import SQLAlchemy
-import logging
-from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
 from flask_migrate import Migrate
-from models import Venue, Artist, Show, db
+from sqlalchemy.exc import SQLAlchemyError
+from models import Venue, Artist, Show, BackfillState, db
+from transactions import run_in_transaction
+from scheduling import ScheduleConflict, check_schedule, is_conflict_error
+from cache import FragmentCacheExtension, LRUCache
+from calendar_feed import BUCKETS, bucket_starts, bucket_shows, ical
+from geo import load_gazetteer, geocode, encode, cell_ranges, distance_km
+from autocomplete import PrefixIndex
+from profiling import init_profiling
+from metrics import Metrics, init_metrics
+from logs import init_logging
+from ratelimit import init_ratelimit
+from sessions import init_sessions
+from jobs import enqueue, work, queue_stats
+from read_models import (
+  Area, ArtistName, ArtistSummary, VenueSummary, artist_detail,
+  search_summaries, show_tile, tile_query, upcoming_counts, venue_detail)
+from warmup import urls_from_access_log, warm_up
+from matching import MatchIndex
+from images import (
+  ImageCache, content_type, fetcher_from_url, sign, signing_key)
+from backfill import BACKFILLS, format_progress, run as run_backfill_batches
+from stats import (
+  read_stats, rebuild as rebuild_rollups, remove as remove_rollups)
+from changes import (
+  change_dict, follow, is_expired, read_changes, record_deleted, record_row)
+from dedup import DuplicateIndex, merge
+from partitions import (
+  add_months, archive_partition, create_partition, is_partitioned,
+  month_start, monthly_partitions, partition_name, scanned_partitions)
 
 
 # ----------------------------------------------------------------------------#
@@ -32,6 +72,21 @@ app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
 
+# json logs with request ids, written by a background thread
+init_logging(app)
+
+# templates are compiled once to bytecode and kept on disk, so that
+# new workers do not have to parse them again (see compile-templates).
+# Show tiles are cached as rendered fragments with {% cache %}.
+os.makedirs(app.config['TEMPLATE_CACHE_DIR'], exist_ok=True)
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache(
+    app.config['TEMPLATE_CACHE_DIR'])
+app.jinja_env.add_extension(FragmentCacheExtension)
+app.jinja_env.fragment_cache.maxsize = app.config['FRAGMENT_CACHE_SIZE']
+
+# opt-in per request profiling (db, template and python time)
+init_profiling(app)
+
 # call init_app to initialise (reminder: SQLAlchemy db was
 # not initialised in models.py)
 db.init_app(app)
@@ -42,6 +97,129 @@ db.init_app(app)
 # connect to a local postgresql database
 migrate = Migrate(app, db)
 
+# sessions (flashed messages) kept server side, shared by the workers
+# with a sql or redis store
+init_sessions(app, db)
+
+# an in-memory sqlite database starts empty: its schema is built from
+# the models (flask-sqlalchemy keeps its one connection for all threads)
+if app.config['SQLALCHEMY_DATABASE_URI'] in ('sqlite://', 'sqlite:///:memory:'):
+    with app.app_context():
+        db.create_all()
+
+# artist and venue names, searched by prefix by the pickers of the
+# show form. Built when first used (or by the warm-up), updated by the
+# routes creating, editing and deleting artists and venues and rebuilt
+# every NAMES_REFRESH_INTERVAL seconds (see refresh_name_indexes)
+artist_names = PrefixIndex()
+venue_names = PrefixIndex()
+
+# names of the artists and venues by city, to warn of likely duplicates
+# when one is listed. Filled and updated like the name indexes
+artist_duplicates = DuplicateIndex(app.config['DEDUP_THRESHOLD'])
+venue_duplicates = DuplicateIndex(app.config['DEDUP_THRESHOLD'])
+
+
+# city coordinates used to geocode venues
+gazetteer = load_gazetteer(app.config['GAZETTEER_PATH'])
+
+# genres of the artist and venue forms
+GENRES = [choice[0] for choice in ArtistForm.genres.kwargs['choices']]
+
+# venues suggested to artists and the reverse, built when first used,
+# kept up to date by the write routes and rebuilt every
+# MATCH_REFRESH_INTERVAL seconds (in the background, see refresh_matches)
+matches = MatchIndex(GENRES, app.config['MATCH_WEIGHTS'],
+                     app.config['MATCH_DISTANCE_SCALE_KM'])
+
+# thumbnails of the artist and venue images, served by /images, the
+# key their urls are signed with, and the images that could not be
+# fetched lately
+image_cache = ImageCache(app.config['IMAGE_CACHE_DIR'],
+                         app.config['IMAGE_CACHE_MAX_BYTES'],
+                         fetcher_from_url(app.config['IMAGE_FETCHER']),
+                         app.config['IMAGE_SIZES'])
+image_key = signing_key(app.config['IMAGE_SIGNING_KEY'], app.secret_key)
+failed_images = LRUCache(maxsize=1000,
+                         default_timeout=app.config['IMAGE_FAILURE_TIMEOUT'])
+
+# shows of the calendar, cached per bucket (day or week) and filters
+calendar_cache = LRUCache(maxsize=app.config['CALENDAR_CACHE_SIZE'],
+                          default_timeout=app.config['CALENDAR_CACHE_TIMEOUT'])
+
+
+# request, database and cache metrics, served on /metrics
+metrics = Metrics(app.config['METRICS_DIR'],
+                  app.config['METRICS_FLUSH_INTERVAL'])
+init_metrics(app, metrics, db, {
+  'fragments': app.jinja_env.fragment_cache,
+  'calendar': calendar_cache,
+})
+
+
+def job_queue_metrics():
+    stats = queue_stats(db.session)
+    for status in ('queued', 'running', 'done', 'failed'):
+        yield ('fyyur_job_queue_depth', (('status', status),),
+               stats['counts'].get(status, 0))
+    yield ('fyyur_job_oldest_due_seconds', (), stats['oldest_due_seconds'])
+
+
+metrics.global_collectors.append(job_queue_metrics)
+
+
+# rate limits of the search and write routes, and load shedding when
+# the database connection pool is saturated
+init_ratelimit(app, db)
+
+
+def build_name_indexes():
+    artist_names.warm(
+      db.session.query(Artist.id, Artist.name)
+      .yield_per(app.config['STREAM_BATCH_SIZE']))
+    venue_names.warm(
+      db.session.query(Venue.id, Venue.name)
+      .yield_per(app.config['STREAM_BATCH_SIZE']))
+    artist_duplicates.warm(
+      db.session.query(Artist.id, Artist.name, Artist.city, Artist.state)
+      .yield_per(app.config['STREAM_BATCH_SIZE']))
+    venue_duplicates.warm(
+      db.session.query(Venue.id, Venue.name, Venue.city, Venue.state)
+      .yield_per(app.config['STREAM_BATCH_SIZE']))
+
+
+def rebuild_index(building, build):
+    try:
+        with app.app_context():
+            build()
+    finally:
+        building.release()
+
+
+def refresh_index(building, built_at, build, interval):
+    # an in-process index is built by the first request using it, which
+    # waits for it; past ``interval`` seconds, it is rebuilt in a thread
+    # of its own while requests use it as it is. ``building`` is held by
+    # the build under way, ``built_at()`` is None until the first one
+    if built_at() is None:
+        with building:
+            if built_at() is None:
+                build()
+    elif (time.monotonic() - built_at() > interval
+            and building.acquire(blocking=False)):
+        threading.Thread(target=rebuild_index, args=(building, build),
+                         daemon=True).start()
+
+
+names_building = threading.Lock()
+
+
+def refresh_name_indexes():
+    # the four name indexes are built together, the duplicates of the
+    # venues last
+    refresh_index(names_building, lambda: venue_duplicates.built_at,
+                  build_name_indexes, app.config['NAMES_REFRESH_INTERVAL'])
+
 
 # ----------------------------------------------------------------------------#
 # Filters.
@@ -52,12 +230,642 @@ def format_datetime(value, format='medium'):
         format = "EEEE MMMM, d, y 'at' h:mma"
     elif format == 'medium':
         format = "EE MM, dd, y h:mma"
+    elif format == 'date':
+        format = "EEEE MMMM, d, y"
     return babel.dates.format_datetime(date, format, locale='en')
 
 
 app.jinja_env.filters['datetime'] = format_datetime
 
 
+def thumbnail_url(url, size='tile'):
+    # proxy url of the thumbnail of an image link (other than a link to
+    # a local file)
+    if not url or not url.startswith(('http://', 'https://')):
+        return url
+    return url_for('image_thumbnail', size=size, url=url,
+                   sig=sign(image_key, url, size))
+
+
+app.jinja_env.filters['thumbnail'] = thumbnail_url
+
+
+# ----------------------------------------------------------------------------#
+# Helpers.
+# ----------------------------------------------------------------------------#
+def stream_template(template_name, **context):
+    # render a template chunk by chunk while the response is sent, so
+    # that generators passed in the context are consumed lazily and the
+    # whole page never has to be held in memory
+    app.update_template_context(context)
+    template = app.jinja_env.get_template(template_name)
+    stream = template.stream(context)
+    stream.enable_buffering(app.config['STREAM_BUFFER_SIZE'])
+    return Response(stream_with_context(stream))
+
+
+def delete_rows(model, ids):
+    # delete the rows with the given ids in a single statement. Their
+    # shows are deleted by the database (ON DELETE CASCADE) and are
+    # never loaded into the session; their rollups are removed with them.
+    # The deletions of the rows and of their shows go to the change feed
+    entity = model.__tablename__.lower()
+
+    def delete(session):
+        remove_rollups(session, entity, ids)
+        column = getattr(Show, entity + '_id')
+        record_deleted(session, 'show', Show.id, column.in_(ids))
+        record_deleted(session, entity, model.id, model.id.in_(ids))
+        return (session.query(model)
+                .filter(model.id.in_(ids))
+                .delete(synchronize_session=False))
+    return run_in_transaction(delete)
+
+
+def flash_duplicates(label, index, row_id, form):
+    # warn of the venues (or artists) of the same city with a name close
+    # to the one just listed, then add it to the index
+    refresh_name_indexes()
+    duplicates = index.find(form.name.data, form.city.data, form.state.data,
+                            exclude=row_id)
+    index.add(row_id, form.name.data, form.city.data, form.state.data)
+    if duplicates:
+        flash('%s %s may be a duplicate of %s.' % (
+          label, form.name.data,
+          ', '.join('%s (%s %d)' % (name, label.lower(), other_id)
+                    for other_id, name, _ in duplicates)))
+
+
+def autocomplete(index):
+    # json list of the names starting with the 'q' query parameter
+    refresh_name_indexes()
+    limit = min(request.args.get('limit', 10, type=int),
+                app.config['AUTOCOMPLETE_MAX_RESULTS'])
+    matches = index.search(request.args.get('q', ''), limit)
+    return jsonify({'data': [{'id': record_id, 'name': name}
+                             for record_id, name in matches]})
+
+
+def calendar_request():
+    # bucket, bucket start days and filters asked to the calendar routes:
+    # ?start=YYYY-MM-DD&end=YYYY-MM-DD&bucket=day|week&city=&state=&venue_id=
+    bucket = request.args.get('bucket', 'day')
+    if bucket not in BUCKETS:
+        abort(400)
+    try:
+        start = date.fromisoformat(
+          request.args.get('start', date.today().isoformat()))
+        end = date.fromisoformat(
+          request.args.get('end', (start + timedelta(days=7)).isoformat()))
+    except ValueError:
+        abort(400)
+    starts = bucket_starts(start, end, bucket)
+    if not starts or len(starts) > app.config['CALENDAR_MAX_BUCKETS']:
+        abort(400)
+    filters = {
+      'city': request.args.get('city') or None,
+      'state': request.args.get('state') or None,
+      'venue_id': request.args.get('venue_id', type=int),
+    }
+    return bucket, starts, filters
+
+
+def calendar_buckets(bucket, starts, filters):
+    # each bucket is read from the cache, or queried and cached: popular
+    # windows ("this weekend") are served from memory
+    buckets = []
+    for day in starts:
+        key = ('calendar', bucket, day, filters['city'], filters['state'],
+               filters['venue_id'])
+        shows = calendar_cache.get(key)
+        if shows is None:
+            shows = bucket_shows(db.session, day, bucket, **filters)
+            calendar_cache.set(key, shows)
+        buckets.append({'start': day.isoformat(), 'shows': shows})
+    return buckets
+
+
+def locate_venue(venue):
+    # set the coordinates and geo cell of a venue from its city
+    coordinates = geocode(gazetteer, venue.city, venue.state)
+    if coordinates is None:
+        venue.latitude = venue.longitude = venue.geocell = None
+    else:
+        venue.latitude, venue.longitude = coordinates
+        venue.geocell = encode(*coordinates)
+
+
+def nearby_request():
+    # center and radius of a nearby search: ?lat=&lon=&km= or
+    # ?city=&state=&km=
+    latitude = request.args.get('lat', type=float)
+    longitude = request.args.get('lon', type=float)
+    if latitude is None or longitude is None:
+        coordinates = geocode(gazetteer, request.args.get('city'),
+                              request.args.get('state'))
+        if coordinates is None:
+            abort(400)
+        latitude, longitude = coordinates
+    radius = request.args.get('km', 10, type=float)
+    if (not -90 <= latitude <= 90 or not -180 <= longitude <= 180
+            or not 0 < radius <= app.config['NEARBY_MAX_KM']):
+        abort(400)
+    return latitude, longitude, radius
+
+
+def within(query, latitude, longitude, radius):
+    # restrict a query on Venue to the geo cells covering the circle.
+    # Rows still have to be filtered on their exact distance
+    query = query.filter(Venue.geocell.isnot(None))
+    ranges = cell_ranges(latitude, longitude, radius)
+    if ranges:
+        query = query.filter(db.or_(*[
+          db.and_(Venue.geocell >= low, Venue.geocell < high)
+          for low, high in ranges]))
+    return query
+
+
+def artist_match_row(artist):
+    # artists are located at the coordinates of their city
+    latitude, longitude = geocode(gazetteer, artist.city, artist.state) \
+        or (None, None)
+    return (artist.id, artist.genres, latitude, longitude, artist.state,
+            artist.seeking_venue)
+
+
+def build_matches():
+    batch_size = app.config['STREAM_BATCH_SIZE']
+    matches.build(
+      (artist_match_row(artist) for artist in
+       db.session.query(Artist.id, Artist.genres, Artist.city, Artist.state,
+                        Artist.seeking_venue).yield_per(batch_size)),
+      db.session.query(Venue.id, Venue.genres, Venue.latitude,
+                       Venue.longitude, Venue.state, Venue.seeking_talent)
+      .yield_per(batch_size),
+      db.session.query(Show.artist_id, Show.venue_id).yield_per(batch_size))
+
+
+def update_matches(model, row_id):
+    # set the row of an artist or a venue in the match index, from the
+    # database. Returns False if there is no such row
+    if matches.built_at is None:
+        # the row is read when the index is built
+        return True
+    if model is Artist:
+        artist = (db.session.query(Artist.id, Artist.genres, Artist.city,
+                                   Artist.state, Artist.seeking_venue)
+                  .filter(Artist.id == row_id).first())
+        if artist is None:
+            return False
+        matches.set_artist(*artist_match_row(artist))
+    else:
+        venue = (db.session.query(Venue.id, Venue.genres, Venue.latitude,
+                                  Venue.longitude, Venue.state,
+                                  Venue.seeking_talent)
+                 .filter(Venue.id == row_id).first())
+        if venue is None:
+            return False
+        matches.set_venue(*venue)
+    return True
+
+
+matches_building = threading.Lock()
+
+
+def refresh_matches():
+    refresh_index(matches_building, lambda: matches.built_at, build_matches,
+                  app.config['MATCH_REFRESH_INTERVAL'])
+
+
+def suggestions(owner, row_id, model, find):
+    # json of the artists or venues (model) suggested by find(row_id) to
+    # a venue or an artist (owner), e.g. ?k=20&all=1 for 20
+    # suggestions, seeking or not
+    refresh_matches()
+    k = min(max(request.args.get('k', 10, type=int), 1),
+            app.config['MATCH_MAX_RESULTS'])
+    seeking_only = not request.args.get('all')
+    found = find(row_id, k, seeking_only)
+    if found is None:
+        # added by another process since the index was built
+        if not update_matches(owner, row_id):
+            abort(404)
+        found = find(row_id, k, seeking_only)
+
+    rows = {
+      row.id: row for row in
+      db.session.query(model.id, model.name, model.city, model.state)
+      .filter(model.id.in_([candidate_id for candidate_id, _, _ in found]))
+    }
+    data = [{'id': candidate_id,
+             'name': rows[candidate_id].name,
+             'city': rows[candidate_id].city,
+             'state': rows[candidate_id].state,
+             'score': round(score, 4),
+             'components': {name: round(value, 4)
+                            for name, value in components.items()}}
+            for candidate_id, score, components in found
+            if candidate_id in rows]
+
+    return jsonify({'count': len(data), 'data': data})
+
+
+def requested_ids():
+    # ids of a bulk request, sent as a json body: {"ids": [1, 2, 3]}
+    body = request.get_json(silent=True) or {}
+    try:
+        ids = [int(record_id) for record_id in body.get('ids', [])]
+    except (TypeError, ValueError):
+        abort(400)
+    if not ids:
+        abort(400)
+    return ids
+
+
+# ----------------------------------------------------------------------------#
+# Commands.
+# ----------------------------------------------------------------------------#
+@app.cli.command('compile-templates')
+def compile_templates():
+    # precompile all html templates into the bytecode cache, to be
+    # run at deploy time
+    names = app.jinja_env.list_templates(extensions=['html'])
+    for name in names:
+        app.jinja_env.get_template(name)
+    print('Compiled %d templates into %s'
+          % (len(names), app.config['TEMPLATE_CACHE_DIR']))
+
+
+# in-process indexes built by the warm-up, so that no request waits for
+# them
+WARMUP_INDEXES = [('name indexes', build_name_indexes),
+                  ('matches', build_matches)]
+
+
+@app.cli.command('warmup')
+@click.option('--urls-file', type=click.File(),
+              help='File with one url per line to request.')
+@click.option('--access-log', type=click.Path(exists=True),
+              help='Json log to take the most requested pages from.')
+@click.option('--hours', default=24,
+              help='Hours of the access log to look at.')
+@click.option('--limit', default=50,
+              help='Number of pages taken from the access log.')
+def warmup(urls_file, access_log, hours, limit):
+    # compile the templates, configure the mappers, build the indexes
+    # and request the busiest pages once, before the instance gets
+    # traffic
+    if urls_file is not None:
+        urls = [line.strip() for line in urls_file if line.strip()]
+    elif access_log is not None:
+        urls = urls_from_access_log(access_log, hours, limit)
+    else:
+        urls = app.config['WARMUP_URLS']
+    report = warm_up(app, urls, WARMUP_INDEXES)
+    for step, seconds, detail in report:
+        print('%8.1f ms  %-40s %s' % (seconds * 1000, step, detail))
+    print('%8.1f ms  total' % (sum(r[1] for r in report) * 1000))
+    if any(detail[0] in '45' for _, _, detail in report[2:]):
+        raise SystemExit(1)
+
+
+@app.cli.command('init-db')
+@click.option('--drop', is_flag=True, help='Drop the existing tables first.')
+def init_db(drop):
+    # create the tables from the models, without the migrations (e.g. for
+    # a sqlite database). Then `flask db stamp head` marks the
+    # migrations as applied
+    if drop:
+        db.drop_all()
+    db.create_all()
+    print('Created the tables of %s' % db.engine.url)
+
+
+@app.cli.command('geocode-venues')
+@click.option('--all', 'everything', is_flag=True,
+              help='Geocode all venues, not only the ones without '
+                   'coordinates.')
+def geocode_venues(everything):
+    # offline geocoding of the venues from the local gazetteer, in
+    # batches of venues ordered by id
+    batch_size = app.config['STREAM_BATCH_SIZE']
+    last_id = 0
+    located = missing = 0
+    while True:
+        query = Venue.query.filter(Venue.id > last_id)
+        if not everything:
+            query = query.filter(Venue.latitude.is_(None))
+        batch = query.order_by(Venue.id).limit(batch_size).all()
+        if not batch:
+            break
+        for venue in batch:
+            locate_venue(venue)
+            if venue.latitude is None:
+                missing += 1
+            else:
+                located += 1
+        last_id = batch[-1].id
+        db.session.commit()
+    print('Geocoded %d venues, %d cities not found in the gazetteer'
+          % (located, missing))
+
+
+@app.cli.command('seed')
+@click.option('--venues', 'venue_count', default=100,
+              help='Number of venues to add.')
+@click.option('--artists', 'artist_count', default=200,
+              help='Number of artists to add.')
+@click.option('--shows', 'show_count', default=2000,
+              help='Number of shows to add.')
+@click.option('--random-seed', default=0,
+              help='Seed of the generated data.')
+def seed(venue_count, artist_count, show_count, random_seed):
+    # fill the database with generated venues, artists and shows, for
+    # load tests (see loadtest.py). Venues are in gazetteer cities, and
+    # a venue or an artist has at most one show per evening
+    rng = random.Random(random_seed)
+    cities = sorted(gazetteer.items())
+    batch_size = app.config['STREAM_BATCH_SIZE']
+
+    def fake_genres():
+        # formatted by the Genres column type
+        return rng.sample(GENRES, rng.randint(1, 3))
+
+    venue_ids = []
+    for first in range(0, venue_count, batch_size):
+        venues = []
+        for n in range(first, min(first + batch_size, venue_count)):
+            (city, state), (latitude, longitude) = rng.choice(cities)
+            venues.append(Venue(
+              name='Venue %d %s' % (n, rng.choice(('Hall', 'Club', 'Bar'))),
+              city=city.title(), state=state,
+              address='%d Main Street' % rng.randint(1, 999),
+              phone='555-%03d-%04d' % (rng.randint(0, 999), n % 10000),
+              genres=fake_genres(), latitude=latitude, longitude=longitude,
+              geocell=encode(latitude, longitude)))
+        db.session.add_all(venues)
+        db.session.flush()
+        venue_ids.extend(venue.id for venue in venues)
+        db.session.commit()
+
+    artist_ids = []
+    for first in range(0, artist_count, batch_size):
+        artists = []
+        for n in range(first, min(first + batch_size, artist_count)):
+            city, state = rng.choice(cities)[0]
+            artists.append(Artist(
+              name='Artist %d' % n, city=city.title(), state=state,
+              phone='555-%03d-%04d' % (rng.randint(0, 999), n % 10000),
+              genres=fake_genres()))
+        db.session.add_all(artists)
+        db.session.flush()
+        artist_ids.extend(artist.id for artist in artists)
+        db.session.commit()
+
+    # one show per (venue, artist) pair of an evening, evenings centered
+    # on today so that there are past and upcoming shows
+    per_evening = min(len(venue_ids), len(artist_ids))
+    evenings = -(-show_count // per_evening) if per_evening else 0
+    first_evening = datetime.combine(date.today(), datetime.min.time()) \
+        - timedelta(days=evenings // 2) + timedelta(hours=20)
+    rows = []
+    for evening in range(evenings):
+        pairs = zip(rng.sample(venue_ids, per_evening),
+                    rng.sample(artist_ids, per_evening))
+        for venue_id, artist_id in pairs:
+            if len(rows) == show_count:
+                break
+            rows.append({'venue_id': venue_id, 'artist_id': artist_id,
+                         'start_time': first_evening + timedelta(days=evening),
+                         'duration': 120})
+    for first in range(0, len(rows), batch_size):
+        db.session.bulk_insert_mappings(Show, rows[first:first + batch_size])
+        db.session.commit()
+    print('Added %d venues, %d artists and %d shows'
+          % (len(venue_ids), len(artist_ids), len(rows)))
+
+
+@app.cli.group('partitions')
+@with_appcontext
+def partitions_command():
+    """Maintenance of the monthly partitions of Show (postgres)."""
+    with db.engine.connect() as connection:
+        if not is_partitioned(connection):
+            raise click.ClickException(
+              'Show is not partitioned on %s' % db.engine.url)
+
+
+@partitions_command.command('list')
+def list_partitions():
+    with db.engine.connect() as connection:
+        for month in monthly_partitions(connection):
+            print(partition_name(month))
+
+
+@partitions_command.command('create')
+@click.option('--months-ahead', default=3,
+              help='Create the partitions up to this many months from now.')
+def create_partitions(months_ahead):
+    # to be run every month, ahead of the shows being listed
+    last = add_months(month_start(datetime.now()), months_ahead)
+    with db.engine.connect() as connection:
+        existing = monthly_partitions(connection)
+    month = add_months(existing[-1], 1) if existing \
+        else month_start(datetime.now())
+    while month <= last:
+        with db.engine.begin() as connection:
+            print('Created %s' % create_partition(connection, month))
+        month = add_months(month, 1)
+
+
+@partitions_command.command('archive')
+@click.option('--keep-months', default=12,
+              help='Keep the partitions of this many past months.')
+@click.option('--detach-only', is_flag=True,
+              help='Detach the old partitions and keep them as tables, '
+                   'instead of moving their shows to Show_archive.')
+def archive_partitions(keep_months, detach_only):
+    # one transaction per partition
+    before = add_months(month_start(datetime.now()), -keep_months)
+    with db.engine.connect() as connection:
+        old = [month for month in monthly_partitions(connection)
+               if month < before]
+    for month in old:
+        with db.engine.begin() as connection:
+            name = archive_partition(connection, month, detach_only)
+        print('%s %s' % ('Detached' if detach_only else 'Archived', name))
+
+
+@partitions_command.command('check')
+def check_partitions():
+    # EXPLAIN of a query on upcoming shows: only the partitions of this
+    # month and later should be read
+    now = datetime.now()
+    with db.engine.connect() as connection:
+        plan, scanned = scanned_partitions(
+          connection,
+          'SELECT id FROM "Show" WHERE venue_id = :venue_id '
+          'AND start_time > :now',
+          {'venue_id': 1, 'now': now})
+    print('\n'.join(plan))
+    current = partition_name(month_start(now))
+    pruned = all(name == 'Show_default' or name >= current
+                 for name in scanned)
+    print('Partitions read: %s' % ', '.join(scanned))
+    if not pruned:
+        raise click.ClickException('past partitions are read')
+
+
+@app.cli.group('backfill')
+def backfill_command():
+    """Batched, resumable rewrites of table rows."""
+
+
+@backfill_command.command('list')
+@with_appcontext
+def list_backfills():
+    states = {state.name: state for state in BackfillState.query}
+    for name in sorted(BACKFILLS):
+        state = states.get(name)
+        if state is None:
+            print('%s: not started' % name)
+        else:
+            print('%s: %s, %d rows, last key %d, updated %s' % (
+              name, state.status, state.rows_done, state.last_key,
+              state.updated_at.isoformat(' ', 'seconds')))
+
+
+@backfill_command.command('run')
+@click.argument('name', type=click.Choice(sorted(BACKFILLS)))
+@click.option('--batch-size', default=1000,
+              help='Largest number of rows per batch.')
+@click.option('--pause', default=0.05,
+              help='Seconds to wait between batches.')
+@click.option('--restart', is_flag=True,
+              help='Start over, even if the backfill is done.')
+@with_appcontext
+def run_backfill(name, batch_size, pause, restart):
+    # goes on from the last batch done when interrupted
+    with db.engine.connect() as connection:
+        run_backfill_batches(
+          connection, name, batch_size=batch_size, pause=pause,
+          restart=restart,
+          progress=lambda state: print(format_progress(state)))
+    print('%s: done' % name)
+
+
+@app.cli.command('rebuild-stats')
+def rebuild_stats():
+    # count all the shows again into the stats rollups
+    started = time.perf_counter()
+    rows = rebuild_rollups(db.session)
+    db.session.commit()
+    print('Rebuilt %d rollup rows in %.2fs'
+          % (rows, time.perf_counter() - started))
+
+
+@app.cli.group('changes')
+def changes_command():
+    """Change feed of the venues, artists and shows."""
+
+
+@changes_command.command('follow')
+@click.option('--since', default=0,
+              help='Position of the last change seen.')
+@with_appcontext
+def follow_changes(since):
+    # one json change per line, as they are committed: LISTEN/NOTIFY on
+    # postgres, polling elsewhere
+    config = app.config
+    for change in follow(db.session, db.engine, since,
+                         config['CHANGES_POLL_INTERVAL']):
+        print(json.dumps(change), flush=True)
+
+
+DEDUP_MODELS = {'venues': Venue, 'artists': Artist}
+
+
+def duplicate_index(model):
+    # a fresh index of all the venues (or artists)
+    index = DuplicateIndex(app.config['DEDUP_THRESHOLD'])
+    index.warm(db.session.query(model.id, model.name, model.city,
+                                model.state)
+               .yield_per(app.config['STREAM_BATCH_SIZE']))
+    return index
+
+
+@app.cli.group('dedup')
+def dedup_command():
+    """Find and merge duplicate venues and artists."""
+
+
+@dedup_command.command('list')
+@click.argument('kind', type=click.Choice(sorted(DEDUP_MODELS)))
+@with_appcontext
+def list_duplicates(kind):
+    # pairs of likely duplicates, most alike first
+    index = duplicate_index(DEDUP_MODELS[kind])
+    for first, second, score in index.pairs():
+        print('%.3f  %d %s  |  %d %s' % (score, first, index.name_of(first),
+                                         second, index.name_of(second)))
+
+
+@dedup_command.command('merge')
+@click.argument('kind', type=click.Choice(sorted(DEDUP_MODELS)))
+@click.argument('keep_id', type=int)
+@click.argument('duplicate_ids', type=int, nargs=-1, required=True)
+@with_appcontext
+def merge_duplicates(kind, keep_id, duplicate_ids):
+    # moves the shows of the duplicates to KEEP_ID and deletes them, in
+    # one transaction. Running workers see the merge when they rebuild
+    # their indexes (NAMES_REFRESH_INTERVAL, MATCH_REFRESH_INTERVAL)
+    model = DEDUP_MODELS[kind]
+    if keep_id in duplicate_ids:
+        raise click.ClickException('%d is both kept and merged' % keep_id)
+    found = {row_id for row_id, in db.session.query(model.id).filter(
+      model.id.in_((keep_id,) + duplicate_ids))}
+    missing = sorted(set((keep_id,) + duplicate_ids) - found)
+    if missing:
+        raise click.ClickException('no %s %s' % (
+          kind, ', '.join(map(str, missing))))
+    try:
+        moved = run_in_transaction(
+          lambda session: merge(session, model, keep_id, list(duplicate_ids)))
+    except ScheduleConflict as conflict:
+        raise click.ClickException(str(conflict))
+    except SQLAlchemyError as error:
+        if is_conflict_error(error):
+            raise click.ClickException('a moved show overlaps another one')
+        raise
+    print('Merged %s %s into %d, %d shows moved' % (
+      kind, ', '.join(map(str, duplicate_ids)), keep_id, moved))
+
+
+def run_worker(burst):
+    # entry point of a worker process: connections of the parent
+    # process are not shared with the forked child
+    with app.app_context():
+        db.engine.dispose()
+    work(app, metrics, burst)
+
+
+@app.cli.command('worker')
+@click.option('--processes', default=1, help='Number of worker processes.')
+@click.option('--burst', is_flag=True,
+              help='Stop when no job is due instead of waiting for more.')
+def worker(processes, burst):
+    # run background jobs
+    if processes == 1:
+        work(app, metrics, burst)
+        return
+    children = [multiprocessing.Process(target=run_worker, args=(burst,))
+                for _ in range(processes)]
+    for child in children:
+        child.start()
+    for child in children:
+        child.join()
+
+
 # ----------------------------------------------------------------------------#
 # Controllers.
 # ----------------------------------------------------------------------------#
@@ -70,38 +878,25 @@ def index():
 # ----------------------------------------------------------------
 @app.route('/venues')
 def venues():
-    # use venues data from database
-    # num_shows should be aggregated based on
-    # number of upcoming shows per venue
-    places = Venue.query.distinct(Venue.city).distinct(Venue.state).all()
-    data = []
-
-    for place in places:
-        dict_data = {}
-        dict_data['city'] = place.city
-        dict_data['state'] = place.state
-        dict_data['venues'] = []
-
-        venues_in_place = Venue.query.filter(
-            Venue.city == place.city).filter(Venue.state == place.state).all()
-
-        list_dict_venues = []
-        for venue_in_place in venues_in_place:
-            dict_venue = {}
-            dict_venue['id'] = venue_in_place.id
-            dict_venue['name'] = venue_in_place.name
-            dict_venue['num_upcoming_shows'] = (
-              Show.query.filter(Show.venue_id == venue_in_place.id)
-                        .filter(Show.start_time > datetime.now())
-                        .count()
-                        )
-            list_dict_venues.append(dict_venue)
-
-        dict_data['venues'] = list_dict_venues
+    # use venues data from database, grouped by city and state.
+    # num_upcoming_shows is aggregated in the same query, and rows
+    # are streamed to the template area by area
+    upcoming = upcoming_counts(Show.venue_id)
+    rows = (
+      db.session.query(Venue.city, Venue.state, Venue.id, Venue.name,
+                       db.func.coalesce(upcoming.c.num, 0))
+      .outerjoin(upcoming, upcoming.c.owner_id == Venue.id)
+      .order_by(Venue.state, Venue.city, Venue.id)
+      .yield_per(app.config['STREAM_BATCH_SIZE'])
+    )
 
-        data.append(dict_data)
+    def areas():
+        for (city, state), venues_in_place in groupby(
+                rows, key=lambda row: (row[0], row[1])):
+            yield Area(city, state, (VenueSummary._make(row[2:])
+                                     for row in venues_in_place))
 
-    return render_template('pages/venues.html', areas=data)
+    return stream_template('pages/venues.html', areas=areas())
 
 
 @app.route('/venues/search', methods=['POST'])
@@ -112,117 +907,63 @@ def search_venues():
     # search for "Music" should return "The Musical Hop" and
     # "Park Square Live Music & Coffee"
 
-    # get the value of the 'name' in the form input element:
+    # get the value of the 'name' in the form input element; the
+    # upcoming shows of all the venues found are counted in one query
     search_term = request.form.get('search_term', '')
-    found_venues = (Venue.query
-                    .filter(Venue.name.ilike("%" + search_term + "%"))
-                    .all()
-                    )
-
-    response = {}
-    data_count = 0
-    list_data = []
-    for found_venue in found_venues:
-        data_count += 1
-        dict_data = {}
-
-        dict_data["id"] = found_venue.id
-        dict_data["name"] = found_venue.name
-        num_upcoming = (
-          Show.query.filter(Show.start_time > datetime.now())
-                    .filter(Show.venue_id == found_venue.id).count()
-          )
-
-        dict_data["num_upcoming_shows"] = num_upcoming
-        list_data.append(dict_data)
-
-    response["count"] = data_count
-    response["data"] = list_data
+    results = search_summaries(Venue, Show.venue_id, VenueSummary,
+                               search_term)
 
     return render_template(
       'pages/search_venues.html',
-      results=response,
-      search_term=request.form.get('search_term', '')
+      results=results,
+      search_term=search_term
       )
 
 
-@app.route('/venues/<int:venue_id>')
-def show_venue(venue_id):
-    # to show the venue page with the given venue_id
-    # venue data from the venues table, using venue_id
-
-    venue_selected = Venue.query.filter(Venue.id == venue_id).all()
-    venue = venue_selected[0]
-
-    dict_venue = {}
-    dict_venue["id"] = venue.id
-    dict_venue["name"] = venue.name
-    dict_venue["genres"] = venue.genres
-    dict_venue["address"] = venue.address
-    dict_venue["city"] = venue.city
-    dict_venue["state"] = venue.state
-    dict_venue["phone"] = venue.phone
-    dict_venue["website"] = venue.website_link
-    dict_venue["facebook_link"] = venue.facebook_link
-    dict_venue["seeking_talent"] = venue.seeking_talent
-    dict_venue["seeking_description"] = venue.seeking_description
-    dict_venue["image_link"] = venue.image_link
-
-    dict_venue["past_shows"] = []
-    dict_venue["upcoming_shows"] = []
-
-    venue_shows = Show.query.filter(Show.venue_id == venue.id).all()
-    for show in venue_shows:
-        dict_show = {}
-        dict_show["artist_id"] = show.artist_id
-        artist = Artist.query.filter(Artist.id == show.artist_id).all()
-        # query above returns a list of one element. Therefore extract
-        # the element before accessing attributes:
-        dict_show["artist_name"] = artist[0].name
-        dict_show["artist_image_link"] = artist[0].image_link
-        # date and time to be as a string as per filter function used later:
-        dict_show["start_time"] = show.start_time.strftime("%d/%m/%Y, %H:%M")
-
-        if show.start_time < datetime.now():
-            dict_venue["past_shows"].append(dict_show)
-        else:
-            dict_venue["upcoming_shows"].append(dict_show)
+@app.route('/venues/autocomplete')
+def autocomplete_venues():
+    # venues whose name starts with the 'q' query parameter,
+    # for the venue picker of the show form
+    return autocomplete(venue_names)
 
-    past_count_query = (
-      db.session.query(Show).join(Venue)
-      .filter(Show.venue_id == venue_id)
-      .filter(Show.start_time < datetime.now())
-      .all()
-    )
 
-    upcoming_count_query = (
-      db.session.query(Show).join(Venue)
-      .filter(Show.venue_id == venue_id)
-      .filter(Show.start_time > datetime.now())
-      .all()
-    )
+@app.route('/venues/nearby')
+def nearby_venues():
+    # venues within 'km' of a point or of a city, closest first
+    latitude, longitude, radius = nearby_request()
+    rows = within(
+      db.session.query(Venue.id, Venue.name, Venue.city, Venue.state,
+                       Venue.latitude, Venue.longitude),
+      latitude, longitude, radius)
+
+    data = []
+    for venue_id, name, city, state, venue_lat, venue_lon in rows:
+        distance = distance_km(latitude, longitude, venue_lat, venue_lon)
+        if distance <= radius:
+            data.append({'id': venue_id, 'name': name, 'city': city,
+                         'state': state, 'distance_km': round(distance, 2)})
+    data.sort(key=lambda venue: venue['distance_km'])
 
-    dict_venue["past_shows_count"] = len(past_count_query)
-    dict_venue["upcoming_shows_count"] = len(upcoming_count_query)
+    return jsonify({'count': len(data), 'data': data})
 
-    # Alternative code:
-    # past_count = (
-    #   Show.query.filter(Show.venue_id == venue_id)
-    #             .filter(Show.start_time < datetime.now())
-    #             .distinct(Show.artist_id).count()
-    #             )
-    # dict_venue["past_shows_count"] = past_count
-    #
-    # upcoming_count = (
-    #   Show.query.filter(Show.venue_id == venue_id)
-    #             .filter(Show.start_time > datetime.now())
-    #             .distinct(Show.artist_id).count()
-    #             )
-    # dict_venue["upcoming_shows_count"] = upcoming_count
 
-    data = dict_venue
+@app.route('/venues/<int:venue_id>/matches')
+def venue_matches(venue_id):
+    # artists suggested to the venue, best first
+    return suggestions(Venue, venue_id, Artist, matches.artists_for_venue)
 
-    return render_template('pages/show_venue.html', venue=data)
+
+@app.route('/venues/<int:venue_id>')
+def show_venue(venue_id):
+    # to show the venue page with the given venue_id, with its past
+    # and upcoming shows (and its archived shows with ?archive=1)
+    archive = bool(request.args.get('archive'))
+    data = venue_detail(venue_id, archive)
+    if data is None:
+        abort(404)
+
+    return render_template('pages/show_venue.html', venue=data,
+                           archive=archive)
 
 
 # Create Venue
@@ -239,8 +980,7 @@ def create_venue_submission():
 
     form = VenueForm(request.form, meta={'csrf': False})
     if form.validate_on_submit():
-        error = False
-        try:
+        def add_venue(session):
             venue = Venue(
               name=form.name.data,
               city=form.city.data,
@@ -254,79 +994,88 @@ def create_venue_submission():
               seeking_talent=form.seeking_talent.data,
               seeking_description=form.seeking_description.data
               )
-            db.session.add(venue)
-            db.session.commit()
+            locate_venue(venue)
+            session.add(venue)
+            session.flush()
+            record_row(session, 'created', venue)
+            return venue.id
 
-        # on successful db insert, flash success
-            flash('Venue ' + request.form['name'] +
-                  ' was successfully listed!')
-
-        except():
-            db.session.rollback()
-            error = True
-            print(sys.exc_info())
-    # on unsuccessful db insert, an error is flashed
-    # e.g., flash('An error occurred. Venue '
-    # + data.name + ' could not be listed.')
-    # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
+        try:
+            venue_id = run_in_transaction(add_venue)
+        except SQLAlchemyError:
+            app.logger.exception('Venue could not be listed')
+            # on unsuccessful db insert, an error is flashed
             flash('An error occurred. Venue '
-                  + request.form['name']
+                  + form.name.data
                   + ' could not be listed.')
-
-        finally:
-            db.session.close()
-
-        if error:
             abort(400)
 
-    # on successful db insert, flash success
+        venue_names.add(venue_id, form.name.data)
+        update_matches(Venue, venue_id)
+        # on successful db insert, flash success
+        flash('Venue ' + form.name.data + ' was successfully listed!')
+        flash_duplicates('Venue', venue_duplicates, venue_id, form)
+
     else:
         flash('An error occurred. The creation input for Venue '
-              + request.form['name'] + ' were not all valid.')
+              + request.form.get('name', '') + ' were not all valid.')
 
     return render_template('pages/home.html')
 
 
-@app.route('/venues/<venue_id>', methods=['DELETE'])
+@app.route('/venues/<int:venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
-    # Endpoint taking a venue_id, and using
-    # SQLAlchemy ORM to delete a record.
+    # Endpoint taking a venue_id, and deleting the venue
+    # with its shows.
 
-    venue_to_delete = Venue.query.get(venue_id)
     try:
-        error = False
-        db.session.delete(venue_to_delete)
-        db.session.commit()
-    except():
-        db.session.rollback()
-        error = True
-        print(sys.exc_info())
-    finally:
-        db.session.close()
-    if error:
+        deleted = delete_rows(Venue, [venue_id])
+    except SQLAlchemyError:
+        app.logger.exception('Venue %s could not be deleted', venue_id)
         abort(400)
+    if not deleted:
+        abort(404)
+    venue_names.remove(venue_id)
+    venue_duplicates.remove(venue_id)
+    matches.remove_venue(venue_id)
+    calendar_cache.clear()
+
+    return jsonify({'success': True, 'deleted': [venue_id]})
+
 
-    # BONUS CHALLENGE: Implement a button to delete a Venue on a
-    # Venue Page, have it so that clicking that button delete it
-    # from the db then redirect the user to the homepage
-    return None
+@app.route('/venues', methods=['DELETE'])
+def delete_venues():
+    # bulk delete of the venues listed in the json body
+
+    ids = requested_ids()
+    try:
+        deleted = delete_rows(Venue, ids)
+    except SQLAlchemyError:
+        app.logger.exception('Venues %s could not be deleted', ids)
+        abort(400)
+    for venue_id in ids:
+        venue_names.remove(venue_id)
+        venue_duplicates.remove(venue_id)
+        matches.remove_venue(venue_id)
+    calendar_cache.clear()
+
+    return jsonify({'success': True, 'deleted_count': deleted})
 
 
 # Artists
 # ----------------------------------------------------------------
 @app.route('/artists')
 def artists():
-    # artist data returned from querying the database
-    artists = Artist.query.all()
-
-    data = []
-    for artist in artists:
-        data_dict = {}
-        data_dict["id"] = artist.id
-        data_dict["name"] = artist.name
-        data.append(data_dict)
+    # artist data returned from querying the database, streamed
+    # to the template
+    rows = (
+      db.session.query(Artist.id, Artist.name)
+      .order_by(Artist.id)
+      .yield_per(app.config['STREAM_BATCH_SIZE'])
+    )
+    data = (ArtistName._make(row) for row in rows)
 
-    return render_template('pages/artists.html', artists=data)
+    return stream_template('pages/artists.html', artists=data)
 
 
 @app.route('/artists/search', methods=['POST'])
@@ -337,126 +1086,82 @@ def search_artists():
     # "Matt Quevado", and "The Wild Sax Band".
     # search for "band" should return "The Wild Sax Band".
 
-    # get the value of the 'name' in the form input element:
+    # get the value of the 'name' in the form input element; the
+    # upcoming shows of each artist found are counted in one query
     search_term = request.form.get('search_term', '')
-    print("search_term *******************")
-    print(search_term)
-    found_artists = (
-      Artist.query.filter(Artist.name.ilike("%" + search_term + "%")).all()
-      )
-
-    response = {}
-    data_count = 0
-    data_list = []
-    for found_artist in found_artists:
-        data_count += 1
-        data_dict = {}
+    results = search_summaries(Artist, Show.artist_id, ArtistSummary,
+                               search_term)
 
-        data_dict["id"] = found_artist.id
-        data_dict["name"] = found_artist.name
-
-        num_upcoming_query = (
-          db.session.query(Show).join(Artist)
-          .filter(Show.start_time > datetime.now())
-          .all()
-        )
-        data_dict["num_upcoming_shows"] = len(num_upcoming_query)
+    return render_template(
+      'pages/search_artists.html',
+      results=results,
+      search_term=search_term
+      )
 
-        # Alternative code:
-        # num_upcoming = (
-        #   Show.query.filter(Show.start_time > datetime.now())
-        #             .filter(Show.artist_id == found_artist.id).count()
-        #   )
-        # data_dict["num_upcoming_shows"] = num_upcoming
 
-        data_list.append(data_dict)
+@app.route('/artists/autocomplete')
+def autocomplete_artists():
+    # artists whose name starts with the 'q' query parameter,
+    # for the artist picker of the show form
+    return autocomplete(artist_names)
 
-    response["count"] = data_count
-    response["data"] = data_list
 
-    return render_template(
-      'pages/search_artists.html',
-      results=response,
-      search_term=request.form.get('search_term', '')
-      )
+@app.route('/artists/<int:artist_id>/matches')
+def artist_matches(artist_id):
+    # venues suggested to the artist, best first
+    return suggestions(Artist, artist_id, Venue, matches.venues_for_artist)
 
 
 @app.route('/artists/<int:artist_id>')
 def show_artist(artist_id):
-    # shows the artist page with the given artist_id
-
-    artist_selected = Artist.query.filter(Artist.id == artist_id).all()
-    artist = artist_selected[0]
-
-    dict_data = {}
-    dict_data["id"] = artist.id
-    dict_data["name"] = artist.name
-    dict_data["genres"] = artist.genres
-    dict_data["city"] = artist.city
-    dict_data["state"] = artist.state
-    dict_data["phone"] = artist.phone
-    dict_data["website"] = artist.website_link
-    dict_data["facebook_link"] = artist.facebook_link
-    dict_data["seeking_venue"] = artist.seeking_venue
-    dict_data["seeking_description"] = artist.seeking_description
-    dict_data["image_link"] = artist.image_link
-
-    dict_data["past_shows"] = []
-    dict_data["upcoming_shows"] = []
-
-    artist_shows = Show.query.filter(Show.artist_id == artist.id).all()
-    for show in artist_shows:
-        dict_show = {}
-        dict_show["venue_id"] = show.venue_id
-        venue = Venue.query.filter(Venue.id == show.venue_id).all()
-        # query above returns a list of one element. Therefore extract
-        # the element before accessing attributes:
-        dict_show["venue_name"] = venue[0].name
-        dict_show["venue_image_link"] = venue[0].image_link
-        # date and time to be as a string as per filter function used later:
-        dict_show["start_time"] = show.start_time.strftime("%d/%m/%Y, %H:%M")
-
-        if show.start_time < datetime.now():
-            dict_data["past_shows"].append(dict_show)
-        else:
-            dict_data["upcoming_shows"].append(dict_show)
+    # shows the artist page with the given artist_id, with its past
+    # and upcoming shows (and its archived shows with ?archive=1)
+    archive = bool(request.args.get('archive'))
+    data = artist_detail(artist_id, archive)
+    if data is None:
+        abort(404)
 
-    past_count_query = (
-      db.session.query(Show).join(Artist)
-      .filter(Show.artist_id == artist_id)
-      .filter(Show.start_time < datetime.now())
-      .all()
-    )
+    return render_template('pages/show_artist.html', artist=data,
+                           archive=archive)
 
-    upcoming_count_query = (
-      db.session.query(Show).join(Artist)
-      .filter(Show.artist_id == artist_id)
-      .filter(Show.start_time > datetime.now())
-      .all()
-    )
 
-    dict_data["past_shows_count"] = len(past_count_query)
-    dict_data["upcoming_shows_count"] = len(upcoming_count_query)
+@app.route('/artists/<int:artist_id>', methods=['DELETE'])
+def delete_artist(artist_id):
+    # Endpoint taking an artist_id, and deleting the artist
+    # with its shows.
+
+    try:
+        deleted = delete_rows(Artist, [artist_id])
+    except SQLAlchemyError:
+        app.logger.exception('Artist %s could not be deleted', artist_id)
+        abort(400)
+    if not deleted:
+        abort(404)
+    artist_names.remove(artist_id)
+    artist_duplicates.remove(artist_id)
+    matches.remove_artist(artist_id)
+    calendar_cache.clear()
 
-    # alternative code:
-    # past_count = (
-    #   Show.query.filter(Show.artist_id == artist_id)
-    #             .filter(Show.start_time < datetime.now())
-    #             .distinct(Show.venue_id).count()
-    #   )
+    return jsonify({'success': True, 'deleted': [artist_id]})
 
-    # upcoming_count = (
-    #   Show.query.filter(Show.artist_id == artist_id)
-    #             .filter(Show.start_time > datetime.now())
-    #             .distinct(Show.venue_id).count()
-    #   )
 
-    # dict_data["past_shows_count"] = past_count
-    # dict_data["upcoming_shows_count"] = upcoming_count
+@app.route('/artists', methods=['DELETE'])
+def delete_artists():
+    # bulk delete of the artists listed in the json body
 
-    data = dict_data
+    ids = requested_ids()
+    try:
+        deleted = delete_rows(Artist, ids)
+    except SQLAlchemyError:
+        app.logger.exception('Artists %s could not be deleted', ids)
+        abort(400)
+    for artist_id in ids:
+        artist_names.remove(artist_id)
+        artist_duplicates.remove(artist_id)
+        matches.remove_artist(artist_id)
+    calendar_cache.clear()
 
-    return render_template('pages/show_artist.html', artist=data)
+    return jsonify({'success': True, 'deleted_count': deleted})
 
 
 # Update
@@ -480,8 +1185,7 @@ def edit_artist_submission(artist_id):
     form = ArtistForm(request.form, meta={'csrf': False})
 
     if form.validate_on_submit():
-        error = False
-        try:
+        def update_artist(session):
             artist.name = form.name.data
             artist.city = form.city.data
             artist.state = form.state.data
@@ -492,19 +1196,25 @@ def edit_artist_submission(artist_id):
             artist.website_link = form.website_link.data
             artist.seeking_venue = form.seeking_venue.data
             artist.seeking_description = form.seeking_description.data
-            db.session.commit()
-            flash('Artist ' + artist.name + ' was successfully edited!')
+            record_row(session, 'updated', artist)
 
-        except():
-            db.session.rollback()
-            error = True
-            print(sys.exc_info())
+        try:
+            run_in_transaction(update_artist)
+        except SQLAlchemyError:
+            app.logger.exception('Artist %s could not be edited', artist_id)
+            flash('An error occurred. Artist '
+                  + form.name.data + ' could not be edited.')
+            abort(400)
 
-        finally:
-            db.session.close()
+        artist_names.add(artist_id, form.name.data)
+        artist_duplicates.add(artist_id, form.name.data, form.city.data,
+                              form.state.data)
+        update_matches(Artist, artist_id)
+        flash('Artist ' + form.name.data + ' was successfully edited!')
 
-        if error:
-            abort(400)
+    else:
+        flash('An error occurred. The edit input for Artist '
+              + request.form.get('name', '') + ' were not all valid.')
 
     return redirect(url_for('show_artist', artist_id=artist_id))
 
@@ -528,8 +1238,7 @@ def edit_venue_submission(venue_id):
     form = VenueForm(request.form, meta={'csrf': False})
 
     if form.validate_on_submit():
-        error = False
-        try:
+        def update_venue(session):
             venue.name = form.name.data
             venue.city = form.city.data
             venue.state = form.state.data
@@ -541,19 +1250,26 @@ def edit_venue_submission(venue_id):
             venue.website_link = form.website_link.data
             venue.seeking_talent = form.seeking_talent.data
             venue.seeking_description = form.seeking_description.data
-            db.session.commit()
-            flash('Venue ' + venue.name + ' was successfully edited!')
+            locate_venue(venue)
+            record_row(session, 'updated', venue)
 
-        except():
-            db.session.rollback()
-            error = True
-            print(sys.exc_info())
+        try:
+            run_in_transaction(update_venue)
+        except SQLAlchemyError:
+            app.logger.exception('Venue %s could not be edited', venue_id)
+            flash('An error occurred. Venue '
+                  + form.name.data + ' could not be edited.')
+            abort(400)
 
-        finally:
-            db.session.close()
+        venue_names.add(venue_id, form.name.data)
+        venue_duplicates.add(venue_id, form.name.data, form.city.data,
+                             form.state.data)
+        update_matches(Venue, venue_id)
+        flash('Venue ' + form.name.data + ' was successfully edited!')
 
-        if error:
-            abort(400)
+    else:
+        flash('An error occurred. The edit input for Venue '
+              + request.form.get('name', '') + ' were not all valid.')
 
     return redirect(url_for('show_venue', venue_id=venue_id))
 
@@ -569,12 +1285,11 @@ def create_artist_form():
 @app.route('/artists/create', methods=['POST'])
 def create_artist_submission():
     # called upon submitting the new artist listing form
-    # form data inserted as a new Venue record in the db
+    # form data inserted as a new Artist record in the db
 
     form = ArtistForm(request.form, meta={'csrf': False})
     if form.validate_on_submit():
-        error = False
-        try:
+        def add_artist(session):
             artist = Artist(
               name=form.name.data,
               city=form.city.data,
@@ -586,34 +1301,30 @@ def create_artist_submission():
               website_link=form.website_link.data,
               seeking_venue=form.seeking_venue.data,
               seeking_description=form.seeking_description.data)
-            print("in try")
-            db.session.add(artist)
-            db.session.commit()
-
-    # on successful db insert, flash success
-            flash('Artist ' + request.form['name']
-                  + ' was successfully listed!')
-
-        except():
-            print("in except")
-            db.session.rollback()
-            error = True
-            print(sys.exc_info())
-    # on unsuccessful db insert, error is flashed
+            session.add(artist)
+            session.flush()
+            record_row(session, 'created', artist)
+            return artist.id
+
+        try:
+            artist_id = run_in_transaction(add_artist)
+        except SQLAlchemyError:
+            app.logger.exception('Artist could not be listed')
+            # on unsuccessful db insert, error is flashed
             flash('An error occurred. Artist '
-                  + request.form['name']
+                  + form.name.data
                   + ' could not be listed.')
-
-        finally:
-            db.session.close()
-
-        if error:
             abort(400)
 
-    # on successful db insert, flash success
+        artist_names.add(artist_id, form.name.data)
+        update_matches(Artist, artist_id)
+        # on successful db insert, flash success
+        flash('Artist ' + form.name.data + ' was successfully listed!')
+        flash_duplicates('Artist', artist_duplicates, artist_id, form)
+
     else:
         flash('An error occurred. The creation input for Artist '
-              + request.form['name'] + ' were not all valid.')
+              + request.form.get('name', '') + ' were not all valid.')
 
     return render_template('pages/home.html')
 
@@ -622,33 +1333,75 @@ def create_artist_submission():
 # ----------------------------------------------------------------
 @app.route('/shows')
 def shows():
-    # displays list of shows at /shows
-    # venues data ffrom database.
-    # num_shows should be aggregated based
-    # on number of upcoming shows per venue.
-
-    shows = Show.query.all()
-
-    data_list = []
-    for show in shows:
-        data_dict = {}
-        data_dict["venue_id"] = show.venue_id
-        data_dict["venue_name"] = (
-          Venue.query.filter(Venue.id == show.venue_id)[0].name
-          )
-        data_dict["artist_id"] = show.artist_id
-        data_dict["artist_name"] = (
-          Artist.query.filter(Artist.id == show.artist_id)[0].name
-          )
-        data_dict["artist_image_link"] = (
-          Artist.query.filter(Artist.id == show.artist_id)[0].image_link
-          )
-        data_dict["start_time"] = (
-          show.start_time.strftime("%d/%m/%Y, %H:%M")
-          )
-        data_list.append(data_dict)
-
-    return render_template('pages/shows.html', shows=data_list)
+    # displays list of shows at /shows.
+    # shows are read in one joined query, in batches, and rendered
+    # while they are read: memory use does not grow with the number
+    # of shows
+    rows = (
+      tile_query()
+      .order_by(Show.id)
+      .yield_per(app.config['STREAM_BATCH_SIZE'])
+    )
+    show_tiles = (show_tile(row) for row in rows)
+
+    return stream_template('pages/shows.html', shows=show_tiles)
+
+
+@app.route('/shows/nearby')
+def nearby_shows():
+    # upcoming shows at venues within 'km' of a point or of a city,
+    # soonest first
+    latitude, longitude, radius = nearby_request()
+    rows = within(
+      db.session.query(Show.id, Show.start_time, Venue.id, Venue.name,
+                       Venue.latitude, Venue.longitude, Artist.id,
+                       Artist.name)
+      .join(Venue, Venue.id == Show.venue_id)
+      .join(Artist, Artist.id == Show.artist_id)
+      .filter(Show.start_time > datetime.now()),
+      latitude, longitude, radius).order_by(Show.start_time)
+
+    data = []
+    for (show_id, start_time, venue_id, venue_name, venue_lat, venue_lon,
+         artist_id, artist_name) in rows:
+        distance = distance_km(latitude, longitude, venue_lat, venue_lon)
+        if distance <= radius:
+            data.append({'id': show_id,
+                         'start_time': start_time.isoformat(),
+                         'venue_id': venue_id, 'venue_name': venue_name,
+                         'artist_id': artist_id, 'artist_name': artist_name,
+                         'distance_km': round(distance, 2)})
+
+    return jsonify({'count': len(data), 'data': data})
+
+
+@app.route('/shows/calendar')
+def shows_calendar():
+    # shows of a date window, grouped by day or week
+    bucket, starts, filters = calendar_request()
+    return render_template(
+      'pages/calendar.html',
+      buckets=calendar_buckets(bucket, starts, filters),
+      bucket=bucket,
+      start=starts[0],
+      end=starts[-1] + timedelta(days=7 if bucket == 'week' else 1),
+      filters=filters)
+
+
+@app.route('/shows/calendar.json')
+def shows_calendar_json():
+    bucket, starts, filters = calendar_request()
+    return jsonify({'bucket': bucket,
+                    'buckets': calendar_buckets(bucket, starts, filters)})
+
+
+@app.route('/shows/calendar.ics')
+def shows_calendar_ics():
+    bucket, starts, filters = calendar_request()
+    shows = [show
+             for day in calendar_buckets(bucket, starts, filters)
+             for show in day['shows']]
+    return Response(ical(shows, request.host), mimetype='text/calendar')
 
 
 @app.route('/shows/create')
@@ -661,45 +1414,148 @@ def create_shows():
 @app.route('/shows/create', methods=['POST'])
 def create_show_submission():
     # called to create new shows in the db, upon
-    # submitting new show listing form
+    # submitting new show listing form. Several shows can be
+    # submitted at once; they are listed together or not at all
+
+    forms = show_forms(request.form)
+    if forms and all(form.validate() for form in forms):
+        def add_shows(session):
+            new_shows = [
+              Show(
+                venue_id=form.venue_id.data,
+                artist_id=form.artist_id.data,
+                start_time=form.start_time.data,
+                duration=form.duration.data)
+              for form in forms]
+            check_schedule(session, new_shows)
+            session.add_all(new_shows)
+            # in the change feed, and counted in the stats by a job
+            # queued with the shows
+            session.flush()
+            for show in new_shows:
+                record_row(session, 'created', show)
+            enqueue(session, 'count_shows',
+                    {'show_ids': [show.id for show in new_shows]})
 
-    form = ShowForm(request.form, meta={'csrf': False})
-    if form.validate_on_submit():
-        error = False
         try:
-            show = Show(
-              venue_id=form.venue_id.data,
-              artist_id=form.artist_id.data,
-              start_time=form.start_time.data)
-            db.session.add(show)
-            db.session.commit()
-
-    # on successful db insert, flash success
-            flash('Show was successfully listed!')
-
-        except():
-            db.session.rollback()
-            error = True
-            print(sys.exc_info())
-    # on unsuccessful db insert, error is flashed
+            run_in_transaction(add_shows)
+        except ScheduleConflict as conflict:
+            flash('Show could not be listed. ' + str(conflict))
+            abort(400)
+        except SQLAlchemyError as error:
+            if is_conflict_error(error):
+                flash('Show could not be listed. The venue or the artist '
+                      'is already booked at that time.')
+                abort(400)
+            app.logger.exception('Shows could not be listed')
+            # on unsuccessful db insert, error is flashed
             flash('An error occurred. Show could not be listed.')
-
-        finally:
-            db.session.close()
-
-        if error:
             abort(400)
 
-    # on successful db insert, flash success
+        calendar_cache.clear()
+        for form in forms:
+            matches.add_show(form.artist_id.data, form.venue_id.data)
+        # on successful db insert, flash success
+        if len(forms) == 1:
+            flash('Show was successfully listed!')
+        else:
+            flash('%d shows were successfully listed!' % len(forms))
+
     else:
         flash('An error occurred. The creation inputs were not all valid.')
+        for form in forms:
+            for errors in form.errors.values():
+                for error in errors:
+                    flash(error)
 
     return render_template('pages/home.html')
 
 
+# Stats
+# ----------------------------------------------------------------
+def stats_data():
+    config = app.config
+    return read_stats(db.session, date.today(), config['STATS_TOP'],
+                      config['STATS_WEEKS'], config['STATS_WEEKS_AHEAD'],
+                      config['STATS_MONTHS'])
+
+
+@app.route('/stats')
+def stats():
+    # busiest venues and artists, shows per city and genre trends, read
+    # from the rollups only
+    return render_template('pages/stats.html', stats=stats_data())
+
+
+@app.route('/stats.json')
+def stats_json():
+    return jsonify(stats_data())
+
+
+# Changes
+# ----------------------------------------------------------------
+@app.route('/changes')
+def changes():
+    # changes to venues, artists and shows after the position ``since``,
+    # in commit order; ``next`` is the ``since`` of the following request
+    since = request.args.get('since', 0, type=int)
+    limit = min(max(request.args.get('limit', 100, type=int), 1),
+                app.config['CHANGES_MAX_RESULTS'])
+    if is_expired(db.session, since):
+        response = jsonify({'success': False, 'error': 410,
+                            'message': 'Changes after %d were purged, '
+                                       'read everything again.' % since})
+        response.status_code = 410
+        return response
+    rows = [change_dict(change)
+            for change in read_changes(db.session, since, limit)]
+    return jsonify({'changes': rows,
+                    'next': rows[-1]['position'] if rows else since,
+                    'more': len(rows) == limit})
+
+
+# Images
+# ----------------------------------------------------------------
+@app.route('/images/<size>')
+def image_thumbnail(size):
+    # thumbnail of the image at ?url=, fetched once and then served
+    # from the disk cache. The url is the one of the content, so it is
+    # cached for good by browsers and proxies
+    url = request.args.get('url', '')
+    signature = sign(image_key, url, size)
+    if (size not in app.config['IMAGE_SIZES']
+            or not hmac.compare_digest(request.args.get('sig', ''),
+                                       signature)):
+        abort(404)
+    if failed_images.get(signature):
+        abort(502)
+    try:
+        digest, path = image_cache.get(url, size)
+        with open(path, 'rb') as image_file:
+            data = image_file.read()
+    except (OSError, ValueError):
+        app.logger.warning('Image %s could not be fetched', url,
+                           exc_info=True)
+        failed_images.set(signature, True)
+        abort(502)
+
+    response = Response(data, mimetype=content_type(data))
+    response.set_etag(digest)
+    response.headers['Cache-Control'] = (
+      'public, max-age=%d, immutable' % app.config['IMAGE_MAX_AGE'])
+    return response.make_conditional(request)
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    # metrics of all the worker processes, in the Prometheus text format
+    return Response(metrics.exposition(),
+                    mimetype='text/plain; version=0.0.4')
+
+
 @app.errorhandler(400)
 def bad_request_error(error):
-    return render_template('errors/400.html'), 404
+    return render_template('errors/400.html'), 400
 
 
 @app.errorhandler(401)
@@ -717,22 +1573,15 @@ def server_error(error):
     return render_template('errors/500.html'), 500
 
 
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter(
-          '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
-          )
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
-
-
 # ----------------------------------------------------------------------------#
 # Launch.
 # ----------------------------------------------------------------------------#
+if app.config['WARMUP_ON_START']:
+    for step, seconds, detail in warm_up(app, app.config['WARMUP_URLS'],
+                                         WARMUP_INDEXES):
+        app.logger.info('warm-up %s: %.1f ms (%s)', step, seconds * 1000,
+                        detail)
+
 # Default port:
 if __name__ == '__main__':
     app.run()
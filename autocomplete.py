@@ -0,0 +1,97 @@
+#----------------------------------------------------------------------------#
+# Imports.
+#----------------------------------------------------------------------------#
+import time
+from bisect import bisect_left, insort
+from threading import Lock
+
+
+#----------------------------------------------------------------------------#
+# Prefix index.
+#----------------------------------------------------------------------------#
+def normalize(text):
+    return ' '.join(text.lower().split())
+
+
+class PrefixIndex(object):
+    """In-memory index of names answering prefix queries.
+
+    Every word of a name starts a key, so "hop" and "musical" both
+    find "The Musical Hop". Keys are kept in a sorted list: a lookup is
+    a binary search followed by a scan of the matching keys only.
+
+    The index lives in the worker process: it is filled by ``warm`` and
+    kept up to date by the routes writing names (``add``/``remove``).
+    ``built_at`` is the time.monotonic() of the last ``warm``.
+    """
+
+    def __init__(self):
+        self._keys = []
+        self._names = {}
+        self.built_at = None
+        self._lock = Lock()
+
+    @staticmethod
+    def _keys_of(record_id, name):
+        words = normalize(name).split(' ')
+        return [(' '.join(words[i:]), record_id) for i in range(len(words))]
+
+    def warm(self, rows):
+        # rows: iterable of (id, name)
+        keys = []
+        names = {}
+        for record_id, name in rows:
+            names[record_id] = name
+            keys.extend(self._keys_of(record_id, name))
+        keys.sort()
+        with self._lock:
+            self._keys = keys
+            self._names = names
+            self.built_at = time.monotonic()
+
+    def add(self, record_id, name):
+        # also used when a name changes
+        with self._lock:
+            self._discard(record_id)
+            self._names[record_id] = name
+            for key in self._keys_of(record_id, name):
+                insort(self._keys, key)
+
+    def remove(self, record_id):
+        with self._lock:
+            self._discard(record_id)
+
+    def _discard(self, record_id):
+        name = self._names.pop(record_id, None)
+        if name is None:
+            return
+        for key in self._keys_of(record_id, name):
+            i = bisect_left(self._keys, key)
+            if i < len(self._keys) and self._keys[i] == key:
+                del self._keys[i]
+
+    def search(self, prefix, limit=10):
+        """Return up to ``limit`` (id, name) pairs matching ``prefix``."""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        results = []
+        seen = set()
+        # under the lock: ``add`` and ``remove`` shift the keys in place,
+        # and the scan stops at ``limit`` names
+        with self._lock:
+            keys = self._keys
+            i = bisect_left(keys, (prefix,))
+            while i < len(keys) and len(results) < limit:
+                key, record_id = keys[i]
+                if not key.startswith(prefix):
+                    break
+                name = self._names.get(record_id)
+                if record_id not in seen and name is not None:
+                    seen.add(record_id)
+                    results.append((record_id, name))
+                i += 1
+        return results
+
+    def __len__(self):
+        return len(self._names)
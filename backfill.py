@@ -0,0 +1,186 @@
+#----------------------------------------------------------------------------#
+# Imports.
+#----------------------------------------------------------------------------#
+import time
+from datetime import datetime
+
+from sqlalchemy import text
+
+from models import BackfillState, array_literal, parse_array
+
+
+#----------------------------------------------------------------------------#
+# Backfills.
+#----------------------------------------------------------------------------#
+# A backfill rewrites the rows of a table batch by batch, each batch in
+# its own short transaction, so that the table stays usable while it
+# runs. Batches are ranges of the key, found with the key index (keyset
+# pagination: no OFFSET). After each batch the last key done is saved in
+# the "Backfill" table, and an interrupted backfill goes on from there.
+#
+# A batch function must be idempotent: when a migration runs a backfill
+# in autocommit mode, a crash between a batch and its checkpoint runs the
+# batch again.
+BACKFILLS = {}
+
+
+def backfill(name, table, key='id'):
+    """Register ``function(connection, lower, upper)`` as the backfill
+    ``name`` of ``table``; it updates the rows with ``lower < key <=
+    upper`` and returns the number of rows changed."""
+    def register(function):
+        BACKFILLS[name] = {'table': table, 'key': key, 'function': function}
+        return function
+    return register
+
+
+def estimate_rows(connection, table, key, after):
+    # the planner statistics on postgres (counting a big table takes
+    # long), a count elsewhere
+    if connection.dialect.name == 'postgresql' and after == 0:
+        estimate = connection.execute(text(
+            'SELECT reltuples FROM pg_class WHERE relname = :table'),
+            {'table': table}).scalar()
+        if estimate and estimate > 0:
+            return int(estimate)
+    return connection.execute(text(
+        'SELECT count(*) FROM "%s" WHERE "%s" > :after' % (table, key)),
+        {'after': after}).scalar()
+
+
+def load_state(connection, name, restart):
+    # (last key done, rows done), or None for a backfill already done
+    states = BackfillState.__table__
+    state = connection.execute(
+        states.select().where(states.c.name == name)).first()
+    now = datetime.utcnow()
+    if state is None:
+        connection.execute(states.insert().values(
+            name=name, last_key=0, rows_done=0, status='running',
+            started_at=now, updated_at=now))
+    elif restart:
+        connection.execute(states.update().where(states.c.name == name)
+                           .values(last_key=0, rows_done=0,
+                                   status='running', started_at=now,
+                                   updated_at=now, finished_at=None))
+    elif state.status == 'done':
+        return None
+    else:
+        return state.last_key, state.rows_done
+    return 0, 0
+
+
+def run(connection, name, batch_size=1000, pause=0.0, max_batch_seconds=1.0,
+        restart=False, progress=None):
+    """Run the backfill ``name`` on ``connection`` until done.
+
+    Batches taking more than ``max_batch_seconds`` are halved, faster
+    ones doubled (up to ``batch_size``); ``pause`` seconds are left
+    between batches for the other transactions. ``progress`` is called
+    with a dict after each batch. A backfill already done is not run
+    again, unless ``restart`` (which also starts over an interrupted one).
+    Returns the number of rows done.
+    """
+    spec = BACKFILLS[name]
+    table, key = spec['table'], spec['key']
+    states = BackfillState.__table__
+    with connection.begin():
+        state = load_state(connection, name, restart)
+        if state is None:
+            return 0
+        last_key, rows_done = state
+        total = rows_done + estimate_rows(connection, table, key, last_key)
+
+    size = batch_size
+    started = time.monotonic()
+    rows_seen = 0
+    while True:
+        batch_start = time.monotonic()
+        with connection.begin():
+            upper, count = connection.execute(text(
+                'SELECT max(k), count(*) FROM (SELECT "%s" AS k FROM "%s" '
+                'WHERE "%s" > :last ORDER BY "%s" LIMIT :size) batch'
+                % (key, table, key, key)),
+                {'last': last_key, 'size': size}).first()
+            if upper is None:
+                connection.execute(
+                    states.update().where(states.c.name == name)
+                    .values(status='done', updated_at=datetime.utcnow(),
+                            finished_at=datetime.utcnow()))
+                break
+            changed = spec['function'](connection, last_key, upper)
+            rows_done += count
+            rows_seen += count
+            last_key = upper
+            connection.execute(
+                states.update().where(states.c.name == name)
+                .values(last_key=last_key, rows_done=rows_done,
+                        updated_at=datetime.utcnow()))
+
+        elapsed = time.monotonic() - batch_start
+        if elapsed > max_batch_seconds:
+            size = max(1, size // 2)
+        elif elapsed < max_batch_seconds / 4:
+            size = min(batch_size, size * 2)
+        if progress is not None:
+            rate = rows_seen / max(time.monotonic() - started, 1e-6)
+            progress({'name': name, 'rows_done': rows_done,
+                      'total': max(total, rows_done), 'changed': changed,
+                      'last_key': last_key, 'rows_per_second': rate,
+                      'eta_seconds': max(total - rows_done, 0) / rate
+                      if rate else None})
+        if pause:
+            time.sleep(pause)
+    return rows_done
+
+
+def run_in_migration(op, name, **options):
+    """Run a backfill from an Alembic revision, outside of the migration
+    transaction (which is committed first), one batch at a time."""
+    options.setdefault('progress', lambda state: print(format_progress(state)))
+    with op.get_context().autocommit_block():
+        return run(op.get_bind(), name, **options)
+
+
+def format_progress(state):
+    eta = state['eta_seconds']
+    return ('%s: %d/%d rows (%.1f%%), %d rows/s, %s left' % (
+        state['name'], state['rows_done'], state['total'],
+        100.0 * state['rows_done'] / (state['total'] or 1),
+        state['rows_per_second'],
+        '%ds' % eta if eta is not None else '?'))
+
+
+#----------------------------------------------------------------------------#
+# Genres.
+#----------------------------------------------------------------------------#
+def normalize_genres(value):
+    # the genres text as the Genres column type writes it: a postgres
+    # array of trimmed genres, without duplicates
+    genres = []
+    for genre in parse_array(value):
+        genre = genre.strip()
+        if genre and genre not in genres:
+            genres.append(genre)
+    return array_literal(genres)
+
+
+def genres_backfill(table):
+    def normalize(connection, lower, upper):
+        rows = connection.execute(text(
+            'SELECT id, genres FROM "%s" WHERE id > :lower AND id <= :upper'
+            % table), {'lower': lower, 'upper': upper}).fetchall()
+        changes = [{'row_id': row_id, 'genres': normalize_genres(genres)}
+                   for row_id, genres in rows
+                   if genres is not None
+                   and normalize_genres(genres) != genres]
+        if changes:
+            connection.execute(text(
+                'UPDATE "%s" SET genres = :genres WHERE id = :row_id'
+                % table), changes)
+        return len(changes)
+    return normalize
+
+
+backfill('venue_genres', 'Venue')(genres_backfill('Venue'))
+backfill('artist_genres', 'Artist')(genres_backfill('Artist'))
@@ -0,0 +1,102 @@
+#----------------------------------------------------------------------------#
+# Autocomplete benchmark.
+#----------------------------------------------------------------------------#
+# Warms a PrefixIndex (see autocomplete.py) with generated names, then
+# times search() on prefixes of their words and prints the p50, p90 and
+# p99 latencies. With --writes-per-second, a thread adds and removes
+# names meanwhile, as the write routes do, so the searches also wait for
+# the index lock. Exits with status 1 when p99 is above --target-ms.
+#
+#   python bench_autocomplete.py --names 1000000 --searches 100000
+import argparse
+import random
+import sys
+import threading
+import time
+
+from autocomplete import PrefixIndex
+
+WORDS = ('the', 'musical', 'hop', 'dueling', 'pianos', 'bar', 'park',
+         'square', 'live', 'music', 'coffee', 'guns', 'petals', 'matt',
+         'quevedo', 'wild', 'sax', 'band', 'blue', 'note', 'hall', 'club',
+         'jazz', 'room', 'river', 'stone', 'velvet', 'echo', 'lounge',
+         'garden', 'city', 'north', 'south', 'black', 'gold', 'silver')
+
+
+def make_name(rng, number):
+    # two to four words and a number, so that names are distinct
+    words = rng.sample(WORDS, rng.randint(2, 4))
+    return '%s %d' % (' '.join(word.title() for word in words), number)
+
+
+def make_prefix(rng):
+    word = rng.choice(WORDS)
+    return word[:rng.randint(1, len(word))]
+
+
+def percentile(ordered, share):
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))]
+
+
+def writer(index, rng, first_id, writes_per_second, stop):
+    # adds a name, then removes it, at the given rate
+    record_id = first_id
+    while not stop.is_set():
+        index.add(record_id, make_name(rng, record_id))
+        index.remove(record_id)
+        record_id += 1
+        time.sleep(2.0 / writes_per_second)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Time PrefixIndex.search() on many names.')
+    parser.add_argument('--names', type=int, default=1000000,
+                        help='Number of names to warm the index with.')
+    parser.add_argument('--searches', type=int, default=100000,
+                        help='Number of searches to time.')
+    parser.add_argument('--limit', type=int, default=10,
+                        help='Results per search.')
+    parser.add_argument('--writes-per-second', type=float, default=0,
+                        help='Adds and removes made during the searches.')
+    parser.add_argument('--target-ms', type=float, default=5.0,
+                        help='Largest p99 accepted, in milliseconds.')
+    parser.add_argument('--random-seed', type=int, default=0)
+    options = parser.parse_args(argv)
+
+    rng = random.Random(options.random_seed)
+    started = time.perf_counter()
+    rows = [(number, make_name(rng, number))
+            for number in range(1, options.names + 1)]
+    index = PrefixIndex()
+    index.warm(rows)
+    del rows
+    print('Warmed %d names in %.1fs'
+          % (len(index), time.perf_counter() - started))
+
+    stop = threading.Event()
+    if options.writes_per_second:
+        threading.Thread(target=writer, daemon=True, args=(
+            index, random.Random(options.random_seed + 1),
+            options.names + 1, options.writes_per_second, stop)).start()
+
+    prefixes = [make_prefix(rng) for _ in range(options.searches)]
+    latencies = []
+    for prefix in prefixes:
+        started = time.perf_counter()
+        index.search(prefix, options.limit)
+        latencies.append(time.perf_counter() - started)
+    stop.set()
+
+    latencies.sort()
+    p99 = percentile(latencies, 0.99) * 1000
+    print('%d searches: p50 %.3f ms, p90 %.3f ms, p99 %.3f ms, max %.3f ms'
+          % (len(latencies), percentile(latencies, 0.50) * 1000,
+             percentile(latencies, 0.90) * 1000, p99, latencies[-1] * 1000))
+    if p99 > options.target_ms:
+        print('p99 above the target of %.1f ms' % options.target_ms)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
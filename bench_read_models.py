@@ -0,0 +1,134 @@
+#----------------------------------------------------------------------------#
+# Read models benchmark.
+#----------------------------------------------------------------------------#
+# Compares the namedtuple read models of read_models.py with the dicts
+# the pages were built from before, on the rows of the shows() and
+# venues() queries of a seeded sqlite database. The rows are read once;
+# for each page and each kind of row, prints the time to build them all
+# (best of --repeat, by timeit) and the memory they hold once built (by
+# tracemalloc).
+#
+#   python bench_read_models.py --shows 100000 --venues 2000
+import argparse
+import os
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+from itertools import groupby
+
+from bench_streaming import seed
+
+
+def show_dict(row):
+    # a show tile as shows() built it before the read models
+    (show_id, venue_id, venue_name, venue_image_link, artist_id,
+     artist_name, artist_image_link, start_time) = row
+    data_dict = {}
+    data_dict["id"] = show_id
+    data_dict["venue_id"] = venue_id
+    data_dict["venue_name"] = venue_name
+    data_dict["venue_image_link"] = venue_image_link
+    data_dict["artist_id"] = artist_id
+    data_dict["artist_name"] = artist_name
+    data_dict["artist_image_link"] = artist_image_link
+    data_dict["start_time"] = start_time.strftime("%d/%m/%Y, %H:%M")
+    data_dict["version"] = hash((
+        venue_id, venue_name, venue_image_link, artist_id, artist_name,
+        artist_image_link, data_dict["start_time"]))
+    return data_dict
+
+
+def area_dicts(rows):
+    return [{'city': city, 'state': state,
+             'venues': [{'id': venue_id, 'name': name,
+                         'num_upcoming_shows': num_upcoming}
+                        for _, _, venue_id, name, num_upcoming in place]}
+            for (city, state), place
+            in groupby(rows, key=lambda row: (row[0], row[1]))]
+
+
+def area_tuples(rows):
+    # the app (read_models imports it) is loaded once DATABASE_URL is set
+    from read_models import Area, VenueSummary
+    return [Area(city, state, [VenueSummary._make(row[2:]) for row in place])
+            for (city, state), place
+            in groupby(rows, key=lambda row: (row[0], row[1]))]
+
+
+def held_bytes(build):
+    # memory still allocated once ``build()`` has returned
+    tracemalloc.start()
+    built = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del built
+    return size
+
+
+def compare(label, count, builders, repeat):
+    for kind, build in builders:
+        seconds = min(timeit.repeat(build, number=1, repeat=repeat))
+        size = held_bytes(build)
+        print('%-7s %-10s %8d %10.1f %10.2f %10.1f %8.0f' % (
+            label, kind, count, seconds * 1000, seconds * 1e6 / count,
+            size / 1024.0 / 1024.0, size / float(count)))
+        sys.stdout.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Compare namedtuple read models with dicts.')
+    parser.add_argument('--database', default='sqlite:///' + os.path.join(
+        tempfile.gettempdir(), 'fyyur-bench.db'), help='A sqlite url.')
+    parser.add_argument('--shows', type=int, default=100000,
+                        help='Number of shows to seed.')
+    parser.add_argument('--venues', type=int, default=2000)
+    parser.add_argument('--artists', type=int, default=2000)
+    parser.add_argument('--no-seed', action='store_true',
+                        help='Use the database as it is.')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Timed builds of each kind; the best is kept.')
+    options = parser.parse_args(argv)
+
+    if not options.no_seed:
+        started = time.perf_counter()
+        seed(options)
+        print('Seeded %d shows in %.1fs'
+              % (options.shows, time.perf_counter() - started))
+
+    os.environ['DATABASE_URL'] = options.database
+    os.environ.setdefault('FYYUR_SECRET_KEY', 'fyyur-bench')
+    os.environ.setdefault('FYYUR_LOG_FILE', os.path.join(
+        tempfile.gettempdir(), 'fyyur-bench.log'))
+    import app as fyyur
+    from models import Show, Venue, db
+    from read_models import show_tile, tile_query, upcoming_counts
+
+    with fyyur.app.app_context():
+        show_rows = tile_query().order_by(Show.id).all()
+        upcoming = upcoming_counts(Show.venue_id)
+        venue_rows = (
+          db.session.query(Venue.city, Venue.state, Venue.id, Venue.name,
+                           db.func.coalesce(upcoming.c.num, 0))
+          .outerjoin(upcoming, upcoming.c.owner_id == Venue.id)
+          .order_by(Venue.state, Venue.city, Venue.id)
+          .all()
+        )
+
+    print('%-7s %-10s %8s %10s %10s %10s %8s' % (
+        'page', 'rows', 'count', 'build ms', 'us/row', 'held MB',
+        'B/row'))
+    compare('shows', len(show_rows), [
+        ('dict', lambda: [show_dict(row) for row in show_rows]),
+        ('namedtuple', lambda: [show_tile(row) for row in show_rows]),
+    ], options.repeat)
+    compare('venues', len(venue_rows), [
+        ('dict', lambda: area_dicts(venue_rows)),
+        ('namedtuple', lambda: area_tuples(venue_rows)),
+    ], options.repeat)
+
+
+if __name__ == '__main__':
+    main()
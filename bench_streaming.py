@@ -0,0 +1,131 @@
+#----------------------------------------------------------------------------#
+# Streaming benchmark.
+#----------------------------------------------------------------------------#
+# Renders the /shows page of a sqlite database seeded with many shows,
+# twice: buffered (all the shows read, then the whole page rendered, as
+# render_template did) and streamed (the shows() view, rendered while the
+# rows are read). For each, prints the time to the first byte, the time
+# to the last byte, the peak of the memory traced by tracemalloc and the
+# peak resident set size. Each measure runs in a process of its own, so
+# that the peaks are not shared; tracemalloc slows rendering down, so
+# the times are taken in a run without it.
+#
+#   python bench_streaming.py --shows 100000
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+MODES = ('buffered', 'streamed')
+
+
+def measure(mode, trace):
+    # in the child process: DATABASE_URL is set before the app is loaded
+    sys.path.insert(0, HERE)
+    from flask import render_template
+
+    import app as fyyur
+    from models import Show
+    from read_models import show_tile, tile_query
+
+    with fyyur.app.test_request_context('/shows'):
+        if trace:
+            tracemalloc.start()
+        started = time.perf_counter()
+        if mode == 'buffered':
+            shows = [show_tile(row)
+                     for row in tile_query().order_by(Show.id).all()]
+            chunks = iter([render_template('pages/shows.html',
+                                           shows=shows).encode()])
+        else:
+            chunks = fyyur.shows().iter_encoded()
+        size = len(next(chunks))
+        first_byte = time.perf_counter() - started
+        for chunk in chunks:
+            size += len(chunk)
+        last_byte = time.perf_counter() - started
+        traced = tracemalloc.get_traced_memory()[1] if trace else None
+    # kilobytes on linux
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return {'mode': mode, 'bytes': size, 'first_byte': first_byte,
+            'last_byte': last_byte, 'traced': traced, 'rss': rss}
+
+
+def run_child(options, mode, trace):
+    command = [sys.executable, os.path.abspath(__file__), '--measure', mode]
+    if trace:
+        command.append('--trace')
+    output = subprocess.run(command, env=child_env(options), check=True,
+                            stdout=subprocess.PIPE).stdout
+    return json.loads(output.decode().splitlines()[-1])
+
+
+def child_env(options):
+    # a fixed secret key: the app does not start without one
+    env = dict(os.environ, DATABASE_URL=options.database, FLASK_APP='app.py',
+               FYYUR_LOG_FILE=os.path.join(tempfile.gettempdir(),
+                                           'fyyur-bench.log'))
+    env.setdefault('FYYUR_SECRET_KEY', 'fyyur-bench')
+    return env
+
+
+def seed(options):
+    env = child_env(options)
+    for command in (['init-db', '--drop'],
+                    ['seed', '--venues', str(options.venues),
+                     '--artists', str(options.artists),
+                     '--shows', str(options.shows)]):
+        subprocess.run([sys.executable, '-m', 'flask'] + command, env=env,
+                       cwd=HERE, check=True, stdout=subprocess.DEVNULL)
+
+
+def megabytes(size):
+    return '%10.1f' % (size / 1024.0 / 1024.0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Compare the buffered and streamed /shows page.')
+    parser.add_argument('--database', default='sqlite:///' + os.path.join(
+        tempfile.gettempdir(), 'fyyur-bench.db'), help='A sqlite url.')
+    parser.add_argument('--shows', type=int, default=100000,
+                        help='Number of shows to seed.')
+    parser.add_argument('--venues', type=int, default=100)
+    parser.add_argument('--artists', type=int, default=200)
+    parser.add_argument('--no-seed', action='store_true',
+                        help='Use the database as it is.')
+    parser.add_argument('--measure', choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument('--trace', action='store_true',
+                        help=argparse.SUPPRESS)
+    options = parser.parse_args(argv)
+
+    if options.measure:
+        print(json.dumps(measure(options.measure, options.trace)))
+        return
+
+    if not options.no_seed:
+        started = time.perf_counter()
+        seed(options)
+        print('Seeded %d shows in %.1fs'
+              % (options.shows, time.perf_counter() - started))
+    print('%-9s %10s %12s %12s %10s %10s' % (
+        'mode', 'MB sent', 'first byte', 'last byte', 'traced MB',
+        'rss MB'))
+    for mode in MODES:
+        timed = run_child(options, mode, trace=False)
+        traced = run_child(options, mode, trace=True)
+        print('%-9s %s %10.3fs %10.3fs %s %s' % (
+            mode, megabytes(timed['bytes']), timed['first_byte'],
+            timed['last_byte'], megabytes(traced['traced']),
+            megabytes(timed['rss'])))
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
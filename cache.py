@@ -0,0 +1,102 @@
+#----------------------------------------------------------------------------#
+# Imports.
+#----------------------------------------------------------------------------#
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+
+
+#----------------------------------------------------------------------------#
+# In-memory LRU cache.
+#----------------------------------------------------------------------------#
+class LRUCache(object):
+    """Small thread-safe LRU cache with an optional per-entry timeout.
+
+    Entries live in the memory of the current worker process only, so
+    each worker warms its own copy.
+    """
+
+    def __init__(self, maxsize=10000, default_timeout=None):
+        self.maxsize = maxsize
+        self.default_timeout = default_timeout
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires = entry
+            if expires is not None and expires < time.time():
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, timeout=None):
+        if timeout is None:
+            timeout = self.default_timeout
+        expires = time.time() + timeout if timeout else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+#----------------------------------------------------------------------------#
+# Jinja fragment cache.
+#----------------------------------------------------------------------------#
+class FragmentCacheExtension(Extension):
+    """Adds a ``{% cache key, ... %}...{% endcache %}`` tag to Jinja.
+
+    All expressions after ``cache`` form the cache key, e.g.
+    ``{% cache 'show-tile', show.id, show.version %}``. The rendered
+    markup of the block is stored in ``environment.fragment_cache``
+    and reused as long as the key does not change.
+    """
+
+    tags = set(['cache'])
+
+    def __init__(self, environment):
+        super(FragmentCacheExtension, self).__init__(environment)
+        environment.extend(fragment_cache=LRUCache())
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key_parts = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            key_parts.append(parser.parse_expression())
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method('_cache_support', [nodes.Tuple(key_parts, 'load')]),
+            [], [], body
+        ).set_lineno(lineno)
+
+    def _cache_support(self, key, caller):
+        cache = self.environment.fragment_cache
+        rv = cache.get(key)
+        if rv is None:
+            rv = caller()
+            cache.set(key, rv)
+        return rv
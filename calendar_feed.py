@@ -0,0 +1,115 @@
+#----------------------------------------------------------------------------#
+# Imports.
+#----------------------------------------------------------------------------#
+from datetime import datetime, timedelta
+
+from models import Venue, Artist, Show
+
+
+#----------------------------------------------------------------------------#
+# Buckets.
+#----------------------------------------------------------------------------#
+BUCKETS = ('day', 'week')
+
+
+def bucket_start(day, bucket):
+    # weeks start on monday
+    if bucket == 'week':
+        day = day - timedelta(days=day.weekday())
+    return day
+
+
+def bucket_length(bucket):
+    return timedelta(days=7 if bucket == 'week' else 1)
+
+
+def bucket_starts(start, end, bucket):
+    """First days of the buckets covering the dates [start, end)."""
+    day = bucket_start(start, bucket)
+    starts = []
+    while day < end:
+        starts.append(day)
+        day += bucket_length(bucket)
+    return starts
+
+
+def bucket_shows(session, day, bucket, city=None, state=None, venue_id=None):
+    """Shows starting in the bucket beginning on ``day``, as dicts.
+
+    One range query on Show.start_time, joined to the venue and the
+    artist of each show.
+    """
+    start = datetime.combine(day, datetime.min.time())
+    query = (
+        session.query(Show.id, Show.start_time, Show.duration,
+                      Venue.id, Venue.name, Venue.city, Venue.state,
+                      Artist.id, Artist.name)
+        .join(Venue, Venue.id == Show.venue_id)
+        .join(Artist, Artist.id == Show.artist_id)
+        .filter(Show.start_time >= start)
+        .filter(Show.start_time < start + bucket_length(bucket))
+    )
+    if city:
+        query = query.filter(Venue.city == city)
+    if state:
+        query = query.filter(Venue.state == state)
+    if venue_id:
+        query = query.filter(Venue.id == venue_id)
+
+    return [
+        {
+          'id': show_id,
+          'start_time': start_time.isoformat(),
+          'end_time': (start_time + timedelta(minutes=duration)).isoformat(),
+          'venue_id': show_venue_id,
+          'venue_name': venue_name,
+          'city': venue_city,
+          'state': venue_state,
+          'artist_id': artist_id,
+          'artist_name': artist_name,
+        }
+        for (show_id, start_time, duration, show_venue_id, venue_name,
+             venue_city, venue_state, artist_id, artist_name)
+        in query.order_by(Show.start_time, Show.id)
+    ]
+
+
+#----------------------------------------------------------------------------#
+# iCalendar.
+#----------------------------------------------------------------------------#
+def ical_text(value):
+    return (value.replace('\\', '\\\\').replace(';', '\\;')
+            .replace(',', '\\,').replace('\n', '\\n'))
+
+
+def ical_time(value):
+    # start times are stored without time zone: written as floating
+    # times, shown as is in the calendar of the reader
+    return datetime.fromisoformat(value).strftime('%Y%m%dT%H%M%S')
+
+
+def ical(shows, host):
+    """iCalendar (RFC 5545) document with one event per show."""
+    stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')
+    lines = [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:-//Fyyur//Shows//EN',
+        'CALSCALE:GREGORIAN',
+    ]
+    for show in shows:
+        lines.extend([
+            'BEGIN:VEVENT',
+            'UID:show-%s@%s' % (show['id'], host),
+            'DTSTAMP:' + stamp,
+            'DTSTART:' + ical_time(show['start_time']),
+            'DTEND:' + ical_time(show['end_time']),
+            'SUMMARY:' + ical_text('%s at %s' % (show['artist_name'],
+                                                 show['venue_name'])),
+            'LOCATION:' + ical_text('%s, %s, %s' % (show['venue_name'],
+                                                    show['city'],
+                                                    show['state'])),
+            'END:VEVENT',
+        ])
+    lines.append('END:VCALENDAR')
+    return '\r\n'.join(lines) + '\r\n'
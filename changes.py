@@ -0,0 +1,188 @@
+#----------------------------------------------------------------------------#
+# Imports.
+#----------------------------------------------------------------------------#
+import json
+import time
+from datetime import date, datetime, timedelta
+from select import select as wait_readable
+
+from flask import current_app
+from sqlalchemy import DateTime, event, func, literal, select, text
+from sqlalchemy.orm import Session
+
+from jobs import task
+from models import Change, Genres, db, parse_array
+
+
+#----------------------------------------------------------------------------#
+# Outbox.
+#----------------------------------------------------------------------------#
+# Every write of a venue, an artist or a show adds a row to the "Change"
+# table in the same transaction: a change is recorded if and only if the
+# write is committed. Consumers read the changes after the last position
+# they saw (/changes?since=, or `flask changes follow`).
+#
+# Ids are given when rows are inserted, in an order that is not the one
+# of the commits: a consumer reading past an id could miss a lower one
+# committed later. So changes are served by position, given just before
+# the transaction commits, under a lock held until it has committed (a
+# transaction-level advisory lock on postgres; sqlite has a single
+# writer already): a position is visible only once all the lower ones
+# are. Listeners are notified once per transaction.
+CHANNEL = 'fyyur_changes'
+# key of the advisory lock
+POSITION_LOCK = 0x667979757200
+
+
+def row_data(row):
+    # the columns of a model instance, as json values
+    data = {}
+    for column in row.__table__.columns:
+        value = getattr(row, column.key)
+        if isinstance(column.type, Genres) and isinstance(value, str):
+            value = parse_array(value)
+        elif isinstance(value, (datetime, date)):
+            value = value.isoformat()
+        data[column.key] = value
+    return data
+
+
+def record(session, entity, action, entity_id, data=None):
+    """Add a change to ``session``, committed with the write it tells of.
+
+    ``action`` is created, updated or deleted; ``data`` the columns of the
+    row (none for a deletion).
+    """
+    session.add(Change(entity=entity, entity_id=entity_id, action=action,
+                       data=json.dumps(data) if data is not None else None,
+                       created_at=datetime.utcnow()))
+    session.info['changes'] = True
+
+
+def record_row(session, action, row):
+    # a created or updated venue, artist or show
+    record(session, row.__tablename__.lower(), action, row.id, row_data(row))
+
+
+def record_deleted(session, entity, column, criterion):
+    """Record the deletion of the rows of ``entity`` whose id ``column``
+    matches ``criterion``, in a single INSERT ... SELECT."""
+    changes = select([literal(entity), column, literal('deleted'),
+                      literal(datetime.utcnow(), DateTime)]).where(criterion)
+    session.execute(Change.__table__.insert().from_select(
+        ['entity', 'entity_id', 'action', 'created_at'], changes))
+    session.info['changes'] = True
+
+
+@event.listens_for(Session, 'before_commit')
+def publish(session):
+    # position the changes of the transaction after all the committed
+    # ones, and notify the listeners
+    if not session.info.pop('changes', False):
+        return
+    session.flush()
+    postgres = session.bind.dialect.name == 'postgresql'
+    if postgres:
+        session.execute(text('SELECT pg_advisory_xact_lock(:key)'),
+                        {'key': POSITION_LOCK})
+    table = Change.__table__
+    last = select([func.max(table.c.position)]).as_scalar()
+    last, first = session.execute(
+        select([last, func.min(table.c.id)])
+        .where(table.c.position.is_(None))).first()
+    if first is None:
+        return
+    # in id order, from the last position on
+    session.execute(table.update().where(table.c.position.is_(None))
+                    .values(position=table.c.id + ((last or 0) + 1 - first)))
+    if postgres:
+        # delivered to the listeners when the transaction commits
+        session.execute(text('SELECT pg_notify(:channel, :payload)'),
+                        {'channel': CHANNEL, 'payload': ''})
+
+
+@event.listens_for(Session, 'after_rollback')
+def forget_changes(session):
+    session.info.pop('changes', None)
+
+
+#----------------------------------------------------------------------------#
+# Change feed.
+#----------------------------------------------------------------------------#
+def change_dict(change):
+    return {'id': change.id, 'position': change.position,
+            'entity': change.entity,
+            'entity_id': change.entity_id, 'action': change.action,
+            'data': json.loads(change.data) if change.data else None,
+            'created_at': change.created_at.isoformat()}
+
+
+def read_changes(session, since, limit):
+    """The committed changes after the position ``since``, in commit
+    order."""
+    return (session.query(Change)
+            .filter(Change.position > since)
+            .order_by(Change.position)
+            .limit(limit)
+            .all())
+
+
+def is_expired(session, since):
+    # changes after ``since`` may have been purged: the consumer must
+    # read everything again
+    oldest = session.query(func.min(Change.position)).scalar()
+    return since > 0 and oldest is not None and since < oldest - 1
+
+
+def wait_for_changes(connection, timeout):
+    # until a change is committed (postgres, LISTEN) or for ``timeout``
+    # seconds (other databases, polling); True when notified
+    if connection is None:
+        time.sleep(timeout)
+        return False
+    if wait_readable([connection], [], [], timeout) == ([], [], []):
+        return False
+    connection.poll()
+    del connection.notifies[:]
+    return True
+
+
+def listen(engine):
+    # a raw connection listening to the changes, on postgres only
+    if engine.dialect.name != 'postgresql':
+        return None
+    pooled = engine.raw_connection()
+    # kept for the listener, out of the pool
+    pooled.detach()
+    connection = pooled.connection
+    connection.autocommit = True
+    with connection.cursor() as cursor:
+        cursor.execute('LISTEN %s' % CHANNEL)
+    return connection
+
+
+def follow(session, engine, since, poll_interval, batch_size=1000):
+    """Yield the changes after ``since`` (as dicts) as they are made,
+    forever."""
+    connection = listen(engine)
+    while True:
+        changes = [change_dict(change) for change
+                   in read_changes(session, since, batch_size)]
+        # a new snapshot for the next read
+        session.rollback()
+        for change in changes:
+            yield change
+            since = change['position']
+        if len(changes) < batch_size:
+            wait_for_changes(connection, poll_interval)
+
+
+@task('purge_changes')
+def purge_changes(days=None):
+    # changes are kept CHANGES_RETENTION_DAYS days
+    if days is None:
+        days = current_app.config['CHANGES_RETENTION_DAYS']
+    before = datetime.utcnow() - timedelta(days=days)
+    (db.session.query(Change)
+     .filter(Change.created_at < before)
+     .delete(synchronize_session=False))
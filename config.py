@@ -1,13 +1,184 @@
 import os
-SECRET_KEY = os.urandom(32)
+# Signs the session cookies and the CSRF tokens: it must be the same in
+# every worker and instance, so it is read from FYYUR_SECRET_KEY. Without
+# it the app does not start, unless DEBUG (or TESTING) is on: a random
+# key is then made for the process (one worker only) and a warning logged
+SECRET_KEY = os.environ.get('FYYUR_SECRET_KEY')
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
 
-# Enable debug mode.
-DEBUG = True
+# Debug mode, for development only: FYYUR_DEBUG=1 or
+# FLASK_ENV=development
+DEBUG = (os.environ.get('FYYUR_DEBUG', '') == '1'
+         or os.environ.get('FLASK_ENV') == 'development')
 
-# Connect to the database
+# Jinja bytecode cache (filled at deploy time by `flask compile-templates`)
+TEMPLATE_CACHE_DIR = os.path.join(basedir, '.jinja_cache')
+# Maximum number of rendered template fragments ({% cache %}) kept in memory
+FRAGMENT_CACHE_SIZE = 20000
 
+# Listing pages are streamed: rows fetched per round trip to the database,
+# and template chunks buffered before being sent to the client
+STREAM_BATCH_SIZE = 500
+STREAM_BUFFER_SIZE = 20
 
-# TODO IMPLEMENT DATABASE URL
-SQLALCHEMY_DATABASE_URI = 'postgresql://vivi@localhost:5432/fyyur_db'
+# Connect to the database: postgresql by default. DATABASE_URL selects
+# another one, e.g. sqlite:////tmp/fyyur.db (a file) or sqlite:// (in
+# memory, shared by all the threads of the process, with its schema
+# created when the app is loaded), for tests and benchmarks
+SQLALCHEMY_DATABASE_URI = os.environ.get(
+    'DATABASE_URL', 'postgresql://vivi@localhost:5432/fyyur_db')
+
+# Write transactions failing on a serialization error or a deadlock are
+# retried DB_RETRIES times, waiting DB_RETRY_BACKOFF seconds, then twice
+# as long on each new attempt
+DB_RETRIES = 3
+DB_RETRY_BACKOFF = 0.05
+
+# Longest show that can be listed, in minutes. Bounds the range of start
+# times scanned when looking for overlapping shows
+MAX_SHOW_DURATION = 24 * 60
+
+# Largest number of names returned by the autocomplete endpoints, and
+# seconds before the name indexes (autocomplete and duplicates) are built
+# again from the database, to take in the writes of the other processes
+AUTOCOMPLETE_MAX_RESULTS = 50
+NAMES_REFRESH_INTERVAL = 60
+
+# Calendar: largest number of day or week buckets in one request, and
+# number of buckets kept in memory, for CALENDAR_CACHE_TIMEOUT seconds
+CALENDAR_MAX_BUCKETS = 92
+CALENDAR_CACHE_SIZE = 5000
+CALENDAR_CACHE_TIMEOUT = 60
+
+# Local gazetteer (city, state, latitude, longitude) used to geocode venues,
+# and largest radius of the nearby searches, in km
+GAZETTEER_PATH = os.path.join(basedir, 'data', 'gazetteer.csv')
+NEARBY_MAX_KM = 500
+
+# Request profiling (see profiling.py). Off by default: when enabled,
+# requests sent with an 'X-Profile: <PROFILE_TOKEN>[:cprofile|:sample]'
+# header, and a PROFILE_SAMPLE_RATE share of all requests, are profiled.
+# Without a PROFILE_TOKEN, the header is ignored
+PROFILE_ENABLED = os.environ.get('FYYUR_PROFILE', '') == '1'
+PROFILE_TOKEN = os.environ.get('FYYUR_PROFILE_TOKEN', '')
+PROFILE_SAMPLE_RATE = 0.0
+PROFILE_SAMPLE_INTERVAL = 0.005
+PROFILE_DIR = os.path.join(basedir, 'profiles')
+
+# Metrics served on /metrics. With several worker processes, point
+# FYYUR_METRICS_DIR to a directory shared by the workers (emptied at
+# each deploy): they write their metrics there every
+# METRICS_FLUSH_INTERVAL seconds
+METRICS_DIR = os.environ.get('FYYUR_METRICS_DIR')
+METRICS_FLUSH_INTERVAL = 5.0
+
+# Logging: json lines written to LOG_FILE and/or stdout by a background
+# thread. LOG_SAMPLE_RATE is the share of high-frequency INFO events
+# (one per request) that are kept; warnings and errors are always kept
+LOG_FILE = os.environ.get('FYYUR_LOG_FILE', os.path.join(basedir, 'error.log'))
+LOG_STDOUT = os.environ.get('FYYUR_LOG_STDOUT', '') == '1'
+LOG_LEVEL = os.environ.get('FYYUR_LOG_LEVEL', 'INFO')
+LOG_SAMPLE_RATE = float(os.environ.get('FYYUR_LOG_SAMPLE_RATE', '1.0'))
+
+# Rate limits per endpoint and client (API key or address), as
+# '<requests>/<second|minute|hour|day>'. Buckets are kept per worker
+# ('memory://') or shared by all workers ('redis://host:6379/0'). Only
+# the X-API-Key values of RATELIMIT_API_KEYS (comma separated in
+# FYYUR_RATELIMIT_API_KEYS) get buckets of their own; other clients are
+# limited by address
+RATELIMIT_ENABLED = True
+RATELIMIT_STORAGE_URL = os.environ.get('FYYUR_RATELIMIT_STORAGE_URL',
+                                       'memory://')
+RATELIMIT_API_KEYS = [
+    key.strip() for key
+    in os.environ.get('FYYUR_RATELIMIT_API_KEYS', '').split(',')
+    if key.strip()]
+RATELIMITS = {
+    'search_venues': '30/minute',
+    'search_artists': '30/minute',
+    'create_venue_submission': '10/minute',
+    'create_artist_submission': '10/minute',
+    'create_show_submission': '10/minute',
+    'edit_venue_submission': '20/minute',
+    'edit_artist_submission': '20/minute',
+    'delete_venue': '20/minute',
+    'delete_artist': '20/minute',
+    'delete_venues': '5/minute',
+    'delete_artists': '5/minute',
+}
+# Rate limited endpoints answer 503 while the average wait for a database
+# connection is above this many seconds
+SHED_POOL_WAIT_THRESHOLD = 0.25
+
+# Background jobs (see jobs.py): seconds between polls of an idle worker,
+# before a running job is considered abandoned, and before the first
+# retry of a failed job (doubled at each attempt). JOB_SCHEDULE lists the
+# periodic tasks, with their interval in seconds
+JOB_POLL_INTERVAL = 1.0
+JOB_TIMEOUT = 15 * 60
+JOB_RETRY_BACKOFF = 10
+JOB_SCHEDULE = {
+    'purge_jobs': 24 * 3600,
+    'purge_sessions': 3600,
+    'purge_changes': 24 * 3600,
+    'rebuild_rollups': 24 * 3600,
+}
+
+# Warm-up (see warmup.py): pages requested by `flask warmup` when no
+# access log is given. With FYYUR_WARMUP=1 the app warms itself up when
+# it is loaded, so that a server preloading the app (gunicorn --preload)
+# forks workers with warm caches
+WARMUP_URLS = ['/', '/venues', '/artists', '/shows', '/shows/calendar']
+WARMUP_ON_START = os.environ.get('FYYUR_WARMUP') == '1'
+
+# Artist / venue matching (see matching.py): weights of the score
+# components, distance (km) at which the location score falls to 1/e,
+# seconds before the index is rebuilt from the database (to take in the
+# writes of the other processes) and maximum suggestions per request
+MATCH_WEIGHTS = {'genres': 0.5, 'location': 0.3, 'history': 0.2}
+MATCH_DISTANCE_SCALE_KM = 100
+MATCH_REFRESH_INTERVAL = 300
+MATCH_MAX_RESULTS = 50
+
+# Image proxy (see images.py): artist and venue images are fetched once
+# by IMAGE_FETCHER ('http', or 'dir:<folder>' to read them from a local
+# folder), resized to one of IMAGE_SIZES and kept in IMAGE_CACHE_DIR,
+# up to IMAGE_CACHE_MAX_BYTES. Proxy urls are signed with
+# IMAGE_SIGNING_KEY (FYYUR_IMAGE_KEY), derived from SECRET_KEY when not
+# set: it must be the same for all the workers. An image
+# that cannot be fetched is not retried for IMAGE_FAILURE_TIMEOUT seconds
+IMAGE_FETCHER = os.environ.get('FYYUR_IMAGE_FETCHER', 'http')
+IMAGE_SIZES = {'tile': (320, 320), 'detail': (640, 640)}
+IMAGE_CACHE_DIR = os.path.join(basedir, '.image_cache')
+IMAGE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+IMAGE_SIGNING_KEY = os.environ.get('FYYUR_IMAGE_KEY', '').encode()
+IMAGE_MAX_AGE = 365 * 24 * 3600
+IMAGE_FAILURE_TIMEOUT = 60
+
+# Stats page (see stats.py): number of venues, artists, cities and genres
+# listed, weeks of shows per city (up to the current week, and after it)
+# and months of genre trends
+STATS_TOP = 10
+STATS_WEEKS = 8
+STATS_WEEKS_AHEAD = 4
+STATS_MONTHS = 12
+
+# Sessions (see sessions.py) are kept server side, in the worker process
+# ('memory://'), in the database ('sql://') or in redis
+# ('redis://host:6379/0'); the cookie only holds the session id. A
+# session is kept SESSION_LIFETIME seconds after it was last changed
+SESSION_STORAGE_URL = os.environ.get('FYYUR_SESSION_STORAGE_URL',
+                                     'memory://')
+SESSION_LIFETIME = 24 * 3600
+
+# Change feed (see changes.py): largest number of changes per /changes
+# request, days changes are kept, and seconds between polls of `flask
+# changes follow` (a timeout on postgres, woken by NOTIFY)
+CHANGES_MAX_RESULTS = 1000
+CHANGES_RETENTION_DAYS = 7
+CHANGES_POLL_INTERVAL = 1.0
+
+# Duplicate venues and artists (see dedup.py): smallest name similarity
+# (0 to 1) of a likely duplicate
+DEDUP_THRESHOLD = 0.75
@@ -0,0 +1,84 @@
+#----------------------------------------------------------------------------#
+# Test fixtures.
+#----------------------------------------------------------------------------#
+# The tests run on an in-memory sqlite database (see DATABASE_URL in
+# config.py): its tables are made before each test and dropped after it.
+# The app is loaded once, so the environment is set before it is imported.
+#
+# Tests marked ``postgres`` run on the database of FYYUR_TEST_POSTGRES_URL
+# (emptied, then migrated), and are skipped without it.
+import os
+import tempfile
+
+import flask_migrate
+import pytest
+from sqlalchemy import text
+
+os.environ['DATABASE_URL'] = 'sqlite://'
+os.environ.setdefault('FYYUR_SECRET_KEY', 'test secret key')
+os.environ.setdefault('FYYUR_LOG_FILE',
+                      os.path.join(tempfile.gettempdir(), 'fyyur-tests.log'))
+
+# no rate limits (their buckets would be shared by all the tests; see
+# tests/test_ratelimit.py), thumbnails out of the repository
+import config  # noqa: E402
+config.RATELIMIT_ENABLED = False
+config.IMAGE_CACHE_DIR = tempfile.mkdtemp(prefix='fyyur-images-')
+
+import app as fyyur  # noqa: E402
+from models import db as database  # noqa: E402
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          'migrations')
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        'markers', 'postgres: needs FYYUR_TEST_POSTGRES_URL')
+
+
+@pytest.fixture
+def app():
+    fyyur.app.config['TESTING'] = True
+    with fyyur.app.app_context():
+        database.create_all()
+        # the in-process indexes and caches start from the empty
+        # database too
+        fyyur.build_name_indexes()
+        fyyur.matches.built_at = None
+        fyyur.calendar_cache.clear()
+        fyyur.failed_images.clear()
+        fyyur.app.jinja_env.fragment_cache.clear()
+        yield fyyur.app
+        database.session.remove()
+        database.drop_all()
+
+
+@pytest.fixture
+def db(app):
+    return database
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def postgres(app):
+    # the engine of a postgres database migrated to the last revision;
+    # the app uses it for the test
+    url = os.environ.get('FYYUR_TEST_POSTGRES_URL')
+    if not url:
+        pytest.skip('FYYUR_TEST_POSTGRES_URL is not set')
+    sqlite_url = app.config['SQLALCHEMY_DATABASE_URI']
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    engine = database.get_engine()
+    with engine.begin() as connection:
+        connection.execute(text('DROP SCHEMA public CASCADE'))
+        connection.execute(text('CREATE SCHEMA public'))
+    flask_migrate.upgrade(directory=MIGRATIONS)
+    yield engine
+    database.session.remove()
+    engine.dispose()
+    app.config['SQLALCHEMY_DATABASE_URI'] = sqlite_url
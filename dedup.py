@@ -0,0 +1,228 @@
+#----------------------------------------------------------------------------#
+# Imports.
+#----------------------------------------------------------------------------#
+import math
+import re
+import time
+import unicodedata
+from threading import Lock
+
+from changes import record, record_row
+from jobs import enqueue
+from models import Show, ShowArchive
+from scheduling import ScheduleConflict, overlapping_shows, show_end
+from stats import remove as remove_rollups
+
+
+#----------------------------------------------------------------------------#
+# Names.
+#----------------------------------------------------------------------------#
+# "The Musical Hop", "Musical Hop, The" and "the musical-hop" are the
+# same venue: names are compared once accents, case, punctuation and
+# articles are taken out, and "&" written "and".
+ARTICLES = ('the', 'a', 'an')
+
+
+def normalize_name(name):
+    """The words of ``name`` that tell it apart, e.g. ('musical', 'hop')."""
+    name = unicodedata.normalize('NFKD', name)
+    name = ''.join(c for c in name if not unicodedata.combining(c))
+    name = name.lower().replace('&', ' and ')
+    name = re.sub(r"[^\w\s,']|_", ' ', name.replace("'", ''))
+    words = name.replace(',', ' , ').split()
+    # a leading article, or one moved after a comma at the end
+    if len(words) > 2 and words[-2] == ',' and words[-1] in ARTICLES:
+        words = words[:-2]
+    if len(words) > 1 and words[0] in ARTICLES:
+        words = words[1:]
+    return tuple(word for word in words if word != ',')
+
+
+def trigrams(words):
+    # character trigrams of the words, each padded with spaces
+    grams = set()
+    for word in words:
+        padded = '  %s ' % word
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def similarity(words, grams, other_words, other_grams):
+    # trigram (spelling) and word overlap, from 0 to 1
+    if not grams or not other_grams:
+        return 0.0
+    gram_score = (2.0 * len(grams & other_grams)
+                  / (len(grams) + len(other_grams)))
+    words, other_words = set(words), set(other_words)
+    word_score = (len(words & other_words)
+                  / float(len(words | other_words)))
+    return 0.8 * gram_score + 0.2 * word_score
+
+
+def place(city, state):
+    return (' '.join((city or '').lower().split()), (state or '').upper())
+
+
+#----------------------------------------------------------------------------#
+# Blocking index.
+#----------------------------------------------------------------------------#
+class DuplicateIndex(object):
+    """In-memory index of venue or artist names, finding likely duplicates.
+
+    Only records of the same city and state can be duplicates, and only
+    if their names share enough trigrams: the index maps (city, state,
+    trigram) blocks to the records holding them. To reach the threshold,
+    a record must share at least ``least`` of the n trigrams of a name, so
+    it holds one of its n - least + 1 rarest trigrams: only those blocks
+    are read, and only the records found there are scored, never every
+    pair. Common trigrams ("bar", "clu") are the ones left out.
+
+    Like the prefix index of autocomplete.py, it lives in the worker
+    process: filled by ``warm`` (at ``built_at``), kept up to date by
+    ``add`` / ``remove``.
+    """
+
+    def __init__(self, threshold=0.75):
+        self.threshold = threshold
+        self._records = {}
+        self._blocks = {}
+        self.built_at = None
+        self._lock = Lock()
+
+    def warm(self, rows):
+        # rows: iterable of (id, name, city, state)
+        records, blocks = {}, {}
+        for record_id, name, city, state in rows:
+            records[record_id] = record = self._record(name, city, state)
+            for block in self._blocks_of(record):
+                blocks.setdefault(block, set()).add(record_id)
+        with self._lock:
+            self._records = records
+            self._blocks = blocks
+            self.built_at = time.monotonic()
+
+    @staticmethod
+    def _record(name, city, state):
+        words = normalize_name(name)
+        return (name, place(city, state), words, trigrams(words))
+
+    @staticmethod
+    def _blocks_of(record):
+        where = record[1]
+        return [where + (gram,) for gram in record[3]]
+
+    def add(self, record_id, name, city, state):
+        # also used when a record changes
+        with self._lock:
+            self._discard(record_id)
+            self._records[record_id] = record = self._record(name, city,
+                                                             state)
+            for block in self._blocks_of(record):
+                self._blocks.setdefault(block, set()).add(record_id)
+
+    def remove(self, record_id):
+        with self._lock:
+            self._discard(record_id)
+
+    def _discard(self, record_id):
+        record = self._records.pop(record_id, None)
+        if record is None:
+            return
+        for block in self._blocks_of(record):
+            ids = self._blocks.get(block)
+            if ids is not None:
+                ids.discard(record_id)
+                if not ids:
+                    del self._blocks[block]
+
+    def find(self, name, city, state, exclude=None, limit=5):
+        """Up to ``limit`` (id, name, score) of the records of the same
+        city and state likely to be ``name``, best first."""
+        query = self._record(name, city, state)
+        if not query[3]:
+            return []
+        with self._lock:
+            blocks = sorted((self._blocks.get(block, ()) for block
+                             in self._blocks_of(query)), key=len)
+            candidates = set()
+            for ids in blocks[:len(blocks) - self.least_shared(len(blocks))
+                              + 1]:
+                candidates.update(ids)
+            candidates.discard(exclude)
+            found = []
+            for record_id in candidates:
+                record = self._records[record_id]
+                score = similarity(query[2], query[3], record[2], record[3])
+                if score >= self.threshold:
+                    found.append((record_id, record[0], round(score, 3)))
+        found.sort(key=lambda match: (-match[2], match[0]))
+        return found[:limit]
+
+    def least_shared(self, count):
+        # trigrams a record must share with a name of ``count`` trigrams
+        # to reach the threshold: the trigram part of the score (weight
+        # 0.8) must be at least ``dice``, and a Dice coefficient 2s / (n +
+        # m) >= dice with m >= s needs s >= dice * n / (2 - dice)
+        dice = max(0.0, (self.threshold - 0.2) / 0.8)
+        return max(1, int(math.ceil(dice * count / (2 - dice) - 1e-9)))
+
+    def pairs(self):
+        """All the (id, id, score) pairs of likely duplicates."""
+        with self._lock:
+            records = list(self._records.items())
+        found = []
+        for record_id, (name, (city, state), _, _) in records:
+            for other_id, _, score in self.find(name, city, state,
+                                                exclude=record_id, limit=50):
+                if record_id < other_id:
+                    found.append((record_id, other_id, score))
+        found.sort(key=lambda pair: (-pair[2], pair[0], pair[1]))
+        return found
+
+    def name_of(self, record_id):
+        record = self._records.get(record_id)
+        return record[0] if record else None
+
+    def __len__(self):
+        return len(self._records)
+
+
+#----------------------------------------------------------------------------#
+# Merge.
+#----------------------------------------------------------------------------#
+def merge(session, model, keep_id, duplicate_ids):
+    """Move the shows of the venues (or artists) ``duplicate_ids`` to
+    ``keep_id``, then delete the duplicates; returns the shows moved.
+
+    Raises ScheduleConflict when a moved show overlaps another show of
+    ``keep_id``. The moves and deletions go to the change feed, and the
+    stats are recounted by a job.
+    """
+    entity = model.__tablename__.lower()
+    column = entity + '_id'
+    shows = (session.query(Show)
+             .filter(getattr(Show, column).in_(duplicate_ids))
+             .all())
+    for show in shows:
+        setattr(show, column, keep_id)
+        record_row(session, 'updated', show)
+    session.flush()
+    for show in shows:
+        overlaps = overlapping_shows(session, getattr(Show, column), keep_id,
+                                     show.start_time, show_end(show))
+        if set(overlaps) - {show.id}:
+            raise ScheduleConflict(
+                'Show %s overlaps another show of %s %s.'
+                % (show.id, entity, keep_id))
+    (session.query(ShowArchive)
+     .filter(getattr(ShowArchive, column).in_(duplicate_ids))
+     .update({column: keep_id}, synchronize_session=False))
+
+    for row_id in duplicate_ids:
+        record(session, entity, 'deleted', row_id)
+    remove_rollups(session, entity, duplicate_ids)
+    (session.query(model)
+     .filter(model.id.in_(duplicate_ids))
+     .delete(synchronize_session=False))
+    enqueue(session, 'rebuild_rollups')
+    return len(shows)
@@ -1,20 +1,65 @@
 from datetime import datetime
+from flask import current_app
 from flask_wtf import Form
-from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField
-from wtforms.validators import DataRequired, AnyOf, URL, Regexp
+from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField, IntegerField
+from wtforms.validators import DataRequired, AnyOf, URL, Regexp, NumberRange, ValidationError
+from werkzeug.datastructures import MultiDict
+from models import Venue, Artist, db
 
 class ShowForm(Form):
-    artist_id = StringField(
-        'artist_id'
+    artist_id = IntegerField(
+        'artist_id', validators=[DataRequired()]
     )
-    venue_id = StringField(
-        'venue_id'
+    venue_id = IntegerField(
+        'venue_id', validators=[DataRequired()]
     )
     start_time = DateTimeField(
         'start_time',
         validators=[DataRequired()],
         default= datetime.today()
     )
+    duration = IntegerField(
+        'duration', validators=[DataRequired(), NumberRange(min=1)],
+        default=120
+    )
+
+    def validate_artist_id(self, field):
+        if db.session.query(Artist.id).filter_by(id=field.data).first() is None:
+            raise ValidationError('No artist with ID %s.' % field.data)
+
+    def validate_venue_id(self, field):
+        if db.session.query(Venue.id).filter_by(id=field.data).first() is None:
+            raise ValidationError('No venue with ID %s.' % field.data)
+
+    def validate_duration(self, field):
+        if field.data > current_app.config['MAX_SHOW_DURATION']:
+            raise ValidationError('A show cannot last more than %d minutes.'
+                                  % current_app.config['MAX_SHOW_DURATION'])
+
+def show_forms(formdata):
+    # one ShowForm per submitted show: several shows are submitted
+    # at once by repeating the artist_id, venue_id, start_time and
+    # duration fields. The duration can be left out for all the shows,
+    # but not for some of them only. When the fields are not repeated
+    # the same number of times the rows would not line up: no form is
+    # made, and the whole submission is rejected
+    artist_ids = formdata.getlist('artist_id')
+    venue_ids = formdata.getlist('venue_id')
+    start_times = formdata.getlist('start_time')
+    durations = formdata.getlist('duration') or [None] * len(artist_ids)
+    if not (len(artist_ids) == len(venue_ids) == len(start_times)
+            == len(durations)):
+        return []
+    rows = zip(artist_ids, venue_ids, start_times, durations)
+    forms = []
+    for artist_id, venue_id, start_time, duration in rows:
+        data = MultiDict([('artist_id', artist_id),
+                          ('venue_id', venue_id),
+                          ('start_time', start_time)])
+        if duration is not None:
+            data['duration'] = duration
+        forms.append(ShowForm(data, meta={'csrf': False}))
+    return forms
 
 class VenueForm(Form):
     name = StringField(
@@ -0,0 +1,120 @@
+#----------------------------------------------------------------------------#
+# Imports.
+#----------------------------------------------------------------------------#
+import csv
+import math
+
+
+#----------------------------------------------------------------------------#
+# Geocoding.
+#----------------------------------------------------------------------------#
+def load_gazetteer(path):
+    """Coordinates of the cities of a local gazetteer file.
+
+    The file is a csv with city, state, latitude and longitude columns;
+    returns {(city, state): (latitude, longitude)}, city in lower case.
+    """
+    with open(path, newline='') as gazetteer_file:
+        return {
+            (row['city'].strip().lower(), row['state'].strip().upper()):
+            (float(row['latitude']), float(row['longitude']))
+            for row in csv.DictReader(gazetteer_file)
+        }
+
+
+def geocode(gazetteer, city, state):
+    # city-level coordinates, or None if the city is unknown
+    return gazetteer.get(((city or '').strip().lower(),
+                          (state or '').strip().upper()))
+
+
+#----------------------------------------------------------------------------#
+# Geo cells.
+#----------------------------------------------------------------------------#
+# A geo cell is a geohash stored as an integer: longitude and latitude
+# bits interleaved, CELL_BITS bits in total (~0.5 m at the equator). All
+# the points of a coarser cell of b bits share the same first b bits, so
+# they are one range of integers, found with a btree index.
+CELL_BITS = 52
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.32
+
+
+def encode(latitude, longitude, bits=CELL_BITS):
+    lat_lo, lat_hi = -90.0, 90.0
+    lon_lo, lon_hi = -180.0, 180.0
+    code = 0
+    for i in range(bits):
+        code <<= 1
+        if i % 2 == 0:
+            mid = (lon_lo + lon_hi) / 2
+            if longitude >= mid:
+                code |= 1
+                lon_lo = mid
+            else:
+                lon_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if latitude >= mid:
+                code |= 1
+                lat_lo = mid
+            else:
+                lat_hi = mid
+    return code
+
+
+def cell_size(bits):
+    # (height, width) of a cell of ``bits`` bits, in degrees
+    lon_bits = (bits + 1) // 2
+    lat_bits = bits // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+
+def distance_km(lat1, lon1, lat2, lon2):
+    # great-circle distance (haversine)
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = (math.sin(dphi / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def cell_ranges(latitude, longitude, radius_km):
+    """Ranges [low, high) of geo cells covering a circle.
+
+    Uses the finest cells at least as large as the radius: the circle
+    then fits in the cell of its center and its 8 neighbours. Returns
+    None when the circle is too large for cells to help.
+    """
+    # the width of a cell shrinks towards the poles: size it for the
+    # latitude of the circle closest to a pole
+    worst_latitude = min(89.0, abs(latitude) + radius_km / KM_PER_DEGREE)
+    cos_latitude = math.cos(math.radians(worst_latitude))
+    bits = CELL_BITS
+    while bits > 0:
+        height, width = cell_size(bits)
+        if (height * KM_PER_DEGREE >= radius_km
+                and width * KM_PER_DEGREE * cos_latitude >= radius_km):
+            break
+        bits -= 1
+    if bits < 2:
+        return None
+
+    height, width = cell_size(bits)
+    cells = set()
+    for dy in (-1, 0, 1):
+        for dx in (-1, 0, 1):
+            lat = max(-90.0, min(89.999999, latitude + dy * height))
+            lon = (longitude + dx * width + 180.0) % 360.0 - 180.0
+            cells.add(encode(lat, lon, bits))
+
+    shift = CELL_BITS - bits
+    ranges = []
+    for cell in sorted(cells):
+        low, high = cell << shift, (cell + 1) << shift
+        if ranges and ranges[-1][1] == low:
+            ranges[-1] = (ranges[-1][0], high)
+        else:
+            ranges.append((low, high))
+    return ranges
@@ -0,0 +1,254 @@
+#----------------------------------------------------------------------------#
+# Imports.
+#----------------------------------------------------------------------------#
+import hashlib
+import hmac
+import http.client
+import io
+import ipaddress
+import os
+import socket
+import urllib.request
+from threading import Lock, get_ident
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = ImageOps = None
+
+
+#----------------------------------------------------------------------------#
+# Fetchers.
+#----------------------------------------------------------------------------#
+# A fetcher returns the bytes of the image at a url, or raises OSError.
+#
+# Image links are typed in by anyone: the http fetcher connects only to
+# public addresses (checked on the addresses it connects to, not on a
+# name that could resolve elsewhere the second time) and follows no
+# redirect, so the proxy cannot reach the app's own network.
+def is_public(address):
+    ip = ipaddress.ip_address(address.split('%')[0])
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+def public_connection(address, timeout=socket._GLOBAL_DEFAULT_TIMEOUT,
+                      source_address=None):
+    # socket.create_connection, to public addresses only
+    host, port = address
+    addresses = [sockaddr[0] for _, _, _, _, sockaddr
+                 in socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)]
+    for resolved in addresses:
+        if not is_public(resolved):
+            raise OSError('not a public address: %s (%s)' % (host, resolved))
+    return socket.create_connection((addresses[0], port), timeout,
+                                    source_address)
+
+
+class PublicHTTPConnection(http.client.HTTPConnection):
+
+    def __init__(self, *args, **kwargs):
+        super(PublicHTTPConnection, self).__init__(*args, **kwargs)
+        self._create_connection = public_connection
+
+
+class PublicHTTPSConnection(http.client.HTTPSConnection):
+
+    def __init__(self, *args, **kwargs):
+        super(PublicHTTPSConnection, self).__init__(*args, **kwargs)
+        self._create_connection = public_connection
+
+
+class PublicHTTPHandler(urllib.request.HTTPHandler):
+
+    def http_open(self, request):
+        return self.do_open(PublicHTTPConnection, request)
+
+
+class PublicHTTPSHandler(urllib.request.HTTPSHandler):
+
+    def https_open(self, request):
+        return self.do_open(PublicHTTPSConnection, request,
+                            context=self._context)
+
+
+class NoRedirectHandler(urllib.request.HTTPRedirectHandler):
+
+    def redirect_request(self, request, fp, code, msg, headers, url):
+        # a redirect is an error (HTTPError, an OSError)
+        return None
+
+
+class HttpFetcher(object):
+
+    def __init__(self, timeout=5.0, max_bytes=10 * 1024 * 1024):
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        # no proxy from the environment: it would connect for us
+        self.opener = urllib.request.build_opener(
+            urllib.request.ProxyHandler({}), PublicHTTPHandler,
+            PublicHTTPSHandler, NoRedirectHandler)
+
+    def __call__(self, url):
+        if not url.startswith(('http://', 'https://')):
+            raise OSError('not an http url: %s' % url)
+        request = urllib.request.Request(
+            url, headers={'User-Agent': 'fyyur-image-proxy'})
+        with self.opener.open(request, timeout=self.timeout) as response:
+            if not response.headers.get('Content-Type', '').startswith('image/'):
+                raise OSError('not an image: %s' % url)
+            data = response.read(self.max_bytes + 1)
+        if len(data) > self.max_bytes:
+            raise OSError('image too large: %s' % url)
+        return data
+
+
+class DirectoryFetcher(object):
+    """Serves every url from a local folder, by the last part of its path
+    (a stand-in for tests and offline use)."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def __call__(self, url):
+        name = os.path.basename(url.split('?')[0])
+        with open(os.path.join(self.root, name), 'rb') as image_file:
+            return image_file.read()
+
+
+def fetcher_from_url(url):
+    # 'http' or 'dir:<folder>'
+    if url == 'http':
+        return HttpFetcher()
+    if url.startswith('dir:'):
+        return DirectoryFetcher(url[len('dir:'):])
+    raise ValueError('unknown image fetcher: %s' % url)
+
+
+#----------------------------------------------------------------------------#
+# Thumbnails.
+#----------------------------------------------------------------------------#
+def signing_key(key, secret_key):
+    # IMAGE_SIGNING_KEY, or a key derived from the secret key of the app
+    # when it is not set
+    if key:
+        return key
+    if isinstance(secret_key, str):
+        secret_key = secret_key.encode()
+    return hmac.new(secret_key, b'fyyur-images', hashlib.sha256).digest()
+
+
+def sign(key, url, size):
+    # signature of a proxy url: only the images the app links to are
+    # fetched, the proxy cannot be used to reach any url
+    message = ('%s\n%s' % (size, url)).encode()
+    return hmac.new(key, message, hashlib.sha256).hexdigest()[:20]
+
+
+def make_thumbnail(data, size):
+    """A jpeg of exactly ``size`` (width, height), cropped to the center.
+
+    Without Pillow the image is kept as it is.
+    """
+    if Image is None:
+        return data
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            thumbnail = ImageOps.fit(image.convert('RGB'), size,
+                                     Image.LANCZOS)
+    except Image.DecompressionBombError as error:
+        raise OSError(str(error))
+    output = io.BytesIO()
+    thumbnail.save(output, 'JPEG', quality=85, optimize=True)
+    return output.getvalue()
+
+
+def content_type(data):
+    if data[:3] == b'\xff\xd8\xff':
+        return 'image/jpeg'
+    if data[:8] == b'\x89PNG\r\n\x1a\n':
+        return 'image/png'
+    if data[:6] in (b'GIF87a', b'GIF89a'):
+        return 'image/gif'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    return 'application/octet-stream'
+
+
+class ImageCache(object):
+    """Thumbnails on disk, by the sha256 of their content.
+
+    blobs/<hash> holds a thumbnail; refs/<hash of size and url> holds the
+    hash of the thumbnail of that url, so the same image linked from
+    several urls is stored once. Reading a blob refreshes its mtime;
+    above ``max_bytes``, the blobs read the longest time ago are deleted
+    until the cache is down to 90% of it.
+    """
+
+    def __init__(self, directory, max_bytes, fetcher, sizes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.fetcher = fetcher
+        self.sizes = sizes
+        for name in ('blobs', 'refs'):
+            os.makedirs(os.path.join(directory, name), exist_ok=True)
+        self.total_bytes = sum(entry.stat().st_size for entry in
+                               os.scandir(os.path.join(directory, 'blobs')))
+        self._lock = Lock()
+
+    def blob_path(self, digest):
+        return os.path.join(self.directory, 'blobs', digest)
+
+    def ref_path(self, url, size):
+        key = hashlib.sha256(('%s\n%s' % (size, url)).encode()).hexdigest()
+        return os.path.join(self.directory, 'refs', key)
+
+    def get(self, url, size):
+        """(hash, path) of the thumbnail of ``url``, fetched and made if
+        needed. Raises OSError when the image cannot be fetched or read."""
+        ref_path = self.ref_path(url, size)
+        try:
+            with open(ref_path) as ref_file:
+                digest = ref_file.read()
+            path = self.blob_path(digest)
+            os.utime(path)
+            return digest, path
+        except OSError:
+            pass
+
+        data = make_thumbnail(self.fetcher(url), self.sizes[size])
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.blob_path(digest)
+        if not os.path.exists(path):
+            write_atomic(path, data)
+            with self._lock:
+                self.total_bytes += len(data)
+        write_atomic(ref_path, digest.encode())
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+        return digest, path
+
+    def evict(self):
+        with self._lock:
+            entries = sorted(os.scandir(os.path.join(self.directory, 'blobs')),
+                             key=lambda entry: entry.stat().st_mtime)
+            total = sum(entry.stat().st_size for entry in entries)
+            for entry in entries:
+                if total <= 0.9 * self.max_bytes:
+                    break
+                size = entry.stat().st_size
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    continue
+                total -= size
+            # refs of deleted blobs are misses, fetched again when used
+            self.total_bytes = total
+
+
+def write_atomic(path, data):
+    temporary = '%s.%d.%d.tmp' % (path, os.getpid(), get_ident())
+    with open(temporary, 'wb') as output:
+        output.write(data)
+    os.replace(temporary, path)
@@ -0,0 +1,191 @@
+#----------------------------------------------------------------------------#
+# Imports.
+#----------------------------------------------------------------------------#
+import json
+import os
+import socket
+import time
+import traceback
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+
+from models import Job, db
+
+
+#----------------------------------------------------------------------------#
+# Tasks.
+#----------------------------------------------------------------------------#
+# Slow side effects run outside of the request: a handler enqueues a job
+# in its own transaction (so the job exists only if the write commits),
+# and `flask worker` processes run the jobs. A failing job is retried with
+# exponential backoff up to its max_attempts, then marked failed.
+TASKS = {}
+
+
+def task(name):
+    """Register a function as the task ``name``; it is called with the
+    keyword arguments given to ``enqueue``."""
+    def register(function):
+        TASKS[name] = function
+        return function
+    return register
+
+
+def enqueue(session, name, payload=None, delay=None, run_at=None,
+            max_attempts=5):
+    """Add a job to ``session``; it is queued when the session commits."""
+    if name not in TASKS:
+        raise KeyError('unknown task: %s' % name)
+    now = datetime.utcnow()
+    if run_at is None:
+        run_at = now + timedelta(seconds=delay or 0)
+    job = Job(name=name, payload=json.dumps(payload or {}), status='queued',
+              attempts=0, max_attempts=max_attempts, run_at=run_at,
+              created_at=now)
+    session.add(job)
+    return job
+
+
+#----------------------------------------------------------------------------#
+# Worker.
+#----------------------------------------------------------------------------#
+def claim(session, worker_id):
+    """Take the next due job, or return None.
+
+    On postgres, FOR UPDATE SKIP LOCKED lets workers pick different
+    jobs without waiting on each other; the conditional update makes the
+    claim safe on databases without it.
+    """
+    now = datetime.utcnow()
+    job_id = (
+        session.query(Job.id)
+        .filter(Job.status == 'queued')
+        .filter(Job.run_at <= now)
+        .order_by(Job.run_at, Job.id)
+        .with_for_update(skip_locked=True)
+        .limit(1)
+        .scalar()
+    )
+    if job_id is None:
+        session.commit()
+        return None
+    claimed = (
+        session.query(Job)
+        .filter(Job.id == job_id, Job.status == 'queued')
+        .update({'status': 'running', 'attempts': Job.attempts + 1,
+                 'started_at': now, 'locked_by': worker_id},
+                synchronize_session=False)
+    )
+    session.commit()
+    if not claimed:
+        return None
+    return session.query(Job).get(job_id)
+
+
+def run_job(session, job, retry_backoff, metrics=None):
+    started = time.perf_counter()
+    if metrics is not None:
+        metrics.observe('fyyur_job_latency_seconds', (('task', job.name),),
+                        max(0.0, (job.started_at - job.run_at)
+                            .total_seconds()))
+    try:
+        TASKS[job.name](**json.loads(job.payload))
+        session.commit()
+    except Exception:
+        session.rollback()
+        job = session.query(Job).get(job.id)
+        job.last_error = traceback.format_exc()
+        job.locked_by = None
+        if job.attempts < job.max_attempts:
+            job.status = 'queued'
+            job.run_at = datetime.utcnow() + timedelta(
+                seconds=retry_backoff * 2 ** (job.attempts - 1))
+        else:
+            job.status = 'failed'
+            job.finished_at = datetime.utcnow()
+        outcome = job.status
+    else:
+        job.status = 'done'
+        job.finished_at = datetime.utcnow()
+        job.locked_by = None
+        outcome = 'done'
+    session.commit()
+    if metrics is not None:
+        metrics.inc('fyyur_jobs_total', (('task', job.name),
+                                         ('outcome', outcome)))
+        metrics.observe('fyyur_job_duration_seconds', (('task', job.name),),
+                        time.perf_counter() - started)
+        metrics.flush()
+
+
+def requeue_stale(session, timeout):
+    # jobs left running by a worker that died are queued again
+    stale = datetime.utcnow() - timedelta(seconds=timeout)
+    (session.query(Job)
+     .filter(Job.status == 'running', Job.started_at < stale)
+     .update({'status': 'queued', 'locked_by': None},
+             synchronize_session=False))
+    session.commit()
+
+
+def schedule_periodic(session, schedule):
+    # schedule: {task name: interval in seconds}. A periodic task is
+    # queued again when no job of it is waiting or running
+    for name, interval in schedule.items():
+        pending = (session.query(Job.id)
+                   .filter(Job.name == name)
+                   .filter(Job.status.in_(('queued', 'running')))
+                   .first())
+        if pending is None:
+            enqueue(session, name, delay=interval)
+    session.commit()
+
+
+def work(app, metrics=None, burst=False):
+    """Run jobs until stopped (or, with ``burst``, until none is due)."""
+    config = app.config
+    worker_id = '%s:%d' % (socket.gethostname(), os.getpid())
+    last_maintenance = 0.0
+    with app.app_context():
+        session = db.session
+        while True:
+            if time.monotonic() - last_maintenance > config['JOB_POLL_INTERVAL'] * 10:
+                requeue_stale(session, config['JOB_TIMEOUT'])
+                schedule_periodic(session, config['JOB_SCHEDULE'])
+                last_maintenance = time.monotonic()
+            job = claim(session, worker_id)
+            if job is not None:
+                app.logger.info('running job %s (%s)', job.id, job.name)
+                run_job(session, job, config['JOB_RETRY_BACKOFF'], metrics)
+                continue
+            if burst:
+                return
+            time.sleep(config['JOB_POLL_INTERVAL'])
+
+
+def queue_stats(session):
+    """Queue depth per status, and age of the oldest due job."""
+    now = datetime.utcnow()
+    counts = dict(session.query(Job.status, func.count(Job.id))
+                  .group_by(Job.status).all())
+    oldest_due = (session.query(func.min(Job.run_at))
+                  .filter(Job.status == 'queued', Job.run_at <= now)
+                  .scalar())
+    return {
+        'counts': counts,
+        'oldest_due_seconds': ((now - oldest_due).total_seconds()
+                               if oldest_due else 0.0),
+    }
+
+
+#----------------------------------------------------------------------------#
+# Housekeeping task.
+#----------------------------------------------------------------------------#
+@task('purge_jobs')
+def purge_jobs(days=7):
+    # finished jobs are kept for a week, then deleted
+    before = datetime.utcnow() - timedelta(days=days)
+    (db.session.query(Job)
+     .filter(Job.status.in_(('done', 'failed')), Job.finished_at < before)
+     .delete(synchronize_session=False))
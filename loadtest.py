@@ -0,0 +1,255 @@
+#----------------------------------------------------------------------------#
+# Load test.
+#----------------------------------------------------------------------------#
+# Drives a running Fyyur instance with a traffic mix like the real one:
+# mostly list and detail pages, some searches and a few creates. Each
+# virtual user sends requests back to back on its own connection; the
+# test is run at increasing numbers of users, and a line is printed per
+# level (throughput, latency percentiles, errors), which gives the
+# saturation curve. Only the standard library is used.
+#
+#   flask seed --venues 100 --artists 200 --shows 2000
+#   gunicorn -w 4 app:app
+#   python loadtest.py http://127.0.0.1:8000 --users 1,2,4,8,16,32
+#
+# With --api-keys (keys of the server's FYYUR_RATELIMIT_API_KEYS), the
+# virtual users send them in turn as X-API-Key, so the rate limits apply
+# per key as they would to real clients; without, all the users share the
+# bucket of their address. Answers 429 and 503 are counted apart from the
+# errors, which are the other 4xx and 5xx answers and failed requests.
+import argparse
+import asyncio
+import itertools
+import random
+import re
+import sys
+import time
+import urllib.request
+from datetime import datetime, timedelta
+from urllib.parse import urlencode, urlsplit
+
+
+# (weight, method, path, form). Paths and forms may use {venue_id} and
+# {artist_id}, drawn among the ids listed by the server, {n}, a unique
+# number, and {start_time}, a show slot no other show of the run takes.
+TRAFFIC_MIX = [
+    (25, 'GET', '/venues', None),
+    (20, 'GET', '/shows', None),
+    (15, 'GET', '/venues/{venue_id}', None),
+    (15, 'GET', '/artists/{artist_id}', None),
+    (10, 'GET', '/artists', None),
+    (4, 'POST', '/venues/search', {'search_term': 'hall'}),
+    (4, 'POST', '/artists/search', {'search_term': 'artist 1'}),
+    (3, 'GET', '/', None),
+    (2, 'GET', '/shows/calendar', None),
+    (1, 'POST', '/artists/create', {
+        'name': 'Load test artist {n}', 'city': 'Austin', 'state': 'TX',
+        'phone': '555-000-0000', 'genres': 'Jazz',
+        'facebook_link': 'https://www.facebook.com/loadtest'}),
+    (1, 'POST', '/shows/create', {
+        'artist_id': '{artist_id}', 'venue_id': '{venue_id}',
+        'start_time': '{start_time}', 'duration': '30'}),
+]
+
+# Created shows take the next half-hour slot after a date drawn once per
+# run after 2100, so they overlap neither each other nor, but for a tiny
+# chance, the shows of an earlier run
+SLOT = timedelta(minutes=30)
+
+
+def show_slots(rng):
+    first = datetime(2100, 1, 1) + timedelta(days=rng.randrange(1000000))
+    return (first + number * SLOT for number in itertools.count())
+
+
+def listed_ids(url, kind):
+    # ids of the venues (or artists) linked from their list page
+    with urllib.request.urlopen('%s/%s' % (url.rstrip('/'), kind)) as page:
+        html = page.read().decode()
+    return sorted({int(row_id) for row_id
+                   in re.findall(r'href="/%s/(\d+)"' % kind, html)})
+
+
+class Connection(object):
+    """A keep-alive HTTP/1.1 connection (reopened when the server
+    closes it)."""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = self.writer = None
+
+    async def request(self, method, path, headers, body=b''):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(
+                self.host, self.port)
+        lines = ['%s %s HTTP/1.1' % (method, path),
+                 'Host: %s:%d' % (self.host, self.port),
+                 'Content-Length: %d' % len(body)]
+        lines.extend('%s: %s' % header for header in headers.items())
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode() + body)
+        await self.writer.drain()
+        return await self.read_response()
+
+    async def read_response(self):
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError('connection closed by the server')
+        version, status = status_line.split()[:2]
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        elif 'content-length' in headers:
+            await self.reader.readexactly(int(headers['content-length']))
+        else:
+            await self.reader.read()
+            self.close()
+        if (version == b'HTTP/1.0'
+                or headers.get('connection', '').lower() == 'close'):
+            self.close()
+        return int(status)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+def pick(rng, mix):
+    total = sum(weight for weight, _, _, _ in mix)
+    point = rng.uniform(0, total)
+    for weight, method, path, form in mix:
+        point -= weight
+        if point <= 0:
+            return method, path, form
+    return mix[-1][1:]
+
+
+def fill(template, values):
+    return template.format(**values)
+
+
+async def virtual_user(number, options, deadline, slots, results):
+    rng = random.Random(number)
+    split = urlsplit(options.url)
+    connection = Connection(split.hostname, split.port or 80)
+    headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+    if options.api_keys:
+        keys = options.api_keys.split(',')
+        headers['X-API-Key'] = keys[number % len(keys)]
+    sent = 0
+    while time.monotonic() < deadline:
+        method, path, form = pick(rng, TRAFFIC_MIX)
+        sent += 1
+        values = {'venue_id': rng.choice(options.venue_ids),
+                  'artist_id': rng.choice(options.artist_ids),
+                  'n': '%d-%d' % (number, sent)}
+        path = fill(path, values)
+        body = b''
+        if form is not None:
+            if 'start_time' in form:
+                values['start_time'] = next(slots).strftime(
+                    '%Y-%m-%d %H:%M:%S')
+            body = urlencode({key: fill(value, values)
+                              for key, value in form.items()}).encode()
+        start = time.perf_counter()
+        try:
+            status = await connection.request(method, path, headers, body)
+        except (OSError, ValueError, asyncio.IncompleteReadError):
+            connection.close()
+            status = None
+        results.append((status, time.perf_counter() - start))
+    connection.close()
+
+
+def percentile(ordered, share):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))]
+
+
+async def run_level(users, options, slots):
+    results = []
+    deadline = time.monotonic() + options.duration
+    start = time.perf_counter()
+    await asyncio.gather(*(virtual_user(number, options, deadline, slots,
+                                        results)
+                           for number in range(users)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for _, latency in results)
+    errors = sum(1 for status, _ in results
+                 if status is None
+                 or status >= 400 and status not in (429, 503))
+    shed = sum(1 for status, _ in results if status in (429, 503))
+    return {
+        'users': users,
+        'requests': len(results),
+        'throughput': len(results) / elapsed,
+        'p50': percentile(latencies, 0.50) * 1000,
+        'p90': percentile(latencies, 0.90) * 1000,
+        'p99': percentile(latencies, 0.99) * 1000,
+        'errors': 100.0 * errors / (len(results) or 1),
+        'limited': 100.0 * shed / (len(results) or 1),
+    }
+
+
+COLUMNS = ('users', 'requests', 'throughput', 'p50', 'p90', 'p99',
+           'errors', 'limited')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Load test a running Fyyur instance.')
+    parser.add_argument('url', help='Base url, e.g. http://127.0.0.1:5000')
+    parser.add_argument('--users', default='1,2,4,8,16,32',
+                        help='Comma separated numbers of concurrent users.')
+    parser.add_argument('--duration', type=float, default=30,
+                        help='Seconds of each concurrency level.')
+    parser.add_argument('--csv', help='Also write the results to this file.')
+    parser.add_argument('--api-keys',
+                        help='Comma separated API keys allowed by the '
+                             'server, sent in turn by the users.')
+    options = parser.parse_args(argv)
+
+    # only the venues and artists of the database are requested
+    options.venue_ids = listed_ids(options.url, 'venues')
+    options.artist_ids = listed_ids(options.url, 'artists')
+    if not options.venue_ids or not options.artist_ids:
+        parser.error('no venue or no artist listed by %s: seed the '
+                     'database first' % options.url)
+    slots = show_slots(random.Random())
+
+    print('%6s %9s %10s %9s %9s %9s %7s %8s' % (
+        'users', 'requests', 'req/s', 'p50 ms', 'p90 ms', 'p99 ms',
+        'errors', 'limited'))
+    levels = []
+    for users in [int(users) for users in options.users.split(',')]:
+        level = asyncio.run(run_level(users, options, slots))
+        levels.append(level)
+        print('%(users)6d %(requests)9d %(throughput)10.1f %(p50)9.1f '
+              '%(p90)9.1f %(p99)9.1f %(errors)6.2f%% %(limited)7.2f%%'
+              % level)
+        sys.stdout.flush()
+
+    if options.csv:
+        with open(options.csv, 'w') as csv_file:
+            csv_file.write(','.join(COLUMNS) + '\n')
+            for level in levels:
+                csv_file.write(','.join(str(level[column])
+                                        for column in COLUMNS) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+#----------------------------------------------------------------------------#
+# Imports.
+#----------------------------------------------------------------------------#
+import atexit
+import copy
+import json
+import logging
+import queue
+import random
+import sys
+import time
+import uuid
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import g, request, has_request_context
+
+
+#----------------------------------------------------------------------------#
+# Structured logging.
+#----------------------------------------------------------------------------#
+# Records are written as one json object per line. The request path only
+# puts records on a queue; a background thread formats them and does the
+# file / stdout I/O.
+REQUEST_FIELDS = ('request_id', 'route', 'method', 'path', 'status',
+                  'duration_ms')
+
+
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record):
+        entry = {
+            'ts': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in REQUEST_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class JsonQueueHandler(QueueHandler):
+    # QueueHandler merges the traceback into the message before queuing
+    # the record; keep it apart so that it gets its own json field
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(
+                record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class RequestContextFilter(logging.Filter):
+    # adds the request id and route of the current request. Runs before
+    # the record is queued, while the request context is still there
+
+    def filter(self, record):
+        if has_request_context():
+            if getattr(record, 'request_id', None) is None:
+                record.request_id = g.get('request_id')
+            if getattr(record, 'route', None) is None:
+                record.route = request.endpoint
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    # keeps a `rate` share of the INFO records logged with
+    # extra={'sampled': True} (high-frequency events such as the access
+    # log). Other records are always kept
+
+    def __init__(self, rate):
+        super(SamplingFilter, self).__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno == logging.INFO and getattr(record, 'sampled', False):
+            return random.random() < self.rate
+        return True
+
+
+def init_logging(app):
+    """Send the app logs, as json, through a queue to LOG_FILE/stdout."""
+    handlers = []
+    if app.config['LOG_FILE']:
+        handlers.append(logging.FileHandler(app.config['LOG_FILE']))
+    if app.config['LOG_STDOUT']:
+        handlers.append(logging.StreamHandler(sys.stdout))
+    formatter = JsonFormatter()
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    records = queue.Queue(-1)
+    queue_handler = JsonQueueHandler(records)
+    queue_handler.addFilter(RequestContextFilter())
+    queue_handler.addFilter(SamplingFilter(app.config['LOG_SAMPLE_RATE']))
+
+    listener = QueueListener(records, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    app.logger.handlers = [queue_handler]
+    app.logger.setLevel(app.config['LOG_LEVEL'])
+    app.logger.propagate = False
+
+    @app.before_request
+    def assign_request_id():
+        g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+        g._log_start = time.perf_counter()
+
+    @app.after_request
+    def log_request(response):
+        request_id = g.get('request_id')
+        start = g.get('_log_start')
+        if request_id is None:
+            return response
+        response.headers['X-Request-ID'] = request_id
+        fields = {
+            'request_id': request_id,
+            'route': request.endpoint,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'sampled': True,
+        }
+
+        # streamed bodies are sent after this hook
+        def done():
+            fields['duration_ms'] = round(
+                (time.perf_counter() - start) * 1000, 2)
+            app.logger.info('request', extra=fields)
+
+        response.call_on_close(done)
+        return response
+
+    return listener
@@ -0,0 +1,257 @@
+#----------------------------------------------------------------------------#
+# Imports.
+#----------------------------------------------------------------------------#
+import time
+from threading import Lock
+
+import numpy as np
+
+from models import parse_array
+
+
+#----------------------------------------------------------------------------#
+# Artist / venue matching.
+#----------------------------------------------------------------------------#
+# Every artist and venue is a row of arrays: its genres, one-hot; its
+# booking profile (the genres of the venues the artist played, or of the
+# artists the venue booked, added up); its coordinates and state. To
+# match one artist, its genre row is scored against the arrays of all the
+# venues at once, and the reverse, so a query costs a few vector
+# operations over the candidates and no (artists x venues) matrix is
+# ever built. Rows are updated in place when an artist, a venue or a show
+# is written.
+EARTH_RADIUS_KM = 6371.0
+
+TRUE_VALUES = ('true', 't', '1', 'y', 'yes')
+
+
+def is_seeking(value):
+    # seeking_venue / seeking_talent are stored as text
+    return str(value).lower() in TRUE_VALUES
+
+
+class Side(object):
+    """The arrays of the artists, or of the venues."""
+
+    def __init__(self, genre_count, capacity=1024):
+        self.count = 0
+        self.positions = {}
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.genres = np.zeros((capacity, genre_count), dtype=np.float32)
+        self.genre_norms = np.zeros(capacity, dtype=np.float32)
+        self.profiles = np.zeros((capacity, genre_count), dtype=np.float32)
+        self.profile_norms = np.zeros(capacity, dtype=np.float32)
+        self.latitudes = np.full(capacity, np.nan)
+        self.longitudes = np.full(capacity, np.nan)
+        self.states = np.full(capacity, -1, dtype=np.int32)
+        self.seeking = np.zeros(capacity, dtype=bool)
+        self.active = np.zeros(capacity, dtype=bool)
+
+    def position(self, row_id):
+        # row of ``row_id``, added when new (the arrays double when full)
+        position = self.positions.get(row_id)
+        if position is not None:
+            return position
+        if self.count == len(self.ids):
+            for name in ('ids', 'genres', 'genre_norms', 'profiles',
+                         'profile_norms', 'latitudes', 'longitudes',
+                         'states', 'seeking', 'active'):
+                array = getattr(self, name)
+                grown = np.empty((2 * len(array),) + array.shape[1:],
+                                 dtype=array.dtype)
+                grown[:len(array)] = array
+                grown[len(array):] = {'latitudes': np.nan,
+                                      'longitudes': np.nan,
+                                      'states': -1}.get(name, 0)
+                setattr(self, name, grown)
+        position = self.positions[row_id] = self.count
+        self.ids[position] = row_id
+        self.count += 1
+        return position
+
+    def add_profile(self, position, genres):
+        self.profiles[position] += genres
+        self.profile_norms[position] = np.linalg.norm(self.profiles[position])
+
+
+class MatchIndex(object):
+    """Suggests venues to an artist and artists to a venue.
+
+    A candidate's score is the weighted sum of:
+      - genres: cosine similarity of the genres of both;
+      - location: exp(-distance / distance_scale) when both are
+        geocoded, else 0.5 in the same state, else 0;
+      - history: cosine similarity between the genres of the one matched
+        and the booking profile of the candidate (a venue that booked
+        artists like this one, an artist who played venues like this one).
+    """
+
+    def __init__(self, genres, weights, distance_scale):
+        self.vocabulary = {genre: i for i, genre in enumerate(genres)}
+        self.weights = weights
+        self.distance_scale = distance_scale
+        self.state_codes = {}
+        self.artists = Side(len(genres))
+        self.venues = Side(len(genres))
+        self.built_at = None
+        self._lock = Lock()
+        self._codes_lock = Lock()
+
+    # updates ---------------------------------------------------------------
+    def one_hot(self, genres):
+        row = np.zeros(len(self.vocabulary), dtype=np.float32)
+        for genre in parse_array(genres):
+            if genre in self.vocabulary:
+                row[self.vocabulary[genre]] = 1.0
+        return row
+
+    def _set(self, side, row_id, genres, latitude, longitude, state, seeking):
+        position = side.position(row_id)
+        side.genres[position] = self.one_hot(genres)
+        side.genre_norms[position] = np.linalg.norm(side.genres[position])
+        side.latitudes[position] = np.nan if latitude is None \
+            else np.radians(latitude)
+        side.longitudes[position] = np.nan if longitude is None \
+            else np.radians(longitude)
+        side.states[position] = self.state_code(state)
+        side.seeking[position] = is_seeking(seeking)
+        side.active[position] = True
+
+    def state_code(self, state):
+        # also used by a build, outside of the lock of the index
+        state = (state or '').upper()
+        code = self.state_codes.get(state)
+        if code is None:
+            with self._codes_lock:
+                code = self.state_codes.setdefault(state,
+                                                   len(self.state_codes))
+        return code
+
+    def set_artist(self, artist_id, genres, latitude, longitude, state,
+                   seeking_venue):
+        with self._lock:
+            self._set(self.artists, artist_id, genres, latitude, longitude,
+                      state, seeking_venue)
+
+    def set_venue(self, venue_id, genres, latitude, longitude, state,
+                  seeking_talent):
+        with self._lock:
+            self._set(self.venues, venue_id, genres, latitude, longitude,
+                      state, seeking_talent)
+
+    def remove_artist(self, artist_id):
+        with self._lock:
+            position = self.artists.positions.get(artist_id)
+            if position is not None:
+                self.artists.active[position] = False
+
+    def remove_venue(self, venue_id):
+        with self._lock:
+            position = self.venues.positions.get(venue_id)
+            if position is not None:
+                self.venues.active[position] = False
+
+    def add_show(self, artist_id, venue_id):
+        with self._lock:
+            artist = self.artists.positions.get(artist_id)
+            venue = self.venues.positions.get(venue_id)
+            if artist is None or venue is None:
+                return
+            self.artists.add_profile(artist, self.venues.genres[venue])
+            self.venues.add_profile(venue, self.artists.genres[artist])
+
+    def build(self, artists, venues, shows):
+        """Fill the index from (id, genres, latitude, longitude, state,
+        seeking) rows of the artists and venues, and (artist_id,
+        venue_id) rows of the shows.
+
+        The new arrays are made outside of the lock: the index is used
+        as it was until they replace it. Updates made meanwhile are not
+        in them, unless the rows read were already updated."""
+        genre_count = len(self.vocabulary)
+        artist_side = Side(genre_count)
+        venue_side = Side(genre_count)
+        for row in artists:
+            self._set(artist_side, *row)
+        for row in venues:
+            self._set(venue_side, *row)
+        artist_positions = artist_side.positions
+        venue_positions = venue_side.positions
+        pairs = np.array(
+            [(artist_positions[artist_id], venue_positions[venue_id])
+             for artist_id, venue_id in shows
+             if artist_id in artist_positions
+             and venue_id in venue_positions],
+            dtype=np.int64).reshape(-1, 2)
+        np.add.at(artist_side.profiles, pairs[:, 0],
+                  venue_side.genres[pairs[:, 1]])
+        np.add.at(venue_side.profiles, pairs[:, 1],
+                  artist_side.genres[pairs[:, 0]])
+        for side in (artist_side, venue_side):
+            side.profile_norms[:side.count] = np.linalg.norm(
+                side.profiles[:side.count], axis=1)
+        with self._lock:
+            self.artists = artist_side
+            self.venues = venue_side
+            self.built_at = time.monotonic()
+
+    # queries ---------------------------------------------------------------
+    def venues_for_artist(self, artist_id, k, seeking_only=True):
+        return self._match(self.artists, self.venues, artist_id, k,
+                           seeking_only)
+
+    def artists_for_venue(self, venue_id, k, seeking_only=True):
+        return self._match(self.venues, self.artists, venue_id, k,
+                           seeking_only)
+
+    def _match(self, side, candidates, row_id, k, seeking_only):
+        """[(candidate id, score, {component: score})], best first, or
+        None if ``row_id`` is not in the index."""
+        with self._lock:
+            position = side.positions.get(row_id)
+            if position is None or not side.active[position]:
+                return None
+            n = candidates.count
+            genres = side.genres[position]
+            norm = side.genre_norms[position]
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                genre_score = np.nan_to_num(
+                    candidates.genres[:n] @ genres
+                    / (candidates.genre_norms[:n] * norm))
+                history_score = np.nan_to_num(
+                    candidates.profiles[:n] @ genres
+                    / (candidates.profile_norms[:n] * norm))
+
+            latitude = side.latitudes[position]
+            longitude = side.longitudes[position]
+            lat = candidates.latitudes[:n]
+            lon = candidates.longitudes[:n]
+            haversine = (np.sin((lat - latitude) / 2) ** 2
+                         + np.cos(latitude) * np.cos(lat)
+                         * np.sin((lon - longitude) / 2) ** 2)
+            distance = 2 * EARTH_RADIUS_KM * np.arcsin(
+                np.sqrt(np.clip(haversine, 0, 1)))
+            same_state = candidates.states[:n] == side.states[position]
+            location_score = np.where(
+                np.isnan(distance), 0.5 * same_state,
+                np.exp(-distance / self.distance_scale))
+
+            score = (self.weights['genres'] * genre_score
+                     + self.weights['location'] * location_score
+                     + self.weights['history'] * history_score)
+            eligible = candidates.active[:n].copy()
+            if seeking_only:
+                eligible &= candidates.seeking[:n]
+            score = np.where(eligible, score, -np.inf)
+
+            k = min(k, int(eligible.sum()))
+            if k <= 0:
+                return []
+            top = np.argpartition(-score, k - 1)[:k]
+            top = top[np.argsort(-score[top], kind='stable')]
+            return [(int(candidates.ids[i]), float(score[i]),
+                     {'genres': float(genre_score[i]),
+                      'location': float(location_score[i]),
+                      'history': float(history_score[i])})
+                    for i in top]
@@ -0,0 +1,275 @@
+#----------------------------------------------------------------------------#
+# Imports.
+#----------------------------------------------------------------------------#
+import glob
+import json
+import os
+import time
+from bisect import bisect_left
+from threading import Lock
+
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+#----------------------------------------------------------------------------#
+# Metrics registry.
+#----------------------------------------------------------------------------#
+# Metrics are kept per worker process. With several workers, each one
+# writes its metrics to METRICS_DIR/<pid>.json (at most every
+# METRICS_FLUSH_INTERVAL seconds) and /metrics adds up the files of all
+# workers. Counters and histograms of exited workers are kept, their
+# gauges are dropped. Global values (e.g. the job queue depth) are read
+# once, when /metrics is served, by the global collectors.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0)
+
+HELP = {
+    'fyyur_http_requests_total': ('counter', 'Requests handled.'),
+    'fyyur_http_request_duration_seconds': (
+        'histogram', 'Request latency, until the body is sent.'),
+    'fyyur_http_requests_in_flight': ('gauge', 'Requests being handled.'),
+    'fyyur_db_queries_total': ('counter', 'SQL statements executed.'),
+    'fyyur_db_pool_size': ('gauge', 'Connections the pool keeps open.'),
+    'fyyur_db_pool_checked_out': ('gauge', 'Connections in use.'),
+    'fyyur_db_pool_overflow': ('gauge', 'Connections open above the pool size.'),
+    'fyyur_cache_hits_total': ('counter', 'Cache lookups answered.'),
+    'fyyur_cache_misses_total': ('counter', 'Cache lookups missed.'),
+    'fyyur_jobs_total': ('counter', 'Background jobs run, by outcome.'),
+    'fyyur_job_latency_seconds': (
+        'histogram', 'Time between a job being due and being started.'),
+    'fyyur_job_duration_seconds': ('histogram', 'Background job run time.'),
+    'fyyur_job_queue_depth': ('gauge', 'Background jobs, by status.'),
+    'fyyur_job_oldest_due_seconds': (
+        'gauge', 'Age of the oldest due job not started yet.'),
+}
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Metrics(object):
+
+    def __init__(self, directory=None, flush_interval=5.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.collectors = []
+        self.global_collectors = []
+        self._last_flush = 0.0
+        self._lock = Lock()
+
+    # recording -------------------------------------------------------------
+    def inc(self, name, labels=(), amount=1):
+        key = (name, tuple(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set_counter(self, name, labels, value):
+        # for totals counted elsewhere (e.g. cache hits)
+        with self._lock:
+            self.counters[(name, tuple(labels))] = value
+
+    def set_gauge(self, name, labels, value):
+        with self._lock:
+            self.gauges[(name, tuple(labels))] = value
+
+    def add_gauge(self, name, labels, amount):
+        key = (name, tuple(labels))
+        with self._lock:
+            self.gauges[key] = self.gauges.get(key, 0) + amount
+
+    def observe(self, name, labels, value):
+        key = (name, tuple(labels))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {
+                    'buckets': [0] * (len(LATENCY_BUCKETS) + 1),
+                    'sum': 0.0, 'count': 0}
+            histogram['buckets'][bisect_left(LATENCY_BUCKETS, value)] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def collect(self):
+        for collector in self.collectors:
+            collector(self)
+
+    # multiprocess ----------------------------------------------------------
+    def snapshot(self):
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'counters': [[n, l, v] for (n, l), v in self.counters.items()],
+                'gauges': [[n, l, v] for (n, l), v in self.gauges.items()],
+                'histograms': [[n, l, h] for (n, l), h
+                               in self.histograms.items()],
+            }
+
+    def flush(self, force=False):
+        if not self.directory:
+            return
+        now = time.time()
+        if not force and now - self._last_flush < self.flush_interval:
+            return
+        self._last_flush = now
+        self.collect()
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, '%d.json' % os.getpid())
+        with open(path + '.tmp', 'w') as snapshot_file:
+            json.dump(self.snapshot(), snapshot_file)
+        os.replace(path + '.tmp', path)
+
+    def merged(self):
+        # snapshots of all the worker processes, added up
+        if not self.directory:
+            self.collect()
+            snapshots = [self.snapshot()]
+        else:
+            self.flush(force=True)
+            snapshots = []
+            for path in glob.glob(os.path.join(self.directory, '*.json')):
+                try:
+                    with open(path) as snapshot_file:
+                        snapshots.append(json.load(snapshot_file))
+                except (OSError, ValueError):
+                    continue
+
+        counters, gauges, histograms = {}, {}, {}
+        for snapshot in snapshots:
+            alive = pid_alive(snapshot['pid'])
+            for name, labels, value in snapshot['counters']:
+                key = (name, tuple(tuple(label) for label in labels))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, value in snapshot['gauges'] if alive else ():
+                key = (name, tuple(tuple(label) for label in labels))
+                gauges[key] = gauges.get(key, 0) + value
+            for name, labels, histogram in snapshot['histograms']:
+                key = (name, tuple(tuple(label) for label in labels))
+                total = histograms.setdefault(key, {
+                    'buckets': [0] * (len(LATENCY_BUCKETS) + 1),
+                    'sum': 0.0, 'count': 0})
+                for i, count in enumerate(histogram['buckets']):
+                    total['buckets'][i] += count
+                total['sum'] += histogram['sum']
+                total['count'] += histogram['count']
+        return counters, gauges, histograms
+
+    # exposition ------------------------------------------------------------
+    def exposition(self):
+        """All metrics in the Prometheus text format."""
+        counters, gauges, histograms = self.merged()
+        by_name = {}
+        for values in (counters, gauges):
+            for (name, labels), value in values.items():
+                by_name.setdefault(name, []).append((labels, value))
+        for (name, labels), histogram in histograms.items():
+            by_name.setdefault(name, []).append((labels, histogram))
+        for collector in self.global_collectors:
+            for name, labels, value in collector():
+                by_name.setdefault(name, []).append((tuple(labels), value))
+
+        lines = []
+        for name in sorted(by_name):
+            kind, text = HELP.get(name, ('untyped', name))
+            lines.append('# HELP %s %s' % (name, text))
+            lines.append('# TYPE %s %s' % (name, kind))
+            for labels, value in sorted(by_name[name], key=lambda s: s[0]):
+                if kind != 'histogram':
+                    lines.append('%s%s %s' % (name, format_labels(labels),
+                                              value))
+                    continue
+                cumulative = 0
+                bounds = [str(b) for b in LATENCY_BUCKETS] + ['+Inf']
+                for bound, count in zip(bounds, value['buckets']):
+                    cumulative += count
+                    lines.append('%s_bucket%s %d' % (
+                        name, format_labels(labels + (('le', bound),)),
+                        cumulative))
+                lines.append('%s_sum%s %s' % (name, format_labels(labels),
+                                              value['sum']))
+                lines.append('%s_count%s %d' % (name, format_labels(labels),
+                                                value['count']))
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join(
+        '%s="%s"' % (key, str(value).replace('\\', '\\\\')
+                     .replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in labels)
+
+
+#----------------------------------------------------------------------------#
+# Flask integration.
+#----------------------------------------------------------------------------#
+def init_metrics(app, metrics, db, caches):
+    """Record request, database and cache metrics of ``app``.
+
+    ``caches`` maps a cache name to an object with hits and misses
+    attributes (see cache.LRUCache).
+    """
+
+    def count_query(*args):
+        metrics.inc('fyyur_db_queries_total')
+
+    event.listen(Engine, 'after_cursor_execute', count_query)
+
+    def collect_pool(metrics):
+        pool = db.get_engine(app).pool
+        # only QueuePool knows its size (not sqlite's pools)
+        if hasattr(pool, 'checkedout'):
+            metrics.set_gauge('fyyur_db_pool_checked_out', (),
+                              pool.checkedout())
+            metrics.set_gauge('fyyur_db_pool_size', (), pool.size())
+            metrics.set_gauge('fyyur_db_pool_overflow', (),
+                              max(0, pool.overflow()))
+
+    def collect_caches(metrics):
+        for name, cache in caches.items():
+            metrics.set_counter('fyyur_cache_hits_total',
+                                (('cache', name),), cache.hits)
+            metrics.set_counter('fyyur_cache_misses_total',
+                                (('cache', name),), cache.misses)
+
+    metrics.collectors.extend([collect_pool, collect_caches])
+
+    @app.before_request
+    def start_request_metrics():
+        g._metrics_start = time.perf_counter()
+        metrics.add_gauge('fyyur_http_requests_in_flight', (), 1)
+
+    @app.after_request
+    def finish_request_metrics(response):
+        start = g.get('_metrics_start')
+        if start is None:
+            return response
+        endpoint = request.endpoint or 'unknown'
+        method, status = request.method, response.status_code
+
+        # streamed bodies are sent after this hook: the request is over
+        # when the response is closed
+        def done():
+            metrics.add_gauge('fyyur_http_requests_in_flight', (), -1)
+            metrics.inc('fyyur_http_requests_total', (
+                ('endpoint', endpoint), ('method', method),
+                ('status', status)))
+            metrics.observe('fyyur_http_request_duration_seconds',
+                            (('endpoint', endpoint),),
+                            time.perf_counter() - start)
+            metrics.flush()
+
+        response.call_on_close(done)
+        return response
@@ -0,0 +1,51 @@
+"""show duration and overlap constraints
+
+Revision ID: 8e4f0c6d2b17
+Revises: 5b1d7e2a9c40
+Create Date: 2026-10-19 10:03:12.540117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e4f0c6d2b17'
+down_revision = '5b1d7e2a9c40'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('Show', sa.Column('duration', sa.Integer(),
+                                    server_default='120', nullable=False))
+    op.create_index('ix_show_venue_start', 'Show',
+                    ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_show_artist_start', 'Show',
+                    ['artist_id', 'start_time'], unique=False)
+
+    # a venue (or an artist) cannot have two shows overlapping in time.
+    # The GiST indexes behind these constraints keep the check
+    # logarithmic; btree_gist is needed for the equality on the ids.
+    # Upgrading fails if overlapping shows are already stored.
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    op.execute(
+        'ALTER TABLE "Show" ADD CONSTRAINT show_venue_no_overlap '
+        'EXCLUDE USING gist (venue_id WITH =, '
+        "tsrange(start_time, start_time + duration * interval '1 minute') "
+        'WITH &&)'
+    )
+    op.execute(
+        'ALTER TABLE "Show" ADD CONSTRAINT show_artist_no_overlap '
+        'EXCLUDE USING gist (artist_id WITH =, '
+        "tsrange(start_time, start_time + duration * interval '1 minute') "
+        'WITH &&)'
+    )
+
+
+def downgrade():
+    op.execute('ALTER TABLE "Show" DROP CONSTRAINT show_artist_no_overlap')
+    op.execute('ALTER TABLE "Show" DROP CONSTRAINT show_venue_no_overlap')
+    op.drop_index('ix_show_artist_start', table_name='Show')
+    op.drop_index('ix_show_venue_start', table_name='Show')
+    op.drop_column('Show', 'duration')
@@ -0,0 +1,31 @@
+"""change feed positions given at commit
+
+Revision ID: b9d4f7a2e6c3
+Revises: e6b2d8f40c15
+Create Date: 2026-10-19 21:40:08.315472
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b9d4f7a2e6c3'
+down_revision = 'e6b2d8f40c15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('Change', sa.Column('position', sa.BigInteger(),
+                                      nullable=True))
+    # the changes already committed keep their order, and consumers
+    # their cursor
+    op.execute('UPDATE "Change" SET position = id')
+    op.create_index(op.f('ix_Change_position'), 'Change', ['position'],
+                    unique=True)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_Change_position'), table_name='Change')
+    op.drop_column('Change', 'position')
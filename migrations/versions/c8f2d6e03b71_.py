@@ -0,0 +1,31 @@
+"""normalize venue and artist genres
+
+Revision ID: c8f2d6e03b71
+Revises: b4e7a1c95d28
+Create Date: 2026-10-19 17:24:10.337518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from backfill import run_in_migration
+
+
+# revision identifiers, used by Alembic.
+revision = 'c8f2d6e03b71'
+down_revision = 'b4e7a1c95d28'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # data only: rewritten in small batches outside of the migration
+    # transaction, so the tables are not locked while it runs. If the
+    # upgrade is interrupted, running it again goes on from the last batch
+    run_in_migration(op, 'venue_genres', batch_size=1000, pause=0.05)
+    run_in_migration(op, 'artist_genres', batch_size=1000, pause=0.05)
+
+
+def downgrade():
+    # the normalized genres are kept
+    pass
@@ -0,0 +1,162 @@
+"""partition Show by month, show archive
+
+Revision ID: f3b8c2d90a41
+Revises: e1f84a0b7c39
+Create Date: 2026-10-19 16:42:08.318240
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b8c2d90a41'
+down_revision = 'e1f84a0b7c39'
+branch_labels = None
+depends_on = None
+
+
+COLUMNS = 'id, start_time, duration, artist_id, venue_id'
+
+# monthly partitions created ahead of the current month; later ones are
+# created by `flask partitions create`
+MONTHS_AHEAD = 3
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def add_overlap_constraints(table):
+    for column in ('venue_id', 'artist_id'):
+        op.execute(
+            'ALTER TABLE "%s" ADD CONSTRAINT "%s_%s_no_overlap" '
+            'EXCLUDE USING gist (%s WITH =, '
+            "tsrange(start_time, start_time + duration * interval '1 minute') "
+            'WITH &&)' % (table, table, column.split('_')[0], column))
+
+
+def upgrade():
+    op.create_table('Show_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('start_time', sa.DateTime(), nullable=False),
+    sa.Column('duration', sa.Integer(), server_default='120', nullable=False),
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['artist_id'], ['Artist.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['venue_id'], ['Venue.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_show_archive_venue_start', 'Show_archive',
+                    ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_show_archive_artist_start', 'Show_archive',
+                    ['artist_id', 'start_time'], unique=False)
+
+    # the shows are copied to a new, partitioned table. The primary key
+    # of a partitioned table must hold the partition key: it becomes
+    # (id, start_time), ids still come from the same sequence
+    op.execute('ALTER TABLE "Show" RENAME TO "Show_unpartitioned"')
+    for constraint in ('show_venue_no_overlap', 'show_artist_no_overlap',
+                       'Show_artist_id_fkey', 'Show_venue_id_fkey',
+                       'Show_pkey'):
+        op.execute('ALTER TABLE "Show_unpartitioned" DROP CONSTRAINT "%s"'
+                   % constraint)
+    for index in ('ix_show_venue_start', 'ix_show_artist_start',
+                  'ix_Show_start_time'):
+        op.execute('DROP INDEX "%s"' % index)
+
+    op.execute(
+        'CREATE TABLE "Show" ('
+        'id integer NOT NULL DEFAULT nextval(\'"Show_id_seq"\'::regclass), '
+        'start_time timestamp without time zone NOT NULL, '
+        'duration integer NOT NULL DEFAULT 120, '
+        'artist_id integer NOT NULL, '
+        'venue_id integer NOT NULL, '
+        'CONSTRAINT "Show_pkey" PRIMARY KEY (id, start_time), '
+        'CONSTRAINT "Show_artist_id_fkey" FOREIGN KEY (artist_id) '
+        'REFERENCES "Artist" (id) ON DELETE CASCADE, '
+        'CONSTRAINT "Show_venue_id_fkey" FOREIGN KEY (venue_id) '
+        'REFERENCES "Venue" (id) ON DELETE CASCADE'
+        ') PARTITION BY RANGE (start_time)')
+    op.create_index('ix_Show_start_time', 'Show', ['start_time'],
+                    unique=False)
+    op.create_index('ix_show_venue_start', 'Show',
+                    ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_show_artist_start', 'Show',
+                    ['artist_id', 'start_time'], unique=False)
+
+    op.execute('CREATE TABLE "Show_default" PARTITION OF "Show" DEFAULT')
+    add_overlap_constraints('Show_default')
+    first = op.get_bind().execute(sa.text(
+        'SELECT min(start_time) FROM "Show_unpartitioned"')).scalar()
+    now = datetime.now()
+    month = datetime((first or now).year, (first or now).month, 1)
+    last = add_months(datetime(now.year, now.month, 1), MONTHS_AHEAD)
+    while month <= last:
+        name = 'Show_p%04d%02d' % (month.year, month.month)
+        op.execute(
+            "CREATE TABLE \"%s\" PARTITION OF \"Show\" "
+            "FOR VALUES FROM ('%s') TO ('%s')"
+            % (name, month.isoformat(' '),
+               add_months(month, 1).isoformat(' ')))
+        add_overlap_constraints(name)
+        month = add_months(month, 1)
+
+    op.execute('INSERT INTO "Show" (%s) SELECT %s FROM "Show_unpartitioned"'
+               % (COLUMNS, COLUMNS))
+    op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY "Show".id')
+    op.execute('DROP TABLE "Show_unpartitioned"')
+
+
+def downgrade():
+    # archived shows are put back with the others
+    op.execute('ALTER TABLE "Show" RENAME TO "Show_partitioned"')
+    op.execute('ALTER TABLE "Show_partitioned" '
+               'RENAME CONSTRAINT "Show_pkey" TO "Show_partitioned_pkey"')
+    for index in ('ix_show_venue_start', 'ix_show_artist_start',
+                  'ix_Show_start_time'):
+        op.execute('ALTER INDEX "%s" RENAME TO "%s_partitioned"'
+                   % (index, index))
+    op.execute(
+        'CREATE TABLE "Show" ('
+        'id integer NOT NULL DEFAULT nextval(\'"Show_id_seq"\'::regclass), '
+        'start_time timestamp without time zone NOT NULL, '
+        'duration integer NOT NULL DEFAULT 120, '
+        'artist_id integer NOT NULL, '
+        'venue_id integer NOT NULL, '
+        'CONSTRAINT "Show_pkey" PRIMARY KEY (id))')
+    op.execute('INSERT INTO "Show" (%s) SELECT %s FROM "Show_partitioned" '
+               'UNION ALL SELECT %s FROM "Show_archive"'
+               % (COLUMNS, COLUMNS, COLUMNS))
+    op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY "Show".id')
+    op.execute('DROP TABLE "Show_partitioned"')
+
+    op.create_foreign_key('Show_artist_id_fkey', 'Show', 'Artist',
+                          ['artist_id'], ['id'], ondelete='CASCADE')
+    op.create_foreign_key('Show_venue_id_fkey', 'Show', 'Venue',
+                          ['venue_id'], ['id'], ondelete='CASCADE')
+    op.create_index('ix_Show_start_time', 'Show', ['start_time'],
+                    unique=False)
+    op.create_index('ix_show_venue_start', 'Show',
+                    ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_show_artist_start', 'Show',
+                    ['artist_id', 'start_time'], unique=False)
+    op.execute(
+        'ALTER TABLE "Show" ADD CONSTRAINT show_venue_no_overlap '
+        'EXCLUDE USING gist (venue_id WITH =, '
+        "tsrange(start_time, start_time + duration * interval '1 minute') "
+        'WITH &&)'
+    )
+    op.execute(
+        'ALTER TABLE "Show" ADD CONSTRAINT show_artist_no_overlap '
+        'EXCLUDE USING gist (artist_id WITH =, '
+        "tsrange(start_time, start_time + duration * interval '1 minute') "
+        'WITH &&)'
+    )
+
+    op.drop_index('ix_show_archive_artist_start', table_name='Show_archive')
+    op.drop_index('ix_show_archive_venue_start', table_name='Show_archive')
+    op.drop_table('Show_archive')
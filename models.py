@@ -5,6 +5,10 @@ from flask import Flask
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
+import sqlite3
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.types import TypeDecorator
 
 
 #----------------------------------------------------------------------------#
@@ -15,6 +19,65 @@ from flask_migrate import Migrate
 db = SQLAlchemy()
 
 
+@event.listens_for(Engine, 'connect')
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    # sqlite only enforces foreign keys (and so ON DELETE CASCADE) when
+    # asked to, on each connection
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
+
+def array_literal(values):
+    # the text of a postgres array, e.g. '{Jazz,"Rock n Roll"}'
+    items = []
+    for value in values:
+        if (not value or value.upper() == 'NULL'
+                or any(c in value for c in '{}",\\ \t\n')):
+            value = '"%s"' % value.replace('\\', '\\\\').replace('"', '\\"')
+        items.append(value)
+    return '{%s}' % ','.join(items)
+
+
+def parse_array(text):
+    # the values of a postgres array text, e.g. ['Jazz', 'Rock n Roll']
+    if not text or not text.startswith('{'):
+        return [text] if text else []
+    values, value, quoted, escaped = [], '', False, False
+    for c in text[1:-1]:
+        if escaped:
+            value += c
+            escaped = False
+        elif c == '\\':
+            escaped = True
+        elif c == '"':
+            quoted = not quoted
+        elif c == ',' and not quoted:
+            values.append(value)
+            value = ''
+        else:
+            value += c
+    if value or text[1:-1]:
+        values.append(value)
+    return values
+
+
+class Genres(TypeDecorator):
+    """Genres, stored as text in the format of a postgres array.
+
+    psycopg2 sends the list of a multiple select as an array, which
+    postgres casts to text; formatting the list here stores the same text
+    on every database.
+    """
+    impl = db.String
+
+    def process_bind_param(self, value, dialect):
+        if isinstance(value, (list, tuple)):
+            return array_literal(value)
+        return value
+
+
 #----------------------------------------------------------------------------#
 # Models.
 #----------------------------------------------------------------------------#
@@ -30,11 +93,18 @@ class Venue(db.Model):
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     # missing fields implemented as a database migration using Flask-Migrate
-    genres = db.Column(db.String(120), nullable=False)
+    genres = db.Column(Genres(120), nullable=False)
     website_link = db.Column(db.String(120))
     seeking_talent = db.Column(db.String(120))
     seeking_description = db.Column(db.String(120))
-    shows = db.relationship('Show', backref='venue', lazy='select', cascade='all, delete')
+    # city-level coordinates from the local gazetteer (see geo.py), and
+    # their geo cell, indexed for radius searches
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    geocell = db.Column(db.BigInteger, index=True)
+    # shows are deleted by the database (ON DELETE CASCADE), without
+    # being loaded first
+    shows = db.relationship('Show', backref='venue', lazy='select', cascade='all, delete', passive_deletes=True)
 
 
 class Artist(db.Model):
@@ -45,24 +115,144 @@ class Artist(db.Model):
     city = db.Column(db.String(120), nullable=False)
     state = db.Column(db.String(120), nullable=False)
     phone = db.Column(db.String(120))
-    genres = db.Column(db.String(120))
+    genres = db.Column(Genres(120))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     # missing fields implemented as a database migration using Flask-Migrate
     website_link = db.Column(db.String(120))
     seeking_venue = db.Column(db.String(120))
     seeking_description = db.Column(db.String(120))
-    shows = db.relationship('Show', backref='artist', lazy='select', cascade='all, delete')
+    shows = db.relationship('Show', backref='artist', lazy='select', cascade='all, delete', passive_deletes=True)
 
 
 class Show(db.Model):
     __tablename__ = 'Show'
+    # conflict checks (see scheduling.py) look up the shows of one venue
+    # or one artist by start time. On postgres, the table is partitioned
+    # by month of start_time (see partitions.py) and each partition has
+    # exclusion constraints so that overlapping shows cannot be inserted
+    __table_args__ = (
+        db.Index('ix_show_venue_start', 'venue_id', 'start_time'),
+        db.Index('ix_show_artist_start', 'artist_id', 'start_time'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
+    start_time = db.Column(db.DateTime(), nullable=False, index=True)
+    # duration in minutes
+    duration = db.Column(db.Integer, nullable=False, default=120, server_default='120')
+
+    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), nullable=False)
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), nullable=False)
+
+
+
+
+
+class ShowArchive(db.Model):
+    # shows of the partitions archived by `flask partitions archive`,
+    # read by the venue and artist pages only when asked for
+    __tablename__ = 'Show_archive'
+    __table_args__ = (
+        db.Index('ix_show_archive_venue_start', 'venue_id', 'start_time'),
+        db.Index('ix_show_archive_artist_start', 'artist_id', 'start_time'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
     start_time = db.Column(db.DateTime(), nullable=False)
+    duration = db.Column(db.Integer, nullable=False, default=120, server_default='120')
 
-    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'),nullable=False)
-    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
+    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), nullable=False)
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), nullable=False)
 
 
+class Job(db.Model):
+    # background job, run by the `flask worker` processes (see jobs.py)
+    __tablename__ = 'Job'
+    __table_args__ = (
+        db.Index('ix_job_status_run_at', 'status', 'run_at'),
+    )
 
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False)
+    # json encoded keyword arguments of the task
+    payload = db.Column(db.Text, nullable=False, default='{}')
+    # queued, running, done or failed
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime(), nullable=False)
+    created_at = db.Column(db.DateTime(), nullable=False)
+    started_at = db.Column(db.DateTime())
+    finished_at = db.Column(db.DateTime())
+    locked_by = db.Column(db.String(120))
+    last_error = db.Column(db.Text)
+
+
+class BackfillState(db.Model):
+    # progress of the backfills (see backfill.py): the last key done, so
+    # that an interrupted backfill goes on from there
+    __tablename__ = 'Backfill'
+
+    name = db.Column(db.String(120), primary_key=True)
+    last_key = db.Column(db.BigInteger, nullable=False, default=0)
+    rows_done = db.Column(db.BigInteger, nullable=False, default=0)
+    status = db.Column(db.String(20), nullable=False)
+    started_at = db.Column(db.DateTime, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False)
+    finished_at = db.Column(db.DateTime)
+
+
+class Rollup(db.Model):
+    # show counts precomputed for the stats page (see stats.py): per venue,
+    # artist and genre by month, per city by week
+    __tablename__ = 'Rollup'
+
+    # venue, artist, city or genre
+    kind = db.Column(db.String(20), primary_key=True)
+    # venue or artist id, 'City, ST' or genre
+    key = db.Column(db.String(120), primary_key=True)
+    # first day of the month, or monday of the week
+    period = db.Column(db.Date, primary_key=True)
+    label = db.Column(db.String(200), nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class RollupState(db.Model):
+    # freshness of the rollups: last rebuild from the shows, last
+    # incremental update, and the last show id counted by the rebuild
+    __tablename__ = 'Rollup_state'
+
+    name = db.Column(db.String(120), primary_key=True)
+    rebuilt_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+    last_show_id = db.Column(db.Integer, nullable=False, default=0)
+
+
+class Session(db.Model):
+    # server-side sessions of the sql session store (see sessions.py),
+    # as tagged json; expired ones are deleted by the 'purge_sessions' job
+    __tablename__ = 'Session'
+
+    id = db.Column(db.String(64), primary_key=True)
+    data = db.Column(db.Text, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+
+class Change(db.Model):
+    # outbox of the writes of venues, artists and shows (see changes.py),
+    # read by the consumers of the change feed after the last position
+    # they saw
+    __tablename__ = 'Change'
+
+    id = db.Column(db.Integer, primary_key=True)
+    # given when the transaction commits, in commit order (none until
+    # then)
+    position = db.Column(db.BigInteger, unique=True)
+    # venue, artist or show
+    entity = db.Column(db.String(20), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    # created, updated or deleted
+    action = db.Column(db.String(20), nullable=False)
+    # json encoded columns of the row, none for a deletion
+    data = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, index=True)
@@ -0,0 +1,132 @@
+#----------------------------------------------------------------------------#
+# Imports.
+#----------------------------------------------------------------------------#
+import re
+from datetime import datetime
+
+from sqlalchemy import text
+
+
+#----------------------------------------------------------------------------#
+# Show partitions.
+#----------------------------------------------------------------------------#
+# On postgres, "Show" is partitioned by range of start_time, one
+# partition per month ("Show_p202610" for October 2026), so that queries
+# on upcoming or past shows only read the months they need. Shows beyond
+# the last monthly partition go to "Show_default"; creating a partition
+# moves its shows out of it. Partitions older than a few months are
+# detached, and their shows moved to "Show_archive".
+#
+# Each partition has its own overlap constraints (postgres cannot put
+# them on the partitioned table); overlaps across two months are caught by
+# the check of scheduling.py.
+PARTITION_FORMAT = 'Show_p%04d%02d'
+PARTITION_NAME = re.compile(r'^Show_p(\d{4})(\d{2})$')
+DEFAULT_PARTITION = 'Show_default'
+COLUMNS = 'id, start_time, duration, artist_id, venue_id'
+
+
+def month_start(day):
+    return datetime(day.year, day.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return PARTITION_FORMAT % (month.year, month.month)
+
+
+def overlap_constraints(table):
+    # same constraints as migration 8e4f0c6d2b17, on one partition
+    return [
+        'ALTER TABLE "%s" ADD CONSTRAINT "%s_venue_no_overlap" '
+        'EXCLUDE USING gist (venue_id WITH =, '
+        "tsrange(start_time, start_time + duration * interval '1 minute') "
+        'WITH &&)' % (table, table),
+        'ALTER TABLE "%s" ADD CONSTRAINT "%s_artist_no_overlap" '
+        'EXCLUDE USING gist (artist_id WITH =, '
+        "tsrange(start_time, start_time + duration * interval '1 minute') "
+        'WITH &&)' % (table, table),
+    ]
+
+
+def is_partitioned(connection):
+    if connection.dialect.name != 'postgresql':
+        return False
+    kind = connection.execute(text(
+        "SELECT relkind FROM pg_class WHERE relname = 'Show'")).scalar()
+    return kind == 'p'
+
+
+def monthly_partitions(connection):
+    """Months of the partitions attached to "Show", oldest first."""
+    rows = connection.execute(text(
+        'SELECT c.relname FROM pg_inherits i '
+        'JOIN pg_class c ON c.oid = i.inhrelid '
+        "WHERE i.inhparent = '\"Show\"'::regclass"))
+    months = []
+    for name, in rows:
+        match = PARTITION_NAME.match(name)
+        if match:
+            months.append(datetime(int(match.group(1)),
+                                   int(match.group(2)), 1))
+    return sorted(months)
+
+
+def create_partition(connection, month):
+    """Create and attach the partition of ``month``, with the shows of
+    that month held by the default partition.
+
+    To be run in a transaction of ``connection``: the default partition
+    is locked against writes until it commits, so that no show of the
+    month is listed there between the move and the attach (reads go on).
+    """
+    name = partition_name(month)
+    bounds = {'lower': month, 'upper': add_months(month, 1)}
+    connection.execute(text(
+        'LOCK TABLE "%s" IN SHARE ROW EXCLUSIVE MODE' % DEFAULT_PARTITION))
+    connection.execute(text(
+        'CREATE TABLE "%s" (LIKE "Show" INCLUDING DEFAULTS '
+        'INCLUDING CONSTRAINTS)' % name))
+    # the rows deleted are the ones copied, in one statement
+    connection.execute(text(
+        'WITH moved AS (DELETE FROM "%s" '
+        'WHERE start_time >= :lower AND start_time < :upper RETURNING %s) '
+        'INSERT INTO "%s" (%s) SELECT %s FROM moved'
+        % (DEFAULT_PARTITION, COLUMNS, name, COLUMNS, COLUMNS)), bounds)
+    for statement in overlap_constraints(name):
+        connection.execute(text(statement))
+    connection.execute(text(
+        "ALTER TABLE \"Show\" ATTACH PARTITION \"%s\" "
+        "FOR VALUES FROM ('%s') TO ('%s')"
+        % (name, bounds['lower'].isoformat(' '),
+           bounds['upper'].isoformat(' '))))
+    return name
+
+
+def archive_partition(connection, month, detach_only=False):
+    """Detach the partition of ``month``; unless ``detach_only``, move its
+    shows to "Show_archive" and drop it."""
+    name = partition_name(month)
+    connection.execute(text(
+        'ALTER TABLE "Show" DETACH PARTITION "%s"' % name))
+    if detach_only:
+        return name
+    connection.execute(text(
+        'INSERT INTO "Show_archive" (%s) SELECT %s FROM "%s"'
+        % (COLUMNS, COLUMNS, name)))
+    connection.execute(text('DROP TABLE "%s"' % name))
+    return name
+
+
+def scanned_partitions(connection, statement, params):
+    """(plan, partitions read) of the EXPLAIN of ``statement``."""
+    plan = [row[0] for row in connection.execute(
+        text('EXPLAIN ' + statement), params)]
+    names = set()
+    for line in plan:
+        names.update(re.findall(r'on "?(Show_(?:p\d{6}|default))"?', line))
+    return plan, sorted(names)
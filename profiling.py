@@ -0,0 +1,217 @@
+#----------------------------------------------------------------------------#
+# Imports.
+#----------------------------------------------------------------------------#
+import cProfile
+import hmac
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import g, request, has_request_context
+from jinja2 import Template
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+#----------------------------------------------------------------------------#
+# Request profiling.
+#----------------------------------------------------------------------------#
+# A request is profiled when it carries the X-Profile header (with the
+# value of PROFILE_TOKEN, if one is set) or is drawn at PROFILE_SAMPLE_RATE.
+# The header value picks what is recorded:
+#   X-Profile: <token>            per-phase timings (db, template, python)
+#   X-Profile: <token>:cprofile   timings + cProfile stats (.prof)
+#   X-Profile: <token>:sample     timings + sampled stacks (.collapsed,
+#                                 input of flamegraph.pl / speedscope)
+# Timings are logged and, when the response is not streamed, sent in a
+# Server-Timing header. Nothing is registered unless PROFILE_ENABLED.
+MODES = ('timing', 'cprofile', 'sample')
+
+
+class RequestProfile(object):
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.start = time.perf_counter()
+        self.db = 0.0
+        self.queries = 0
+        self.template = 0.0
+        self.profiler = None
+        self.sampler = None
+
+    def timings(self):
+        total = time.perf_counter() - self.start
+        return {
+            'total': total,
+            'db': self.db,
+            'template': self.template,
+            'python': max(0.0, total - self.db - self.template),
+        }
+
+
+def current_profile():
+    if has_request_context():
+        return g.get('_profile')
+    return None
+
+
+class StackSampler(threading.Thread):
+    # samples the stack of one thread every `interval` seconds and counts
+    # the stacks in collapsed form: "file:function;file:function"
+
+    def __init__(self, thread_id, interval):
+        super(StackSampler, self).__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                names.append('%s:%s' % (
+                    os.path.basename(frame.f_code.co_filename),
+                    frame.f_code.co_name))
+                frame = frame.f_back
+            if names:
+                self.stacks[';'.join(reversed(names))] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+class ProfiledTemplate(Template):
+    # times template rendering; time spent in queries run while the
+    # template renders (streamed pages) is counted as db time only
+
+    def render(self, *args, **kwargs):
+        profile = current_profile()
+        if profile is None:
+            return super(ProfiledTemplate, self).render(*args, **kwargs)
+        start, db_start = time.perf_counter(), profile.db
+        try:
+            return super(ProfiledTemplate, self).render(*args, **kwargs)
+        finally:
+            profile.template += (time.perf_counter() - start
+                                 - (profile.db - db_start))
+
+    def generate(self, *args, **kwargs):
+        profile = current_profile()
+        chunks = super(ProfiledTemplate, self).generate(*args, **kwargs)
+        if profile is None:
+            for chunk in chunks:
+                yield chunk
+            return
+        while True:
+            start, db_start = time.perf_counter(), profile.db
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                return
+            finally:
+                profile.template += (time.perf_counter() - start
+                                     - (profile.db - db_start))
+            yield chunk
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    profile = current_profile()
+    if profile is not None:
+        context._profile_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    profile = current_profile()
+    start = getattr(context, '_profile_start', None)
+    if profile is not None and start is not None:
+        profile.db += time.perf_counter() - start
+        profile.queries += 1
+
+
+def init_profiling(app):
+    """Register the profiling hooks on ``app`` if PROFILE_ENABLED."""
+    if not app.config['PROFILE_ENABLED']:
+        return
+
+    app.jinja_env.template_class = ProfiledTemplate
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    def requested_mode():
+        # the X-Profile header is ignored when no token is configured
+        header = request.headers.get('X-Profile')
+        token = app.config['PROFILE_TOKEN']
+        if header is not None and token:
+            given, _, mode = header.partition(':')
+            if not hmac.compare_digest(given, token):
+                return None
+            return mode if mode in MODES else 'timing'
+        if random.random() < app.config['PROFILE_SAMPLE_RATE']:
+            return 'timing'
+        return None
+
+    @app.before_request
+    def start_profile():
+        mode = requested_mode()
+        if mode is None:
+            return
+        profile = g._profile = RequestProfile(mode)
+        if mode == 'cprofile':
+            profile.profiler = cProfile.Profile()
+            profile.profiler.enable()
+        elif mode == 'sample':
+            profile.sampler = StackSampler(
+                threading.get_ident(), app.config['PROFILE_SAMPLE_INTERVAL'])
+            profile.sampler.start()
+
+    @app.after_request
+    def finish_profile(response):
+        profile = g.get('_profile')
+        if profile is None:
+            return response
+        if not response.is_streamed:
+            response.headers['Server-Timing'] = ', '.join(
+                '%s;dur=%.1f' % (phase, seconds * 1000)
+                for phase, seconds in profile.timings().items())
+        # streamed bodies are rendered after this hook: the report is
+        # written once the response has been sent
+        path, method = request.path, request.method
+        response.call_on_close(
+            lambda: write_report(app, profile, method, path))
+        return response
+
+
+def write_report(app, profile, method, path):
+    if profile.profiler is not None:
+        profile.profiler.disable()
+    if profile.sampler is not None:
+        profile.sampler.stop()
+    timings = profile.timings()
+    app.logger.info(
+        'profile %s %s total=%.1fms db=%.1fms (%d queries) '
+        'template=%.1fms python=%.1fms',
+        method, path, timings['total'] * 1000, timings['db'] * 1000,
+        profile.queries, timings['template'] * 1000, timings['python'] * 1000)
+
+    if profile.mode == 'timing':
+        return
+    os.makedirs(app.config['PROFILE_DIR'], exist_ok=True)
+    name = os.path.join(app.config['PROFILE_DIR'], '%s-%s-%s' % (
+        time.strftime('%Y%m%d-%H%M%S'), method,
+        path.strip('/').replace('/', '_') or 'index'))
+    if profile.profiler is not None:
+        profile.profiler.dump_stats(name + '.prof')
+        app.logger.info('profile written to %s.prof', name)
+    if profile.sampler is not None:
+        with open(name + '.collapsed', 'w') as collapsed:
+            for stack, count in profile.sampler.stacks.most_common():
+                collapsed.write('%s %d\n' % (stack, count))
+        app.logger.info('profile written to %s.collapsed', name)
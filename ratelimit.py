@@ -0,0 +1,188 @@
+#----------------------------------------------------------------------------#
+# Imports.
+#----------------------------------------------------------------------------#
+import math
+import time
+from threading import Lock
+
+from flask import jsonify, request
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+#----------------------------------------------------------------------------#
+# Token buckets.
+#----------------------------------------------------------------------------#
+# A limit such as '30/minute' is a bucket of 30 tokens, refilled at
+# 30 tokens per minute. Each request takes one token; a request finding
+# the bucket empty is answered 429 with the time to wait in Retry-After.
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+
+def parse_limit(limit):
+    # '30/minute' -> (rate in tokens per second, burst)
+    count, _, period = limit.partition('/')
+    count = int(count)
+    return count / float(PERIODS[period.strip()]), count
+
+
+class MemoryBackend(object):
+    """Buckets in the memory of the worker process."""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = Lock()
+
+    def take(self, key, rate, burst):
+        """Take a token: returns (allowed, seconds until one is back)."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - last) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            if len(self._buckets) >= self.max_keys and key not in self._buckets:
+                self._evict(now)
+            self._buckets[key] = (tokens, now)
+        return allowed, 0.0 if allowed else (1 - tokens) / rate
+
+    def _evict(self, now):
+        # forget the clients whose bucket has been full again for a while
+        self._buckets = {
+            key: (tokens, last) for key, (tokens, last)
+            in self._buckets.items() if now - last < 3600}
+
+
+class RedisBackend(object):
+    """Buckets shared by all workers, in redis (or any client with the
+    same ``eval``, e.g. a local stand-in)."""
+
+    SCRIPT = """
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'last')
+local rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local tokens = tonumber(bucket[1]) or burst
+local last = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + (now - last) * rate)
+local allowed = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+  allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'last', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+    def __init__(self, client, prefix='fyyur:ratelimit:'):
+        self.client = client
+        self.prefix = prefix
+
+    def take(self, key, rate, burst):
+        allowed, tokens = self.client.eval(
+            self.SCRIPT, 1, self.prefix + key, rate, burst, time.time())
+        if allowed:
+            return True, 0.0
+        return False, (1 - float(tokens)) / rate
+
+
+def backend_from_url(url):
+    if url.startswith('memory://'):
+        return MemoryBackend()
+    if url.startswith('redis://'):
+        if redis is None:
+            raise RuntimeError('the redis package is needed for %s' % url)
+        return RedisBackend(redis.Redis.from_url(url))
+    raise ValueError('unknown rate limit storage: %s' % url)
+
+
+#----------------------------------------------------------------------------#
+# Load shedding.
+#----------------------------------------------------------------------------#
+class LoadShedder(object):
+    """Sheds requests while getting a database connection is slow.
+
+    Keeps a moving average of the time requests wait for a pooled
+    connection. Over ``threshold`` seconds, requests are refused, except
+    one probe every ``probe_interval`` seconds that keeps the average
+    up to date.
+    """
+
+    def __init__(self, threshold, probe_interval=1.0, smoothing=0.2):
+        self.threshold = threshold
+        self.probe_interval = probe_interval
+        self.smoothing = smoothing
+        self.average_wait = 0.0
+        self._last_probe = 0.0
+        self._lock = Lock()
+
+    def observe(self, wait):
+        with self._lock:
+            self.average_wait += self.smoothing * (wait - self.average_wait)
+
+    def should_shed(self):
+        if self.average_wait <= self.threshold:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_probe >= self.probe_interval:
+                self._last_probe = now
+                return False
+        return True
+
+
+#----------------------------------------------------------------------------#
+# Flask integration.
+#----------------------------------------------------------------------------#
+def client_key(api_keys):
+    # the API key when it is one of ``api_keys``, else the client address:
+    # a made-up key does not get a bucket of its own
+    api_key = request.headers.get('X-API-Key')
+    if api_key and api_key in api_keys:
+        return 'key:' + api_key
+    return 'ip:' + (request.remote_addr or 'unknown')
+
+
+def too_many(status, retry_after, message):
+    response = jsonify({'success': False, 'error': status,
+                        'message': message})
+    response.status_code = status
+    response.headers['Retry-After'] = str(int(math.ceil(retry_after)))
+    return response
+
+
+def init_ratelimit(app, db, backend=None):
+    """Apply RATELIMITS and load shedding to the routes of ``app``."""
+    if not app.config['RATELIMIT_ENABLED']:
+        return
+    if backend is None:
+        backend = backend_from_url(app.config['RATELIMIT_STORAGE_URL'])
+    limits = {endpoint: parse_limit(limit)
+              for endpoint, limit in app.config['RATELIMITS'].items()}
+    shedder = LoadShedder(app.config['SHED_POOL_WAIT_THRESHOLD'])
+    api_keys = frozenset(app.config['RATELIMIT_API_KEYS'])
+
+    @app.before_request
+    def limit_request():
+        limit = limits.get(request.endpoint)
+        if limit is None:
+            return None
+        rate, burst = limit
+        allowed, retry_after = backend.take(
+            request.endpoint + ':' + client_key(api_keys), rate, burst)
+        if not allowed:
+            return too_many(429, retry_after, 'Too many requests.')
+
+        if shedder.should_shed():
+            return too_many(503, shedder.probe_interval,
+                            'The service is overloaded, retry later.')
+        start = time.perf_counter()
+        db.session.connection()
+        shedder.observe(time.perf_counter() - start)
+        return None
+
+    return shedder
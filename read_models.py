@@ -0,0 +1,138 @@
+#----------------------------------------------------------------------------#
+# Imports.
+#----------------------------------------------------------------------------#
+from collections import namedtuple
+from datetime import datetime
+
+from models import Venue, Artist, Show, ShowArchive, db
+
+
+#----------------------------------------------------------------------------#
+# Read models.
+#----------------------------------------------------------------------------#
+# What the list and detail pages render, built from column queries:
+# no ORM instance is loaded (nor kept in the identity map) for a row, and a
+# namedtuple takes less memory and time to build than a dict.
+Area = namedtuple('Area', 'city state venues')
+
+VenueSummary = namedtuple('VenueSummary', 'id name num_upcoming_shows')
+
+ArtistSummary = namedtuple('ArtistSummary', 'id name num_upcoming_shows')
+
+ArtistName = namedtuple('ArtistName', 'id name')
+
+SearchResults = namedtuple('SearchResults', 'count data')
+
+ShowTile = namedtuple('ShowTile', [
+    'id', 'venue_id', 'venue_name', 'venue_image_link', 'artist_id',
+    'artist_name', 'artist_image_link', 'start_time', 'version'])
+
+VenueDetail = namedtuple('VenueDetail', [
+    'id', 'name', 'genres', 'address', 'city', 'state', 'phone', 'website',
+    'facebook_link', 'seeking_talent', 'seeking_description', 'image_link',
+    'past_shows', 'upcoming_shows', 'past_shows_count',
+    'upcoming_shows_count'])
+
+ArtistDetail = namedtuple('ArtistDetail', [
+    'id', 'name', 'genres', 'city', 'state', 'phone', 'website',
+    'facebook_link', 'seeking_venue', 'seeking_description', 'image_link',
+    'past_shows', 'upcoming_shows', 'past_shows_count',
+    'upcoming_shows_count'])
+
+
+def upcoming_counts(column):
+    # number of upcoming shows per venue_id (or artist_id), as owner_id:
+    # one grouped count, joined to the venues or artists listed
+    return (
+        db.session.query(column.label('owner_id'),
+                         db.func.count(Show.id).label('num'))
+        .filter(Show.start_time > datetime.now())
+        .group_by(column)
+        .subquery()
+    )
+
+
+def search_summaries(model, column, summary, search_term):
+    """The venues (or artists) whose name contains ``search_term``,
+    case-insensitive, as ``summary`` tuples with their upcoming shows
+    counted by ``column``."""
+    upcoming = upcoming_counts(column)
+    rows = (
+        db.session.query(model.id, model.name,
+                         db.func.coalesce(upcoming.c.num, 0))
+        .outerjoin(upcoming, upcoming.c.owner_id == model.id)
+        .filter(model.name.ilike('%' + search_term + '%'))
+        .order_by(model.id)
+    )
+    data = [summary._make(row) for row in rows]
+    return SearchResults(len(data), data)
+
+
+def tile_query(model=Show):
+    # one row per show (or archived show), with what a show tile displays
+    return (
+        db.session.query(model.id, model.venue_id, Venue.name,
+                         Venue.image_link, model.artist_id, Artist.name,
+                         Artist.image_link, model.start_time)
+        .join(Venue, Venue.id == model.venue_id)
+        .join(Artist, Artist.id == model.artist_id)
+    )
+
+
+def show_tile(row):
+    # date and time as a string, as per the datetime filter used later;
+    # the version (a hash of what the tile displays) keys its cache entry
+    fields = row[:7] + (row[7].strftime("%d/%m/%Y, %H:%M"),)
+    return ShowTile._make(fields + (hash(fields[1:]),))
+
+
+def split_shows(column, row_id, archive):
+    # show tiles of the shows where ``column`` is ``row_id``, split into
+    # (past, upcoming). Archived shows (all past) are read only with
+    # ``archive``
+    now = datetime.now()
+    past, upcoming = [], []
+    query = tile_query().filter(getattr(Show, column) == row_id)
+    for row in query.order_by(Show.start_time):
+        (past if row[7] < now else upcoming).append(show_tile(row))
+    if archive:
+        archived = (tile_query(ShowArchive)
+                    .filter(getattr(ShowArchive, column) == row_id)
+                    .order_by(ShowArchive.start_time))
+        past[:0] = [show_tile(row) for row in archived]
+    return past, upcoming
+
+
+def venue_detail(venue_id, archive=False):
+    """The venue page of ``venue_id``, or None if there is no such venue."""
+    venue = (
+        db.session.query(Venue.id, Venue.name, Venue.genres, Venue.address,
+                         Venue.city, Venue.state, Venue.phone,
+                         Venue.website_link, Venue.facebook_link,
+                         Venue.seeking_talent, Venue.seeking_description,
+                         Venue.image_link)
+        .filter(Venue.id == venue_id)
+        .first()
+    )
+    if venue is None:
+        return None
+    past, upcoming = split_shows('venue_id', venue_id, archive)
+    return VenueDetail._make(tuple(venue) + (past, upcoming, len(past),
+                                             len(upcoming)))
+
+
+def artist_detail(artist_id, archive=False):
+    """The artist page of ``artist_id``, or None if there is no such artist."""
+    artist = (
+        db.session.query(Artist.id, Artist.name, Artist.genres, Artist.city,
+                         Artist.state, Artist.phone, Artist.website_link,
+                         Artist.facebook_link, Artist.seeking_venue,
+                         Artist.seeking_description, Artist.image_link)
+        .filter(Artist.id == artist_id)
+        .first()
+    )
+    if artist is None:
+        return None
+    past, upcoming = split_shows('artist_id', artist_id, archive)
+    return ArtistDetail._make(tuple(artist) + (past, upcoming, len(past),
+                                               len(upcoming)))
@@ -0,0 +1,83 @@
+#----------------------------------------------------------------------------#
+# Imports.
+#----------------------------------------------------------------------------#
+from datetime import timedelta
+
+from flask import current_app
+
+from models import Show
+
+
+#----------------------------------------------------------------------------#
+# Scheduling conflicts.
+#----------------------------------------------------------------------------#
+# postgres error code of an exclusion constraint violation, raised by the
+# show_venue_no_overlap / show_artist_no_overlap constraints
+EXCLUSION_VIOLATION = '23P01'
+
+
+class ScheduleConflict(Exception):
+    pass
+
+
+def is_conflict_error(error):
+    orig = getattr(error, 'orig', None)
+    return getattr(orig, 'pgcode', None) == EXCLUSION_VIOLATION
+
+
+def show_end(show):
+    return show.start_time + timedelta(minutes=show.duration)
+
+
+def overlapping_shows(session, column, value, start, end):
+    # shows on the same venue (or artist) overlapping [start, end).
+    # A show lasts at most MAX_SHOW_DURATION minutes, so only the shows
+    # starting in [start - MAX_SHOW_DURATION, end) can overlap: this is
+    # a range scan on the (venue_id, start_time) / (artist_id, start_time)
+    # indexes, whatever the number of shows in the table
+    longest = timedelta(minutes=current_app.config['MAX_SHOW_DURATION'])
+    candidates = (
+        session.query(Show.id, Show.start_time, Show.duration)
+        .filter(column == value)
+        .filter(Show.start_time > start - longest)
+        .filter(Show.start_time < end)
+        .all()
+    )
+    return [
+        show_id for show_id, show_start, duration in candidates
+        if show_start + timedelta(minutes=duration) > start
+    ]
+
+
+def check_schedule(session, shows):
+    """Raise ScheduleConflict if a new show overlaps another show.
+
+    Each show of ``shows`` is checked against the shows already
+    booked at the same venue or for the same artist, and against the
+    other shows of the batch.
+    """
+    for show in shows:
+        start, end = show.start_time, show_end(show)
+        if overlapping_shows(session, Show.venue_id, show.venue_id,
+                             start, end):
+            raise ScheduleConflict(
+                'Venue %s is already booked at that time.' % show.venue_id)
+        if overlapping_shows(session, Show.artist_id, show.artist_id,
+                             start, end):
+            raise ScheduleConflict(
+                'Artist %s is already playing at that time.'
+                % show.artist_id)
+
+    # shows of the same batch: sorted by start time, a show overlaps
+    # another one of its venue (or artist) if it starts before the
+    # latest end seen so far for that venue (or artist)
+    for key, label in ((lambda s: s.venue_id, 'Venue %s'),
+                       (lambda s: s.artist_id, 'Artist %s')):
+        latest_end = {}
+        for show in sorted(shows, key=lambda s: s.start_time):
+            owner = key(show)
+            if owner in latest_end and show.start_time < latest_end[owner]:
+                raise ScheduleConflict(
+                    (label + ' is booked twice at the same time.') % owner)
+            latest_end[owner] = max(latest_end.get(owner, show.start_time),
+                                    show_end(show))
@@ -0,0 +1,252 @@
+#----------------------------------------------------------------------------#
+# Imports.
+#----------------------------------------------------------------------------#
+import os
+import secrets
+import time
+from datetime import datetime, timedelta
+from threading import Lock
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SecureCookieSession, SessionInterface
+from itsdangerous import BadSignature, Signer
+from sqlalchemy.exc import IntegrityError
+
+from jobs import task
+from models import Session, db
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+#----------------------------------------------------------------------------#
+# Stores.
+#----------------------------------------------------------------------------#
+# The session cookie holds only a signed, random session id; the session
+# itself (flashed messages, mostly) is kept server side, so every worker
+# and instance sharing a store sees it. Sessions are stored as the tagged
+# json of flask's cookie sessions (tuples and markup are kept).
+#
+# A store has get(sid), set(sid, data, seconds) and delete(sid); expired
+# sessions are evicted in bulk, never one by one on read.
+class MemoryStore(object):
+    """Sessions in the memory of the worker process: for a single
+    process, and the local stand-in of the shared stores."""
+
+    def __init__(self, max_keys=100000, evict_interval=60.0):
+        self.max_keys = max_keys
+        self.evict_interval = evict_interval
+        self._sessions = {}
+        self._last_eviction = time.monotonic()
+        self._lock = Lock()
+
+    def get(self, sid):
+        entry = self._sessions.get(sid)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+
+    def set(self, sid, data, seconds):
+        now = time.monotonic()
+        with self._lock:
+            if (now - self._last_eviction > self.evict_interval
+                    or len(self._sessions) >= self.max_keys):
+                self._evict(now)
+            self._sessions[sid] = (now + seconds, data)
+
+    def delete(self, sid):
+        with self._lock:
+            self._sessions.pop(sid, None)
+
+    def _evict(self, now):
+        # expired sessions, then the ones expiring first when still full
+        sessions = {sid: entry for sid, entry in self._sessions.items()
+                    if entry[0] >= now}
+        if len(sessions) >= self.max_keys:
+            kept = sorted(sessions.items(), key=lambda item: item[1][0])
+            sessions = dict(kept[len(sessions) - self.max_keys // 2:])
+        self._sessions = sessions
+        self._last_eviction = now
+
+
+class SqlStore(object):
+    """Sessions in the "Session" table of the app database, shared by all
+    workers. Expired rows are deleted by the 'purge_sessions' job."""
+
+    def __init__(self, db):
+        self.db = db
+        self.table = Session.__table__
+
+    @property
+    def engine(self):
+        # the engine of the current app
+        return self.db.engine
+
+    def get(self, sid):
+        # a connection of its own: the store does not take part in the
+        # transaction of the request
+        with self.engine.connect() as connection:
+            return connection.execute(
+                self.table.select()
+                .with_only_columns([self.table.c.data])
+                .where(self.table.c.id == sid)
+                .where(self.table.c.expires_at > datetime.utcnow())
+            ).scalar()
+
+    def set(self, sid, data, seconds):
+        values = {'data': data, 'expires_at':
+                  datetime.utcnow() + timedelta(seconds=seconds)}
+        with self.engine.begin() as connection:
+            updated = connection.execute(
+                self.table.update().where(self.table.c.id == sid)
+                .values(**values)).rowcount
+            if updated:
+                return
+        try:
+            with self.engine.begin() as connection:
+                connection.execute(self.table.insert().values(id=sid,
+                                                              **values))
+        except IntegrityError:
+            # inserted meanwhile by another request of the same client
+            with self.engine.begin() as connection:
+                connection.execute(
+                    self.table.update().where(self.table.c.id == sid)
+                    .values(**values))
+
+    def delete(self, sid):
+        with self.engine.begin() as connection:
+            connection.execute(
+                self.table.delete().where(self.table.c.id == sid))
+
+
+class RedisStore(object):
+    """Sessions shared by all workers, in redis (or any client with the
+    same ``get``, ``setex`` and ``delete``). Redis expires them itself."""
+
+    def __init__(self, client, prefix='fyyur:session:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, sid):
+        data = self.client.get(self.prefix + sid)
+        return data.decode() if isinstance(data, bytes) else data
+
+    def set(self, sid, data, seconds):
+        self.client.setex(self.prefix + sid, max(1, int(seconds)), data)
+
+    def delete(self, sid):
+        self.client.delete(self.prefix + sid)
+
+
+def store_from_url(url, db):
+    if url.startswith('memory://'):
+        return MemoryStore()
+    if url.startswith('sql://'):
+        return SqlStore(db)
+    if url.startswith('redis://'):
+        if redis is None:
+            raise RuntimeError('the redis package is needed for %s' % url)
+        return RedisStore(redis.Redis.from_url(url))
+    raise ValueError('unknown session storage: %s' % url)
+
+
+@task('purge_sessions')
+def purge_sessions():
+    # one statement for all the expired sessions of the sql store
+    (db.session.query(Session)
+     .filter(Session.expires_at < datetime.utcnow())
+     .delete(synchronize_session=False))
+
+
+#----------------------------------------------------------------------------#
+# Flask integration.
+#----------------------------------------------------------------------------#
+class ServerSession(SecureCookieSession):
+    # same change tracking as a cookie session, with its id
+
+    def __init__(self, initial=None, sid=None, new=False):
+        super(ServerSession, self).__init__(initial)
+        self.sid = sid
+        self.new = new
+
+
+class ServerSessionInterface(SessionInterface):
+    """Keeps sessions in a store; the cookie holds the signed session id.
+
+    A session is written to the store only when it changes, for
+    SESSION_LIFETIME seconds (or until it expires, for a permanent one).
+    """
+
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, store, lifetime):
+        self.store = store
+        self.lifetime = lifetime
+
+    def signer(self, app):
+        return Signer(app.secret_key, salt='fyyur-session')
+
+    def open_session(self, app, request):
+        if not app.secret_key:
+            return None
+        cookie = request.cookies.get(app.session_cookie_name)
+        if cookie:
+            try:
+                sid = self.signer(app).unsign(cookie).decode()
+            except BadSignature:
+                sid = None
+            data = self.store.get(sid) if sid else None
+            if data is not None:
+                return ServerSession(self.serializer.loads(data), sid=sid)
+        return ServerSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if not session:
+            if session.modified and not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(app.session_cookie_name,
+                                       domain=domain, path=path)
+            return
+        if session.accessed:
+            response.vary.add('Cookie')
+        if not self.should_set_cookie(app, session):
+            return
+
+        expires = self.get_expiration_time(app, session)
+        seconds = ((expires - datetime.utcnow()).total_seconds()
+                   if expires else self.lifetime)
+        self.store.set(session.sid, self.serializer.dumps(dict(session)),
+                       seconds)
+        response.set_cookie(
+            app.session_cookie_name,
+            self.signer(app).sign(session.sid.encode()).decode(),
+            expires=expires, httponly=self.get_cookie_httponly(app),
+            domain=domain, path=path, secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app))
+
+
+def check_secret_key(app):
+    # a key made per process signs cookies the other workers refuse:
+    # only for development, on a single worker
+    if app.secret_key:
+        return
+    if not (app.debug or app.testing):
+        raise RuntimeError('FYYUR_SECRET_KEY must be set, the same for '
+                           'all the workers')
+    app.logger.warning('FYYUR_SECRET_KEY is not set: using a random key, '
+                       'valid in this process only')
+    app.secret_key = os.urandom(32)
+
+
+def init_sessions(app, db, store=None):
+    """Keep the sessions of ``app`` in SESSION_STORAGE_URL."""
+    check_secret_key(app)
+    if store is None:
+        store = store_from_url(app.config['SESSION_STORAGE_URL'], db)
+    app.session_interface = ServerSessionInterface(
+        store, app.config['SESSION_LIFETIME'])
+    return store
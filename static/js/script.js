@@ -2,3 +2,40 @@ window.parseISOString = function parseISOString(s) {
   var b = s.split(/\D+/);
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
+
+window.deleteRecord = function deleteRecord(url) {
+  fetch(url, { method: 'DELETE' }).then(function (response) {
+    if (response.ok) {
+      window.location.href = '/';
+    }
+  });
+};
+
+// fills the datalist of a search input with the names returned by an
+// autocomplete endpoint, and copies the id of the chosen name into the
+// id field
+window.attachPicker = function attachPicker(searchId, listId, targetId, url) {
+  var search = document.getElementById(searchId);
+  var list = document.getElementById(listId);
+  var target = document.getElementById(targetId);
+  search.addEventListener('input', function () {
+    var chosen = Array.prototype.find.call(list.options, function (option) {
+      return option.value === search.value;
+    });
+    if (chosen) {
+      target.value = chosen.dataset.id;
+      return;
+    }
+    fetch(url + '?q=' + encodeURIComponent(search.value))
+      .then(function (response) { return response.json(); })
+      .then(function (body) {
+        list.innerHTML = '';
+        body.data.forEach(function (match) {
+          var option = document.createElement('option');
+          option.value = match.name;
+          option.dataset.id = match.id;
+          list.appendChild(option);
+        });
+      });
+  });
+};
@@ -0,0 +1,292 @@
+#----------------------------------------------------------------------------#
+# Imports.
+#----------------------------------------------------------------------------#
+from collections import Counter
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import func
+
+from jobs import task
+from models import (
+    Venue, Artist, Show, ShowArchive, Rollup, RollupState, db, parse_array)
+
+
+#----------------------------------------------------------------------------#
+# Rollups.
+#----------------------------------------------------------------------------#
+# The stats page reads show counts from the Rollup table only, never from
+# the shows: per venue and per artist by month, per city by week, per
+# genre (of the artist) by month. A show listed is counted by the
+# 'count_shows' job, queued in the transaction of the show. The
+# 'rebuild_rollups' job counts all the shows again, archived ones
+# included, which also catches up with deleted shows and renamed or moved
+# venues and artists.
+#
+# Shows up to the last id seen by a rebuild are not counted again by
+# 'count_shows'; a show committed during a rebuild with a lower id than
+# another one already counted is missed until the next rebuild.
+STATE = 'shows'
+
+
+def week_start(day):
+    # monday of the week of ``day``
+    return day - timedelta(days=day.weekday())
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def rollup_state(session):
+    state = session.query(RollupState).get(STATE)
+    if state is None:
+        state = RollupState(name=STATE, last_show_id=0)
+        session.add(state)
+    return state
+
+
+def show_rollups(start_time, venue, artist):
+    # (kind, key, period, label) of the rollups a show is counted in
+    day = start_time.date()
+    city = '%s, %s' % (venue.city, venue.state)
+    rollups = [
+        ('venue', str(venue.id), month_start(day), venue.name),
+        ('artist', str(artist.id), month_start(day), artist.name),
+        ('city', city, week_start(day), city),
+    ]
+    for genre in set(parse_array(artist.genres)):
+        rollups.append(('genre', genre, month_start(day), genre))
+    return rollups
+
+
+def add_counts(session, counts, labels):
+    # counts: {(kind, key, period): shows to add}. Two jobs inserting the
+    # same new row conflict on its primary key; the job fails and is
+    # retried, its counts rolled back with it
+    table = Rollup.__table__
+    for (kind, key, period), count in counts.items():
+        updated = session.execute(
+            table.update()
+            .where(table.c.kind == kind)
+            .where(table.c.key == key)
+            .where(table.c.period == period)
+            .values(count=table.c.count + count,
+                    label=labels[kind, key, period])).rowcount
+        if not updated:
+            session.execute(table.insert().values(
+                kind=kind, key=key, period=period,
+                label=labels[kind, key, period], count=count))
+
+
+@task('count_shows')
+def count_shows(show_ids):
+    state = rollup_state(db.session)
+    shows = (db.session.query(Show.start_time, Venue, Artist)
+             .join(Venue, Venue.id == Show.venue_id)
+             .join(Artist, Artist.id == Show.artist_id)
+             .filter(Show.id.in_(show_ids))
+             .filter(Show.id > state.last_show_id))
+    counts, labels = Counter(), {}
+    for start_time, venue, artist in shows:
+        for kind, key, period, label in show_rollups(start_time, venue,
+                                                     artist):
+            counts[kind, key, period] += 1
+            labels[kind, key, period] = label
+    add_counts(db.session, counts, labels)
+    state.updated_at = datetime.utcnow()
+
+
+def remove(session, kind, ids):
+    """Delete the rollups of deleted venues or artists."""
+    (session.query(Rollup)
+     .filter(Rollup.kind == kind)
+     .filter(Rollup.key.in_([str(row_id) for row_id in ids]))
+     .delete(synchronize_session=False))
+
+
+#----------------------------------------------------------------------------#
+# Rebuild.
+#----------------------------------------------------------------------------#
+def load_shows(session):
+    # venue ids, artist ids and start times (datetime64) of all the shows,
+    # archived ones included
+    venue_ids, artist_ids, starts = [], [], []
+    for model in (Show, ShowArchive):
+        rows = session.query(model.venue_id, model.artist_id,
+                             model.start_time).all()
+        if rows:
+            columns = list(zip(*rows))
+            venue_ids.extend(columns[0])
+            artist_ids.extend(columns[1])
+            starts.extend(columns[2])
+    return (np.array(venue_ids, dtype=np.int64),
+            np.array(artist_ids, dtype=np.int64),
+            np.array(starts, dtype='datetime64[s]'))
+
+
+def count_by(keys, periods):
+    # distinct (key, period) pairs of two int64 arrays, with their counts
+    if not len(keys):
+        return keys, periods, keys
+    pairs, counts = np.unique(np.stack([keys, periods], axis=1), axis=0,
+                              return_counts=True)
+    return pairs[:, 0], pairs[:, 1], counts
+
+
+def lookup(ids, sorted_ids):
+    # positions of ``ids`` in the sorted array ``sorted_ids``
+    return np.searchsorted(sorted_ids, ids)
+
+
+def rollup_rows(session):
+    """The rows of the Rollup table, counted from all the shows."""
+    venue_ids, artist_ids, starts = load_shows(session)
+    days = starts.astype('datetime64[D]').astype(np.int64)
+    # 1970-01-01 is a thursday: 3 days after a monday
+    weeks = days - (days + 3) % 7
+    months = starts.astype('datetime64[M]').astype(np.int64)
+
+    venues = session.query(Venue.id, Venue.name, Venue.city,
+                           Venue.state).order_by(Venue.id).all()
+    artists = session.query(Artist.id, Artist.name,
+                            Artist.genres).order_by(Artist.id).all()
+    venue_order = np.array([venue.id for venue in venues], dtype=np.int64)
+    artist_order = np.array([artist.id for artist in artists],
+                            dtype=np.int64)
+
+    def month_date(month):
+        return np.datetime64(int(month), 'M').astype('datetime64[D]').item()
+
+    def week_date(week):
+        return np.datetime64(int(week), 'D').item()
+
+    rows = []
+
+    def add(kind, positions, periods, labels, to_date, keys=None):
+        # one row per distinct (position, period); positions index
+        # ``labels`` and ``keys`` (the labels when not given)
+        keys = labels if keys is None else keys
+        for position, period, count in zip(*count_by(positions, periods)):
+            rows.append({'kind': kind, 'key': str(keys[position]),
+                         'period': to_date(period),
+                         'label': labels[position], 'count': int(count)})
+
+    # per venue and per artist, by month
+    venue_positions = lookup(venue_ids, venue_order)
+    add('venue', venue_positions, months, [venue.name for venue in venues],
+        month_date, venue_order)
+    artist_positions = lookup(artist_ids, artist_order)
+    add('artist', artist_positions, months,
+        [artist.name for artist in artists], month_date, artist_order)
+
+    # per city, by week
+    city_names = ['%s, %s' % (venue.city, venue.state) for venue in venues]
+    cities = sorted(set(city_names))
+    city_index = {city: index for index, city in enumerate(cities)}
+    city_of = np.array([city_index[city] for city in city_names],
+                       dtype=np.int64)
+    add('city', city_of[venue_positions], weeks, cities, week_date)
+
+    # per genre, by month: each show is repeated once per genre of its
+    # artist, the genres of all the artists being laid end to end
+    artist_genres = [sorted(set(parse_array(artist.genres)))
+                     for artist in artists]
+    genres = sorted({genre for names in artist_genres for genre in names})
+    genre_index = {genre: index for index, genre in enumerate(genres)}
+    all_genres = np.array([genre_index[genre] for names in artist_genres
+                           for genre in names], dtype=np.int64)
+    genre_counts = np.array([len(names) for names in artist_genres],
+                            dtype=np.int64)
+    firsts = np.cumsum(genre_counts) - genre_counts
+    repeats = genre_counts[artist_positions]
+    offsets = (np.arange(repeats.sum())
+               - np.repeat(np.cumsum(repeats) - repeats, repeats))
+    add('genre', all_genres[np.repeat(firsts[artist_positions], repeats)
+                            + offsets],
+        np.repeat(months, repeats), genres, month_date)
+    return rows
+
+
+def rebuild(session):
+    """Replace the rollups with counts of all the shows; returns the
+    number of rows."""
+    last_show_id = session.query(func.max(Show.id)).scalar() or 0
+    rows = rollup_rows(session)
+    session.query(Rollup).delete(synchronize_session=False)
+    if rows:
+        session.execute(Rollup.__table__.insert(), rows)
+    state = rollup_state(session)
+    state.rebuilt_at = state.updated_at = datetime.utcnow()
+    state.last_show_id = last_show_id
+    return len(rows)
+
+
+@task('rebuild_rollups')
+def rebuild_rollups():
+    rebuild(db.session)
+
+
+#----------------------------------------------------------------------------#
+# Stats.
+#----------------------------------------------------------------------------#
+def top_totals(session, kind, since, limit):
+    # (key, label, shows) of the ``limit`` keys of ``kind`` with the most
+    # shows since ``since`` (all time if None)
+    total = func.sum(Rollup.count)
+    query = (session.query(Rollup.key, func.max(Rollup.label), total)
+             .filter(Rollup.kind == kind))
+    if since is not None:
+        query = query.filter(Rollup.period >= since)
+    return query.group_by(Rollup.key).order_by(total.desc(), Rollup.key) \
+        .limit(limit).all()
+
+
+def series(session, kind, periods, limit):
+    # the ``limit`` keys of ``kind`` with the most shows over ``periods``,
+    # with their count in each period
+    rows = (session.query(Rollup.key, Rollup.label, Rollup.period,
+                          Rollup.count)
+            .filter(Rollup.kind == kind)
+            .filter(Rollup.period >= periods[0])
+            .filter(Rollup.period <= periods[-1]))
+    position = {period: index for index, period in enumerate(periods)}
+    counts, labels = {}, {}
+    for key, label, period, count in rows:
+        counts.setdefault(key, [0] * len(periods))[position[period]] += count
+        labels[key] = label
+    keys = sorted(counts, key=lambda key: (-sum(counts[key]), key))[:limit]
+    return [{'name': labels[key], 'shows': counts[key],
+             'total': sum(counts[key])} for key in keys]
+
+
+def read_stats(session, today, top, weeks, weeks_ahead, months):
+    """What the stats page shows, read from the rollups only."""
+    this_week = week_start(today)
+    week_starts = [this_week + timedelta(weeks=count)
+                   for count in range(1 - weeks, weeks_ahead + 1)]
+    month_starts = [month_start(today)]
+    for _ in range(months - 1):
+        month_starts.insert(0, month_start(month_starts[0] - timedelta(1)))
+    state = session.query(RollupState).get(STATE)
+    now = datetime.utcnow()
+    return {
+        'venues': [{'id': int(key), 'name': name, 'shows': int(shows)}
+                   for key, name, shows
+                   in top_totals(session, 'venue', None, top)],
+        'artists': [{'id': int(key), 'name': name, 'shows': int(shows)}
+                    for key, name, shows
+                    in top_totals(session, 'artist', None, top)],
+        'weeks': [week.isoformat() for week in week_starts],
+        'cities': series(session, 'city', week_starts, top),
+        'months': [month.isoformat() for month in month_starts],
+        'genres': series(session, 'genre', month_starts, top),
+        'freshness': {
+            'rebuilt_at': state.rebuilt_at.isoformat()
+            if state and state.rebuilt_at else None,
+            'updated_at': state.updated_at.isoformat()
+            if state and state.updated_at else None,
+            'age_seconds': (now - state.updated_at).total_seconds()
+            if state and state.updated_at else None,
+        },
+    }
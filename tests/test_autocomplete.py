@@ -0,0 +1,80 @@
+import app as fyyur
+from autocomplete import PrefixIndex
+from models import Venue
+
+NAMES = [(1, 'The Musical Hop'), (2, 'The Dueling Pianos Bar'),
+         (3, 'Park Square Live Music & Coffee')]
+
+
+def warmed():
+    index = PrefixIndex()
+    index.warm(NAMES)
+    return index
+
+
+def test_search_matches_any_word():
+    index = warmed()
+    assert index.search('hop') == [(1, 'The Musical Hop')]
+    # in the order of the matching words
+    assert index.search('MUSI') == [(3, 'Park Square Live Music & Coffee'),
+                                    (1, 'The Musical Hop')]
+    assert index.search('  the   musical ') == [(1, 'The Musical Hop')]
+    assert index.search('jazz') == []
+    assert index.search(' ') == []
+
+
+def test_each_name_is_found_once():
+    index = PrefixIndex()
+    index.warm([(1, 'Blue Blue Blue')])
+    assert index.search('blue') == [(1, 'Blue Blue Blue')]
+
+
+def test_search_stops_at_limit():
+    index = warmed()
+    assert len(index.search('the', limit=1)) == 1
+    assert len(index.search('the')) == 2
+
+
+def test_add_rename_and_remove():
+    index = warmed()
+    index.add(4, 'Hop Along')
+    assert [record_id for record_id, _ in index.search('hop')] == [1, 4]
+    index.add(1, 'The Musical Jump')
+    assert index.search('hop') == [(4, 'Hop Along')]
+    assert index.search('jump') == [(1, 'The Musical Jump')]
+    index.remove(4)
+    index.remove(5)
+    assert index.search('hop') == []
+    assert len(index) == 3
+
+
+class ThreadStub(object):
+    # a thread running its target when started, in the test
+
+    def __init__(self, target, args, daemon):
+        self.target = target
+        self.args = args
+
+    def start(self):
+        self.target(*self.args)
+
+
+def test_indexes_are_rebuilt_from_the_database(app, client, db, monkeypatch):
+    # names written by another process are found once the indexes are
+    # older than NAMES_REFRESH_INTERVAL
+    db.session.add(Venue(name='The Musical Hop', city='San Francisco',
+                         state='CA', address='1015 Folsom Street',
+                         genres=['Jazz']))
+    db.session.commit()
+    assert client.get('/venues/autocomplete?q=hop').get_json()['data'] == []
+    assert not fyyur.venue_duplicates.find('Musical Hop', 'San Francisco',
+                                           'CA')
+
+    monkeypatch.setattr(fyyur.threading, 'Thread', ThreadStub)
+    monkeypatch.setitem(app.config, 'NAMES_REFRESH_INTERVAL', 0)
+    client.get('/venues/autocomplete?q=hop')
+    assert [row['name'] for row in client.get(
+        '/venues/autocomplete?q=hop').get_json()['data']] == [
+        'The Musical Hop']
+    assert fyyur.venue_duplicates.find('Musical Hop', 'San Francisco', 'CA')
+    assert not fyyur.names_building.locked()
@@ -0,0 +1,131 @@
+import pytest
+from sqlalchemy import text
+
+import backfill
+from backfill import BACKFILLS, normalize_genres, run
+from models import BackfillState, Venue
+
+
+class Interrupted(Exception):
+    pass
+
+
+@pytest.fixture
+def venues(db):
+    # 10 venues, their names to be upper-cased by the 'upper_names'
+    # backfill
+    db.session.add_all([
+        Venue(name='venue %d' % number, city='San Francisco', state='CA',
+              address='%d Folsom Street' % number, genres=['Jazz'])
+        for number in range(1, 11)])
+    db.session.commit()
+    return db
+
+
+@pytest.fixture
+def upper_names(monkeypatch):
+    # the batches run, as (lower, upper); set ``fail_after`` to interrupt
+    # the backfill after that many batches
+    batches = []
+    options = {'fail_after': None}
+
+    def function(connection, lower, upper):
+        if len(batches) == options['fail_after']:
+            raise Interrupted()
+        batches.append((lower, upper))
+        return connection.execute(text(
+            'UPDATE "Venue" SET name = upper(name) '
+            'WHERE id > :lower AND id <= :upper AND name != upper(name)'),
+            {'lower': lower, 'upper': upper}).rowcount
+
+    monkeypatch.setitem(BACKFILLS, 'upper_names', {
+        'table': 'Venue', 'key': 'id', 'function': function})
+    return batches, options
+
+
+def names(db):
+    db.session.expire_all()
+    return [venue.name for venue in db.session.query(Venue).order_by(Venue.id)]
+
+
+def state(db):
+    db.session.expire_all()
+    return db.session.query(BackfillState).get('upper_names')
+
+
+def test_backfill_resumes_after_an_interrupted_batch(venues, upper_names):
+    batches, options = upper_names
+    options['fail_after'] = 2
+    with venues.engine.connect() as connection:
+        with pytest.raises(Interrupted):
+            run(connection, 'upper_names', batch_size=3)
+    # the failed batch is rolled back, the checkpoint is the last batch
+    # committed
+    assert names(venues)[:7] == ['VENUE %d' % n for n in range(1, 7)] \
+        + ['venue 7']
+    assert (state(venues).status, state(venues).last_key,
+            state(venues).rows_done) == ('running', 6, 6)
+
+    options['fail_after'] = None
+    progress = []
+    with venues.engine.connect() as connection:
+        assert run(connection, 'upper_names', batch_size=3,
+                   progress=progress.append) == 10
+    assert batches == [(0, 3), (3, 6), (6, 9), (9, 10)]
+    assert names(venues) == ['VENUE %d' % n for n in range(1, 11)]
+    assert state(venues).status == 'done'
+    assert [(p['rows_done'], p['total']) for p in progress] == [(9, 10),
+                                                                 (10, 10)]
+
+
+def test_backfill_runs_once(venues, upper_names):
+    batches, _ = upper_names
+    with venues.engine.connect() as connection:
+        assert run(connection, 'upper_names', batch_size=4) == 10
+        assert len(batches) == 3
+        # done: not run again
+        assert run(connection, 'upper_names', batch_size=4) == 0
+        assert len(batches) == 3
+        # run again from the start, it changes nothing
+        changed = []
+        assert run(connection, 'upper_names', batch_size=4, restart=True,
+                   progress=lambda p: changed.append(p['changed'])) == 10
+    assert changed == [0, 0, 0]
+    assert names(venues) == ['VENUE %d' % n for n in range(1, 11)]
+
+
+def test_backfill_throttles(venues, upper_names, monkeypatch):
+    batches, _ = upper_names
+    # each batch takes a second of a fake clock: over max_batch_seconds,
+    # the batches are halved
+    clock = [0.0]
+    sleeps = []
+
+    def monotonic():
+        clock[0] += 1.0
+        return clock[0]
+
+    monkeypatch.setattr(backfill.time, 'monotonic', monotonic)
+    monkeypatch.setattr(backfill.time, 'sleep', sleeps.append)
+    with venues.engine.connect() as connection:
+        run(connection, 'upper_names', batch_size=4, pause=0.25,
+            max_batch_seconds=0.5)
+    assert batches == [(0, 4), (4, 6), (6, 7), (7, 8), (8, 9), (9, 10)]
+    assert sleeps == [0.25] * 6
+
+
+def test_normalize_genres():
+    assert normalize_genres('{" Jazz",Folk,Jazz,""}') == '{Jazz,Folk}'
+    assert normalize_genres('Jazz') == '{Jazz}'
+    assert normalize_genres('{"Rock n Roll"}') == '{"Rock n Roll"}'
+
+
+def test_genres_backfill(db):
+    db.session.add(Venue(name='The Musical Hop', city='San Francisco',
+                         state='CA', address='1015 Folsom Street',
+                         genres='{Jazz, Reggae,Jazz}'))
+    db.session.commit()
+    with db.engine.connect() as connection:
+        run(connection, 'venue_genres')
+    db.session.expire_all()
+    assert db.session.query(Venue).one().genres == '{Jazz,Reggae}'
@@ -0,0 +1,76 @@
+from datetime import date, datetime
+
+from calendar_feed import bucket_shows, bucket_starts, ical
+from models import Artist, Show, Venue
+
+
+def test_bucket_starts():
+    # 2030-06-05 is a wednesday
+    assert bucket_starts(date(2030, 6, 5), date(2030, 6, 8), 'day') == [
+        date(2030, 6, 5), date(2030, 6, 6), date(2030, 6, 7)]
+    assert bucket_starts(date(2030, 6, 5), date(2030, 6, 18), 'week') == [
+        date(2030, 6, 3), date(2030, 6, 10), date(2030, 6, 17)]
+    assert bucket_starts(date(2030, 6, 5), date(2030, 6, 5), 'day') == []
+
+
+def add_shows(db):
+    venue = Venue(name='The Musical Hop', city='San Francisco', state='CA',
+                  address='1015 Folsom Street', genres=['Jazz'])
+    other = Venue(name='The Dueling Pianos Bar', city='New York', state='NY',
+                  address='335 Delancey Street', genres=['Classical'])
+    artist = Artist(name='Guns N Petals', city='San Francisco', state='CA',
+                    genres=['Rock n Roll'])
+    db.session.add_all([venue, other, artist])
+    db.session.flush()
+    for place, start in ((venue, datetime(2030, 6, 5, 20, 0)),
+                         (other, datetime(2030, 6, 5, 23, 30)),
+                         (venue, datetime(2030, 6, 6, 0, 0)),
+                         (venue, datetime(2030, 6, 9, 21, 0))):
+        db.session.add(Show(venue_id=place.id, artist_id=artist.id,
+                            start_time=start, duration=90))
+    db.session.commit()
+    return venue, other
+
+
+def test_bucket_shows(db):
+    venue, other = add_shows(db)
+    day = bucket_shows(db.session, date(2030, 6, 5), 'day')
+    assert [show['start_time'] for show in day] == [
+        '2030-06-05T20:00:00', '2030-06-05T23:30:00']
+    assert day[1]['end_time'] == '2030-06-06T01:00:00'
+    assert len(bucket_shows(db.session, date(2030, 6, 3), 'week')) == 4
+    assert len(bucket_shows(db.session, date(2030, 6, 3), 'week',
+                            city='New York')) == 1
+    assert len(bucket_shows(db.session, date(2030, 6, 3), 'week',
+                            venue_id=venue.id)) == 3
+
+
+def test_ical():
+    text = ical([{'id': 7, 'start_time': '2030-06-05T20:00:00',
+                  'end_time': '2030-06-05T21:30:00',
+                  'venue_name': 'Park Square Live Music & Coffee',
+                  'city': 'San Francisco', 'state': 'CA',
+                  'artist_name': 'Guns N Petals'}], 'fyyur.test')
+    lines = text.split('\r\n')
+    assert lines[0] == 'BEGIN:VCALENDAR'
+    assert lines[-2:] == ['END:VCALENDAR', '']
+    assert 'UID:show-7@fyyur.test' in lines
+    assert 'DTSTART:20300605T200000' in lines
+    assert 'DTEND:20300605T213000' in lines
+    assert ('LOCATION:Park Square Live Music & Coffee\\, San Francisco\\, CA'
+            in lines)
+
+
+def test_calendar_routes(client, db):
+    add_shows(db)
+    response = client.get('/shows/calendar.json?start=2030-06-05'
+                          '&end=2030-06-07&state=CA')
+    assert [len(bucket['shows']) for bucket in response.get_json()['buckets']] \
+        == [1, 1]
+    response = client.get('/shows/calendar.ics?start=2030-06-03'
+                          '&bucket=week')
+    assert response.mimetype == 'text/calendar'
+    assert response.data.count(b'BEGIN:VEVENT') == 4
+    assert client.get('/shows/calendar.json?bucket=month').status_code == 400
+    assert client.get('/shows/calendar.json?start=2030-06-05'
+                      '&end=2031-06-05').status_code == 400
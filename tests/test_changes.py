@@ -0,0 +1,109 @@
+import socket
+from datetime import datetime, timedelta
+
+from changes import (is_expired, purge_changes, read_changes, record,
+                     wait_for_changes)
+from models import Change
+
+
+class StubConnection(object):
+    # what wait_for_changes uses of a psycopg2 connection: a socket to
+    # wait on, poll() and the notifies received
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.notifies = []
+        self.polled = 0
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def poll(self):
+        self.polled += 1
+        self.sock.recv(1024)
+        self.notifies.append('notify')
+
+
+def test_wait_for_changes_times_out():
+    reader, writer = socket.socketpair()
+    with reader, writer:
+        connection = StubConnection(reader)
+        assert wait_for_changes(connection, 0.01) is False
+        assert connection.polled == 0
+
+
+def test_wait_for_changes_notified():
+    reader, writer = socket.socketpair()
+    with reader, writer:
+        connection = StubConnection(reader)
+        writer.send(b'x')
+        assert wait_for_changes(connection, 1.0) is True
+        assert connection.polled == 1
+        assert connection.notifies == []
+
+
+def test_wait_for_changes_polls_without_listener():
+    assert wait_for_changes(None, 0.01) is False
+
+
+def add_change(db, change_id, entity_id, created_at=None):
+    # a change with a given id, as ids are handed out by concurrent
+    # transactions
+    db.session.add(Change(id=change_id, entity='venue', entity_id=entity_id,
+                          action='updated',
+                          created_at=created_at or datetime.utcnow()))
+    db.session.info['changes'] = True
+    db.session.commit()
+
+
+def test_changes_are_positioned_in_commit_order(db):
+    add_change(db, 50, 1)
+    add_change(db, 20, 2)
+    record(db.session, 'venue', 'created', 3)
+    record(db.session, 'venue', 'created', 4)
+    db.session.commit()
+    changes = read_changes(db.session, 0, 10)
+    assert [change.entity_id for change in changes] == [1, 2, 3, 4]
+    positions = [change.position for change in changes]
+    assert positions == sorted(positions)
+    assert len(set(positions)) == 4
+    assert [change.entity_id
+            for change in read_changes(db.session, positions[1], 10)] == [3, 4]
+    assert len(read_changes(db.session, 0, 3)) == 3
+
+
+def test_rolled_back_changes_are_not_positioned(db):
+    record(db.session, 'venue', 'created', 1)
+    db.session.rollback()
+    add_change(db, 7, 2)
+    assert [change.position for change in read_changes(db.session, 0, 10)] \
+        == [1]
+
+
+def test_is_expired(db):
+    assert not is_expired(db.session, 5)
+    old = datetime.utcnow() - timedelta(days=30)
+    for entity_id in (1, 2, 3):
+        add_change(db, entity_id, entity_id, created_at=old)
+    add_change(db, 4, 4)
+    assert not is_expired(db.session, 0)
+    assert not is_expired(db.session, 2)
+    purge_changes(days=7)
+    db.session.commit()
+    # the oldest change left is at position 4
+    assert not is_expired(db.session, 0)
+    assert not is_expired(db.session, 3)
+    assert is_expired(db.session, 2)
+
+
+def test_changes_route(client, db):
+    for entity_id in (1, 2, 3):
+        add_change(db, entity_id, entity_id)
+    page = client.get('/changes?since=0&limit=2').get_json()
+    assert [change['position'] for change in page['changes']] == [1, 2]
+    assert (page['next'], page['more']) == (2, True)
+    page = client.get('/changes?since=2&limit=2').get_json()
+    assert (page['next'], page['more']) == (3, False)
+    db.session.query(Change).filter(Change.position < 3).delete()
+    db.session.commit()
+    assert client.get('/changes?since=1').status_code == 410
@@ -0,0 +1,158 @@
+import random
+from datetime import datetime
+
+import pytest
+
+import app as fyyur
+from dedup import (DuplicateIndex, merge, normalize_name, similarity,
+                   trigrams)
+from models import Artist, Change, Show, Venue
+from scheduling import ScheduleConflict
+
+
+def test_normalize_name():
+    for name in ('The Musical Hop', 'Musical Hop, The', 'the musical-hop',
+                 'THE MUSICAL HOP!', 'Musical   Hop'):
+        assert normalize_name(name) == ('musical', 'hop')
+    assert normalize_name('Café Tacvba') == ('cafe', 'tacvba')
+    assert normalize_name('Park Square Live Music & Coffee') == (
+        'park', 'square', 'live', 'music', 'and', 'coffee')
+    assert normalize_name("Guns N' Petals") == ('guns', 'n', 'petals')
+    # an article alone is the name
+    assert normalize_name('The') == ('the',)
+    assert normalize_name('A Band') == ('band',)
+
+
+def test_find():
+    index = DuplicateIndex(0.75)
+    index.warm([(1, 'The Musical Hop', 'San Francisco', 'CA'),
+                (2, 'Musical Hop, The', 'San Francisco', 'CA'),
+                (3, 'The Musical Hops', 'san  francisco', 'ca'),
+                (4, 'The Musical Hop', 'New York', 'NY'),
+                (5, 'The Dueling Pianos Bar', 'San Francisco', 'CA')])
+    found = index.find('the musical-hop', 'San Francisco', 'CA')
+    assert [record_id for record_id, _, _ in found] == [1, 2, 3]
+    assert found[0][2] == 1.0
+    assert [record_id for record_id, _, _ in index.find(
+        'The Musical Hop', 'San Francisco', 'CA', exclude=1)] == [2, 3]
+    assert index.find('!!!', 'San Francisco', 'CA') == []
+    assert index.pairs()[:1] == [(1, 2, 1.0)]
+    index.remove(2)
+    index.add(3, 'Hop Along', 'San Francisco', 'CA')
+    assert [record_id for record_id, _, _ in index.find(
+        'The Musical Hop', 'San Francisco', 'CA')] == [1]
+
+
+def test_blocking_finds_what_scoring_every_pair_finds():
+    # the least shared trigrams read by find() are enough: no match above
+    # the threshold is missed
+    rng = random.Random(0)
+    words = ['musical', 'hop', 'dueling', 'pianos', 'bar', 'park', 'square',
+             'live', 'music', 'coffee', 'jazz', 'club', 'blue', 'note']
+
+    def misspell(word):
+        i = rng.randrange(len(word))
+        return word[:i] + rng.choice('aeioust') + word[i + 1:]
+
+    names = []
+    for _ in range(150):
+        name = rng.sample(words, rng.randint(1, 3))
+        names.append(' '.join(name))
+        names.append(' '.join(misspell(word) if rng.random() < 0.5 else word
+                              for word in name))
+    for threshold in (0.6, 0.75, 0.9):
+        index = DuplicateIndex(threshold)
+        index.warm([(record_id, name, 'Here', 'CA')
+                    for record_id, name in enumerate(names)])
+        for name in names[:60]:
+            query = normalize_name(name)
+            expected = {
+                record_id for record_id, other in enumerate(names)
+                if similarity(query, trigrams(query), normalize_name(other),
+                              trigrams(normalize_name(other))) >= threshold}
+            found = index.find(name, 'Here', 'CA', limit=len(names))
+            assert {record_id for record_id, _, _ in found} == expected
+
+
+def test_least_shared():
+    index = DuplicateIndex(0.75)
+    # dice >= 0.6875: s >= 0.6875 * n / 1.3125
+    assert [index.least_shared(n) for n in (1, 2, 10, 21)] == [1, 2, 6, 11]
+    assert DuplicateIndex(0.2).least_shared(10) == 1
+
+
+def new_venue(name):
+    return Venue(name=name, city='San Francisco', state='CA',
+                 address='1015 Folsom Street', genres=['Jazz'])
+
+
+def test_merge(db):
+    keep, duplicate = new_venue('The Musical Hop'), new_venue('Musical Hop')
+    artist = Artist(name='Guns N Petals', city='San Francisco', state='CA',
+                    genres=['Rock n Roll'])
+    db.session.add_all([keep, duplicate, artist])
+    db.session.flush()
+    db.session.add_all([
+        Show(venue_id=keep.id, artist_id=artist.id, duration=60,
+             start_time=datetime(2030, 6, 1, 20)),
+        Show(venue_id=duplicate.id, artist_id=artist.id, duration=60,
+             start_time=datetime(2030, 6, 2, 20))])
+    db.session.commit()
+    keep_id, duplicate_id = keep.id, duplicate.id
+    assert merge(db.session, Venue, keep_id, [duplicate_id]) == 1
+    db.session.commit()
+    assert [venue.id for venue in db.session.query(Venue)] == [keep_id]
+    assert {show.venue_id for show in db.session.query(Show)} == {keep_id}
+    assert (db.session.query(Change)
+            .filter_by(entity='venue', action='deleted').one().entity_id
+            == duplicate_id)
+
+
+def test_merge_refuses_overlapping_shows(db):
+    keep, duplicate = new_venue('The Musical Hop'), new_venue('Musical Hop')
+    artists = [Artist(name=name, city='San Francisco', state='CA',
+                      genres=['Jazz']) for name in ('One', 'Two')]
+    db.session.add_all([keep, duplicate] + artists)
+    db.session.flush()
+    for venue, artist in ((keep, artists[0]), (duplicate, artists[1])):
+        db.session.add(Show(venue_id=venue.id, artist_id=artist.id,
+                            duration=60, start_time=datetime(2030, 6, 1, 20)))
+    db.session.commit()
+    with pytest.raises(ScheduleConflict):
+        merge(db.session, Venue, keep.id, [duplicate.id])
+    db.session.rollback()
+    assert db.session.query(Venue).count() == 2
+
+
+class ThreadStub(object):
+    # a thread running its target when started, in the test
+
+    def __init__(self, target, args, daemon):
+        self.target = target
+        self.args = args
+
+    def start(self):
+        self.target(*self.args)
+
+
+def test_merged_venues_leave_the_indexes(app, db, monkeypatch):
+    # a merge made by `flask dedup merge` reaches the indexes of the web
+    # workers when they are rebuilt
+    keep, duplicate = new_venue('The Musical Hop'), new_venue('Musical Hop')
+    db.session.add_all([keep, duplicate])
+    db.session.commit()
+    keep_id, duplicate_id = keep.id, duplicate.id
+    fyyur.build_name_indexes()
+    merge(db.session, Venue, keep_id, [duplicate_id])
+    db.session.commit()
+    fyyur.refresh_name_indexes()
+    assert fyyur.venue_duplicates.name_of(duplicate_id) == 'Musical Hop'
+
+    monkeypatch.setattr(fyyur.threading, 'Thread', ThreadStub)
+    monkeypatch.setitem(app.config, 'NAMES_REFRESH_INTERVAL', 0)
+    fyyur.refresh_name_indexes()
+    assert fyyur.venue_duplicates.name_of(duplicate_id) is None
+    assert [record_id for record_id, _, _ in fyyur.venue_duplicates.find(
+        'Musical Hop', 'San Francisco', 'CA')] == [keep_id]
+    assert fyyur.venue_names.search('musical') == [(keep_id,
+                                                    'The Musical Hop')]
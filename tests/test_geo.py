@@ -0,0 +1,39 @@
+import random
+
+from geo import cell_ranges, distance_km, encode
+
+
+def covered(ranges, latitude, longitude):
+    cell = encode(latitude, longitude)
+    return any(low <= cell < high for low, high in ranges)
+
+
+def test_cell_ranges_cover_the_circle():
+    # every point within the radius is in one of the ranges, near the
+    # equator, at high latitudes and across the antimeridian
+    rng = random.Random(0)
+    for latitude, longitude, radius in ((37.77, -122.42, 25),
+                                        (0.0, 0.0, 5),
+                                        (64.8, -147.7, 100),
+                                        (-36.85, 179.99, 50)):
+        ranges = cell_ranges(latitude, longitude, radius)
+        assert ranges
+        assert all(low < high for low, high in ranges)
+        for _ in range(500):
+            lat = latitude + rng.uniform(-1, 1) * radius / 111.32
+            lon = longitude + rng.uniform(-3, 3) * radius / 111.32
+            lon = (lon + 180.0) % 360.0 - 180.0
+            if distance_km(latitude, longitude, lat, lon) <= radius:
+                assert covered(ranges, lat, lon), (latitude, longitude, lat,
+                                                   lon)
+
+
+def test_cell_ranges_are_narrow():
+    # a few cells around the center: far points are out of the ranges
+    ranges = cell_ranges(37.77, -122.42, 10)
+    assert len(ranges) <= 9
+    assert not covered(ranges, 34.05, -118.24)
+
+
+def test_circle_too_large():
+    assert cell_ranges(37.77, -122.42, 20000) is None
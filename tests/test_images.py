@@ -0,0 +1,125 @@
+import struct
+import threading
+import urllib.error
+import urllib.request
+import zlib
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+import app as fyyur
+from images import (DirectoryFetcher, HttpFetcher, NoRedirectHandler,
+                    is_public, public_connection, sign, signing_key)
+
+
+def png_chunk(kind, data):
+    return (struct.pack('>I', len(data)) + kind + data
+            + struct.pack('>I', zlib.crc32(kind + data)))
+
+
+# a white pixel: read by Pillow when it is installed
+PNG = (b'\x89PNG\r\n\x1a\n'
+       + png_chunk(b'IHDR', struct.pack('>IIBBBBB', 1, 1, 8, 2, 0, 0, 0))
+       + png_chunk(b'IDAT', zlib.compress(b'\0\xff\xff\xff'))
+       + png_chunk(b'IEND', b''))
+
+
+def test_signing_key():
+    assert signing_key(b'configured', 'secret') == b'configured'
+    derived = signing_key(b'', 'secret')
+    assert len(derived) == 32
+    assert derived == signing_key(b'', b'secret')
+    assert derived != signing_key(b'', 'other secret')
+
+
+def test_signatures():
+    key = signing_key(b'', 'secret')
+    signature = sign(key, 'https://example.com/a.png', 'tile')
+    assert len(signature) == 20
+    assert signature != sign(key, 'https://example.com/b.png', 'tile')
+    assert signature != sign(key, 'https://example.com/a.png', 'detail')
+    assert signature != sign(b'other', 'https://example.com/a.png', 'tile')
+
+
+def test_thumbnail_route(client, monkeypatch, tmp_path):
+    (tmp_path / 'a.png').write_bytes(PNG)
+    monkeypatch.setattr(fyyur.image_cache, 'fetcher',
+                        DirectoryFetcher(str(tmp_path)))
+    url = 'https://example.com/a.png'
+    signature = sign(fyyur.image_key, url, 'tile')
+    response = client.get('/images/tile', query_string={
+        'url': url, 'sig': signature})
+    assert response.status_code == 200
+    assert 'immutable' in response.headers['Cache-Control']
+    etag = response.headers['ETag']
+    response = client.get('/images/tile', headers={'If-None-Match': etag},
+                          query_string={'url': url, 'sig': signature})
+    assert response.status_code == 304
+
+    # unsigned urls and unknown sizes are not fetched
+    for size, query in (('tile', {'url': url, 'sig': '0' * 20}),
+                        ('tile', {'url': 'https://example.com/b.png',
+                                  'sig': signature}),
+                        ('huge', {'url': url,
+                                  'sig': sign(fyyur.image_key, url, 'huge')})):
+        assert client.get('/images/' + size,
+                          query_string=query).status_code == 404
+
+    # a missing image is a 502, remembered for a while
+    missing = 'https://example.com/missing.png'
+    query = {'url': missing, 'sig': sign(fyyur.image_key, missing, 'tile')}
+    assert client.get('/images/tile', query_string=query).status_code == 502
+    (tmp_path / 'missing.png').write_bytes(PNG)
+    assert client.get('/images/tile', query_string=query).status_code == 502
+
+
+@pytest.mark.parametrize('address', [
+    '127.0.0.1', '10.1.2.3', '172.16.0.1', '192.168.1.1', '169.254.169.254',
+    '0.0.0.0', '100.64.0.1', '224.0.0.1', '::1', 'fe80::1%eth0', 'fc00::1',
+    '::ffff:127.0.0.1', '::ffff:169.254.169.254'])
+def test_private_addresses(address):
+    assert not is_public(address)
+
+
+def test_public_addresses():
+    assert is_public('93.184.216.34')
+    assert is_public('2606:2800:220:1:248:1893:25c8:1946')
+
+
+def test_fetcher_refuses_private_hosts():
+    fetcher = HttpFetcher(timeout=1.0)
+    with pytest.raises(OSError):
+        public_connection(('localhost', 80))
+    for url in ('http://127.0.0.1/a.png', 'http://localhost:8080/a.png',
+                'http://[::1]/a.png', 'file:///etc/passwd',
+                'ftp://example.com/a.png'):
+        with pytest.raises(OSError):
+            fetcher(url)
+
+
+class RedirectHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        self.send_response(302)
+        self.send_header('Location', 'http://169.254.169.254/')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def test_redirects_are_not_followed():
+    # on loopback, which the http fetcher would refuse before any
+    # redirect: the redirect handler is tried on its own
+    server = HTTPServer(('127.0.0.1', 0), RedirectHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        opener = urllib.request.build_opener(urllib.request.ProxyHandler({}),
+                                             NoRedirectHandler)
+        with pytest.raises(urllib.error.HTTPError) as error:
+            opener.open('http://127.0.0.1:%d/a.png' % server.server_port,
+                        timeout=5)
+        assert error.value.code == 302
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,87 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import jobs
+from jobs import claim, enqueue, requeue_stale, run_job, schedule_periodic
+from models import Job
+
+
+@pytest.fixture
+def flaky(monkeypatch):
+    # a task failing its first ``failures`` calls
+    calls = []
+
+    def flaky_task(failures):
+        calls.append(failures)
+        if len(calls) <= failures:
+            raise RuntimeError('failure %d' % len(calls))
+
+    monkeypatch.setitem(jobs.TASKS, 'flaky', flaky_task)
+    return calls
+
+
+def due(db, job):
+    # skip the backoff
+    job.run_at = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+
+
+def test_failed_job_is_retried_with_backoff(db, flaky):
+    enqueue(db.session, 'flaky', {'failures': 2})
+    db.session.commit()
+    for attempt in (1, 2):
+        job = claim(db.session, 'test')
+        assert (job.status, job.attempts) == ('running', attempt)
+        started = datetime.utcnow()
+        run_job(db.session, job, retry_backoff=10)
+        job = db.session.query(Job).one()
+        assert job.status == 'queued'
+        assert 'failure %d' % attempt in job.last_error
+        backoff = (job.run_at - started).total_seconds()
+        assert 10 * 2 ** (attempt - 1) <= backoff < 10 * 2 ** (attempt - 1) + 5
+        assert claim(db.session, 'test') is None
+        due(db, job)
+    job = claim(db.session, 'test')
+    run_job(db.session, job, retry_backoff=10)
+    job = db.session.query(Job).one()
+    assert (job.status, job.attempts, len(flaky)) == ('done', 3, 3)
+
+
+def test_job_fails_after_max_attempts(db, flaky):
+    enqueue(db.session, 'flaky', {'failures': 5}, max_attempts=2)
+    db.session.commit()
+    for _ in range(2):
+        run_job(db.session, claim(db.session, 'test'), retry_backoff=10)
+        due(db, db.session.query(Job).one())
+    job = db.session.query(Job).one()
+    assert job.status == 'failed'
+    assert job.finished_at is not None
+    assert claim(db.session, 'test') is None
+
+
+def test_job_is_queued_with_its_transaction(db, flaky):
+    enqueue(db.session, 'flaky', {'failures': 0})
+    db.session.rollback()
+    assert db.session.query(Job).count() == 0
+    with pytest.raises(KeyError):
+        enqueue(db.session, 'unknown')
+
+
+def test_abandoned_job_is_queued_again(db, flaky):
+    enqueue(db.session, 'flaky', {'failures': 0})
+    db.session.commit()
+    job = claim(db.session, 'dead worker')
+    job.started_at = datetime.utcnow() - timedelta(hours=1)
+    db.session.commit()
+    requeue_stale(db.session, timeout=60)
+    job = claim(db.session, 'test')
+    assert (job.locked_by, job.attempts) == ('test', 2)
+
+
+def test_periodic_job_is_scheduled_once(db):
+    schedule_periodic(db.session, {'purge_jobs': 3600})
+    schedule_periodic(db.session, {'purge_jobs': 3600})
+    job = db.session.query(Job).one()
+    assert job.name == 'purge_jobs'
+    assert job.run_at > datetime.utcnow() + timedelta(minutes=59)
@@ -0,0 +1,77 @@
+import math
+import random
+
+from matching import MatchIndex
+from models import array_literal
+
+GENRES = ['Blues', 'Classical', 'Folk', 'Jazz', 'Rock n Roll']
+WEIGHTS = {'genres': 0.5, 'location': 0.3, 'history': 0.2}
+
+
+def cosine(a, b):
+    norm = math.sqrt(sum(x * x for x in a) * sum(y * y for y in b))
+    return sum(x * y for x, y in zip(a, b)) / norm if norm else 0.0
+
+
+def random_rows(rng, count, first_id):
+    return [(first_id + i, array_literal(rng.sample(GENRES, rng.randint(1, 3))),
+             rng.uniform(30, 45), rng.uniform(-120, -75),
+             rng.choice(['CA', 'NY', 'TX']), rng.choice(['true', 'false']))
+            for i in range(count)]
+
+
+def test_top_k_is_the_best_of_a_full_ranking():
+    rng = random.Random(0)
+    # more rows than the initial capacity of the arrays
+    artists = random_rows(rng, 1500, 1)
+    venues = random_rows(rng, 1200, 5000)
+    shows = [(rng.choice(artists)[0], rng.choice(venues)[0])
+             for _ in range(3000)]
+    index = MatchIndex(GENRES, WEIGHTS, 100)
+    index.build(artists, venues, shows)
+    for artist_id in (1, 700, 1500):
+        ranking = index.venues_for_artist(artist_id, len(venues))
+        assert len(ranking) == sum(1 for row in venues if row[5] == 'true')
+        scores = [score for _, score, _ in ranking]
+        assert scores == sorted(scores, reverse=True)
+        top = index.venues_for_artist(artist_id, 10)
+        assert [score for _, score, _ in top] == scores[:10]
+
+
+def test_scores():
+    # genres as stored: the text of a postgres array
+    index = MatchIndex(GENRES, WEIGHTS, 100)
+    index.build(
+        [(1, '{Jazz}', 37.77, -122.42, 'CA', 'true')],
+        [(10, '{Jazz}', 37.77, -122.42, 'CA', 'true'),
+         (11, '{Jazz,Blues}', None, None, 'CA', 'true'),
+         (12, '{Folk}', None, None, 'NY', 'true')],
+        [])
+    ranking = {venue_id: components for venue_id, _, components
+               in index.venues_for_artist(1, 10)}
+    assert ranking[10] == {'genres': 1.0, 'location': 1.0, 'history': 0.0}
+    assert abs(ranking[11]['genres'] - cosine([1, 0], [1, 1])) < 1e-6
+    assert ranking[11]['location'] == 0.5
+    assert ranking[12] == {'genres': 0.0, 'location': 0.0, 'history': 0.0}
+    # a show adds the genres of the artist to the profile of the venue
+    index.add_show(1, 12)
+    ranking = {venue_id: components for venue_id, _, components
+               in index.venues_for_artist(1, 10)}
+    assert ranking[12]['history'] == 1.0
+
+
+def test_seeking_and_removed_candidates():
+    index = MatchIndex(GENRES, WEIGHTS, 100)
+    index.build([(1, '{Jazz}', None, None, 'CA', 'true')],
+                [(10, '{Jazz}', None, None, 'CA', 'false'),
+                 (11, '{Jazz}', None, None, 'CA', 'true')], [])
+    assert [row[0] for row in index.venues_for_artist(1, 10)] == [11]
+    assert [row[0] for row in index.venues_for_artist(
+        1, 10, seeking_only=False)] == [10, 11]
+    index.remove_venue(11)
+    assert index.venues_for_artist(1, 10) == []
+    index.set_venue(12, '{Jazz}', None, None, 'CA', 'yes')
+    assert [row[0] for row in index.venues_for_artist(1, 10)] == [12]
+    index.remove_artist(1)
+    assert index.venues_for_artist(1, 10) is None
+    assert index.artists_for_venue(99, 10) is None
@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import text
+
+from models import Artist, Show, Venue
+from partitions import (
+    DEFAULT_PARTITION, add_months, create_partition, is_partitioned,
+    month_start, monthly_partitions, partition_name)
+
+
+def test_month_arithmetic():
+    assert add_months(datetime(2026, 11, 1), 2) == datetime(2027, 1, 1)
+    assert add_months(datetime(2026, 1, 1), -1) == datetime(2025, 12, 1)
+    assert month_start(datetime(2026, 10, 19, 20)) == datetime(2026, 10, 1)
+    assert partition_name(datetime(2026, 3, 1)) == 'Show_p202603'
+
+
+def where_shows_are(connection):
+    return dict(connection.execute(text(
+        'SELECT tableoid::regclass::text, count(*) FROM "Show" GROUP BY 1')))
+
+
+@pytest.mark.postgres
+def test_migration_partitions_show(postgres):
+    with postgres.connect() as connection:
+        assert is_partitioned(connection)
+        months = monthly_partitions(connection)
+    assert months[-1] > month_start(datetime.now())
+
+
+@pytest.mark.postgres
+def test_create_partition_moves_the_shows_of_its_month(postgres, db):
+    with postgres.connect() as connection:
+        month = add_months(monthly_partitions(connection)[-1], 2)
+    venue = Venue(name='Hop', city='Austin', state='TX', address='1 Main',
+                  genres=['Jazz'])
+    artist = Artist(name='Petals', city='Austin', state='TX',
+                    genres=['Jazz'])
+    db.session.add_all([venue, artist])
+    db.session.flush()
+    # two shows of the month, one of the month after: all in the default
+    # partition
+    for start in (month + timedelta(hours=20),
+                  month + timedelta(days=3, hours=20),
+                  add_months(month, 1) + timedelta(hours=20)):
+        db.session.add(Show(venue_id=venue.id, artist_id=artist.id,
+                            start_time=start))
+    db.session.commit()
+    with postgres.connect() as connection:
+        assert where_shows_are(connection) == {'"%s"' % DEFAULT_PARTITION: 3}
+
+    with postgres.begin() as connection:
+        name = create_partition(connection, month)
+
+    with postgres.connect() as connection:
+        assert where_shows_are(connection) == {
+            '"%s"' % name: 2, '"%s"' % DEFAULT_PARTITION: 1}
+        assert month in monthly_partitions(connection)
@@ -0,0 +1,96 @@
+from flask import Flask
+
+import ratelimit
+from ratelimit import MemoryBackend, init_ratelimit, parse_limit
+
+
+class StubSession(object):
+    def connection(self):
+        return None
+
+
+class StubDB(object):
+    session = StubSession()
+
+
+def limited_app(**config):
+    # an app of its own: the limits are off in the app of the other tests
+    app = Flask('ratelimit_test')
+    app.config.update(RATELIMIT_ENABLED=True, RATELIMIT_API_KEYS=['good'],
+                      RATELIMITS={'search': '2/minute'},
+                      SHED_POOL_WAIT_THRESHOLD=0.25)
+    app.config.update(config)
+
+    @app.route('/search')
+    def search():
+        return 'found'
+
+    @app.route('/free')
+    def free():
+        return 'free'
+
+    shedder = init_ratelimit(app, StubDB(), MemoryBackend())
+    return app, shedder
+
+
+def test_parse_limit():
+    assert parse_limit('30/minute') == (0.5, 30)
+    assert parse_limit('5 / second') == (5.0, 5)
+
+
+def test_bucket_refills(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(ratelimit.time, 'monotonic', lambda: now[0])
+    backend = MemoryBackend()
+    assert backend.take('a', 0.5, 2) == (True, 0.0)
+    assert backend.take('a', 0.5, 2) == (True, 0.0)
+    assert backend.take('a', 0.5, 2) == (False, 2.0)
+    assert backend.take('b', 0.5, 2) == (True, 0.0)
+    now[0] += 1.5
+    assert backend.take('a', 0.5, 2) == (False, 0.5)
+    now[0] += 0.5
+    assert backend.take('a', 0.5, 2)[0]
+
+
+def test_too_many_requests():
+    app, _ = limited_app()
+    client = app.test_client()
+    assert [client.get('/search').status_code for _ in range(2)] == [200, 200]
+    response = client.get('/search')
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) == 30
+    assert response.get_json()['error'] == 429
+    # other routes are not limited
+    assert client.get('/free').status_code == 200
+
+
+def test_known_api_keys_have_buckets_of_their_own():
+    app, _ = limited_app()
+    client = app.test_client()
+    for _ in range(2):
+        client.get('/search')
+    assert client.get('/search').status_code == 429
+    good = {'X-API-Key': 'good'}
+    assert client.get('/search', headers=good).status_code == 200
+    # a made-up key shares the bucket of its address
+    made_up = {'X-API-Key': 'made-up'}
+    assert client.get('/search', headers=made_up).status_code == 429
+
+
+def test_overloaded_database_sheds_requests():
+    app, shedder = limited_app(RATELIMITS={'search': '100/minute'})
+    client = app.test_client()
+    shedder.average_wait = 1.0
+    # one probe gets through, to measure the wait again
+    assert client.get('/search').status_code == 200
+    response = client.get('/search')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    assert client.get('/free').status_code == 200
+
+
+def test_disabled():
+    app, shedder = limited_app(RATELIMIT_ENABLED=False)
+    client = app.test_client()
+    assert shedder is None
+    assert {client.get('/search').status_code for _ in range(5)} == {200}
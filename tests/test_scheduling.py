@@ -0,0 +1,77 @@
+from datetime import datetime
+
+import pytest
+
+from models import Artist, Show, Venue
+from scheduling import ScheduleConflict, check_schedule
+
+NOON = datetime(2030, 6, 1, 12, 0)
+
+
+def new_venue(name):
+    return Venue(name=name, city='San Francisco', state='CA',
+                 address='1015 Folsom Street', genres=['Jazz'])
+
+
+def new_artist(name):
+    return Artist(name=name, city='San Francisco', state='CA',
+                  genres=['Jazz'])
+
+
+def add_pair(db):
+    venue = new_venue('The Musical Hop')
+    artist = new_artist('Guns N Petals')
+    db.session.add_all([venue, artist])
+    db.session.flush()
+    return venue, artist
+
+
+def show(venue, artist, hour, minute=0, duration=60):
+    return Show(venue_id=venue.id, artist_id=artist.id, duration=duration,
+                start_time=NOON.replace(hour=hour, minute=minute))
+
+
+def test_booked_venue_conflicts(db):
+    venue, artist = add_pair(db)
+    other = new_artist('Matt Quevedo')
+    db.session.add_all([other, show(venue, artist, 12, duration=120)])
+    db.session.flush()
+    with pytest.raises(ScheduleConflict, match='Venue'):
+        check_schedule(db.session, [show(venue, other, 13)])
+
+
+def test_booked_artist_conflicts(db):
+    venue, artist = add_pair(db)
+    other = new_venue('Park Square Live Music & Coffee')
+    db.session.add_all([other, show(venue, artist, 12)])
+    db.session.flush()
+    with pytest.raises(ScheduleConflict, match='Artist'):
+        check_schedule(db.session, [show(other, artist, 12, minute=30)])
+
+
+def test_back_to_back_shows_do_not_conflict(db):
+    venue, artist = add_pair(db)
+    db.session.add(show(venue, artist, 12))
+    db.session.flush()
+    check_schedule(db.session, [show(venue, artist, 13)])
+    check_schedule(db.session, [show(venue, artist, 10, duration=120)])
+
+
+def test_shows_of_a_batch_conflict(db):
+    venue, artist = add_pair(db)
+    with pytest.raises(ScheduleConflict, match='booked twice'):
+        check_schedule(db.session, [show(venue, artist, 15),
+                                    show(venue, artist, 14, duration=90)])
+    check_schedule(db.session, [show(venue, artist, 15),
+                                show(venue, artist, 14)])
+
+
+def test_conflicting_show_is_not_listed(client, db):
+    venue, artist = add_pair(db)
+    db.session.add(show(venue, artist, 12))
+    db.session.commit()
+    response = client.post('/shows/create', data={
+        'venue_id': venue.id, 'artist_id': artist.id,
+        'start_time': '2030-06-01 12:30:00', 'duration': 60})
+    assert response.status_code == 400
+    assert db.session.query(Show).count() == 1
@@ -0,0 +1,113 @@
+import pytest
+from flask import Flask, session
+
+import sessions
+from models import Session
+from sessions import (MemoryStore, SqlStore, check_secret_key, init_sessions,
+                      purge_sessions)
+
+
+def bare_app(**config):
+    app = Flask('sessions_test')
+    app.config.update(SECRET_KEY=None, SESSION_STORAGE_URL='memory://',
+                      SESSION_LIFETIME=60)
+    app.config.update(config)
+    return app
+
+
+def test_refuses_to_start_without_a_key():
+    app = bare_app()
+    with pytest.raises(RuntimeError):
+        init_sessions(app, None)
+
+
+def test_random_key_in_debug_mode():
+    app = bare_app(DEBUG=True)
+    check_secret_key(app)
+    assert len(app.secret_key) == 32
+
+
+def test_configured_key_is_kept():
+    app = bare_app(SECRET_KEY='configured')
+    check_secret_key(app)
+    assert app.secret_key == 'configured'
+
+
+def session_app(store):
+    # a worker: its sessions in ``store``
+    app = bare_app(SECRET_KEY='shared key')
+    init_sessions(app, None, store)
+
+    @app.route('/set/<value>')
+    def set_value(value):
+        session['value'] = value
+        return 'set'
+
+    @app.route('/get')
+    def get_value():
+        return session.get('value', 'none')
+
+    @app.route('/clear')
+    def clear():
+        session.clear()
+        return 'cleared'
+
+    return app
+
+
+def test_sessions_are_kept_in_the_store():
+    store = MemoryStore()
+    client = session_app(store).test_client()
+    assert client.get('/get').headers.get('Set-Cookie') is None
+    response = client.get('/set/a secret')
+    cookie = response.headers['Set-Cookie']
+    # the cookie holds the signed session id only
+    assert 'secret' not in cookie
+    assert len(store._sessions) == 1
+    assert client.get('/get').data == b'a secret'
+
+    # another worker sharing the store reads the session
+    other = session_app(store).test_client()
+    sid_cookie = cookie.split(';')[0].split('=', 1)[1]
+    other.set_cookie('localhost', 'session', sid_cookie)
+    assert other.get('/get').data == b'a secret'
+
+    # a cookie not signed with the key starts a new session
+    other.set_cookie('localhost', 'session', sid_cookie[:-2] + 'xx')
+    assert other.get('/get').data == b'none'
+
+    client.get('/clear')
+    assert store._sessions == {}
+    assert client.get('/get').data == b'none'
+
+
+def test_memory_store_expires(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(sessions.time, 'monotonic', lambda: now[0])
+    store = MemoryStore(max_keys=4, evict_interval=60)
+    store.set('a', 'data a', 10)
+    assert store.get('a') == 'data a'
+    now[0] += 11
+    assert store.get('a') is None
+    # evicted in bulk when the store is full: the expired sessions, then
+    # the ones expiring first
+    for sid, seconds in (('b', 50), ('c', 40), ('d', 30)):
+        store.set(sid, 'data', seconds)
+    store.set('e', 'data', 20)
+    assert sorted(store._sessions) == ['b', 'c', 'd', 'e']
+    store.set('f', 'data', 20)
+    assert sorted(store._sessions) == ['b', 'c', 'f']
+
+
+def test_sql_store(db):
+    store = SqlStore(db)
+    store.set('sid', 'first', 60)
+    store.set('sid', 'second', 60)
+    assert store.get('sid') == 'second'
+    store.set('old', 'data', -1)
+    assert store.get('old') is None
+    store.delete('sid')
+    assert store.get('sid') is None
+    purge_sessions()
+    db.session.commit()
+    assert db.session.query(Session).count() == 0
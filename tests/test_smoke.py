@@ -0,0 +1,85 @@
+from datetime import datetime, timedelta
+
+from models import Artist, Show, Venue
+from read_models import ArtistSummary, VenueSummary, search_summaries
+
+
+def add_show(db, days):
+    venue = Venue(name='The Musical Hop', city='San Francisco', state='CA',
+                  address='1015 Folsom Street', genres=['Jazz', 'Reggae'])
+    artist = Artist(name='Guns N Petals', city='San Francisco', state='CA',
+                    genres=['Rock n Roll'])
+    db.session.add_all([venue, artist])
+    db.session.flush()
+    db.session.add(Show(venue_id=venue.id, artist_id=artist.id,
+                        start_time=datetime.now() + timedelta(days=days)))
+    db.session.commit()
+    return venue, artist
+
+
+def test_pages(client, db):
+    venue, artist = add_show(db, 3)
+    for url in ('/', '/venues', '/artists', '/shows',
+                '/venues/%d' % venue.id, '/artists/%d' % artist.id):
+        # read to the end: listing pages are streamed from a cursor
+        response = client.get(url)
+        assert response.status_code == 200, url
+        assert response.data, url
+    assert b'The Musical Hop' in client.get('/venues').data
+    assert b'Guns N Petals' in client.get('/shows').data
+
+
+def test_search(client, db):
+    add_show(db, 3)
+    response = client.post('/venues/search', data={'search_term': 'hop'})
+    assert response.status_code == 200
+    assert b'The Musical Hop' in response.data
+
+
+def test_create_venue(client, db):
+    response = client.post('/venues/create', data={
+        'name': 'Park Square Live Music & Coffee', 'city': 'San Francisco',
+        'state': 'CA', 'address': '34 Whiskey Moore Ave',
+        'phone': '415-000-1234', 'genres': ['Jazz', 'Folk'],
+        'facebook_link': 'https://www.facebook.com/ParkSquareLiveMusicAndCoffee'})
+    assert response.status_code == 200
+    venue = db.session.query(Venue).one()
+    assert venue.name == 'Park Square Live Music & Coffee'
+    changes = client.get('/changes?since=0').get_json()['changes']
+    assert [(change['entity'], change['action']) for change in changes] \
+        == [('venue', 'created')]
+
+
+def test_empty_database(client, db):
+    # each test starts from empty tables
+    assert db.session.query(Venue).count() == 0
+    assert client.get('/venues').status_code == 200
+
+
+def test_not_rate_limited(client, db):
+    # the limits are off for the tests, whatever their order
+    for _ in range(40):
+        response = client.post('/venues/search', data={'search_term': 'x'})
+        assert response.status_code == 200
+
+
+def test_search_counts_upcoming_shows_per_row(client, db):
+    venue, artist = add_show(db, 3)
+    other_venue, other_artist = add_show(db, 5)
+    db.session.add(Show(venue_id=venue.id, artist_id=artist.id,
+                        start_time=datetime.now() - timedelta(days=3)))
+    db.session.add(Show(venue_id=venue.id, artist_id=other_artist.id,
+                        start_time=datetime.now() + timedelta(days=9)))
+    db.session.commit()
+    venues = search_summaries(Venue, Show.venue_id, VenueSummary, 'HOP')
+    artists = search_summaries(Artist, Show.artist_id, ArtistSummary,
+                               'petals')
+    assert venues.count == 2
+    assert [tuple(row) for row in venues.data] == [
+        (venue.id, 'The Musical Hop', 2),
+        (other_venue.id, 'The Musical Hop', 1)]
+    assert [tuple(row) for row in artists.data] == [
+        (artist.id, 'Guns N Petals', 1),
+        (other_artist.id, 'Guns N Petals', 2)]
+    response = client.post('/artists/search', data={'search_term': 'petals'})
+    assert b'search results for "petals": 2' in response.data
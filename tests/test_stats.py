@@ -0,0 +1,74 @@
+import random
+from datetime import date, datetime, timedelta
+
+from models import Artist, Rollup, Show, Venue
+from stats import count_shows, rebuild, rollup_rows, week_start
+
+GENRES = ['Blues', 'Folk', 'Jazz', 'Rock n Roll']
+
+
+def add_shows(db, rng, count):
+    venues = [Venue(name='venue %d' % number, city=rng.choice(['A', 'B']),
+                    state=rng.choice(['CA', 'NY']), address='street',
+                    genres=['Jazz'])
+              for number in range(5)]
+    artists = [Artist(name='artist %d' % number, city='A', state='CA',
+                      genres=rng.sample(GENRES, rng.randint(0, 3)))
+               for number in range(7)]
+    db.session.add_all(venues + artists)
+    db.session.flush()
+    shows = [Show(venue_id=rng.choice(venues).id,
+                  artist_id=rng.choice(artists).id,
+                  start_time=datetime(2030, 1, 1)
+                  + timedelta(hours=rng.randint(0, 24 * 150)))
+             for _ in range(count)]
+    db.session.add_all(shows)
+    db.session.commit()
+    return [show.id for show in shows]
+
+
+def rollups(db):
+    return sorted((row.kind, row.key, row.period, row.label, row.count)
+                  for row in db.session.query(Rollup))
+
+
+def test_rebuild_counts_as_the_jobs(db):
+    # the numpy rebuild and the incremental count_shows jobs give the
+    # same rollups
+    show_ids = add_shows(db, random.Random(0), 300)
+    for first in range(0, len(show_ids), 40):
+        count_shows(show_ids[first:first + 40])
+        db.session.commit()
+    counted = rollups(db)
+    assert counted
+    assert sum(count for kind, _, _, _, count in counted
+               if kind == 'venue') == 300
+    assert {kind for kind, _, _, _, _ in counted} == {
+        'venue', 'artist', 'city', 'genre'}
+
+    assert rebuild(db.session) == len(counted)
+    db.session.commit()
+    assert rollups(db) == counted
+
+    # shows counted by the rebuild are not counted again
+    count_shows(show_ids)
+    db.session.commit()
+    assert rollups(db) == counted
+
+
+def test_rollup_periods(db):
+    add_shows(db, random.Random(1), 50)
+    for row in rollup_rows(db.session):
+        if row['kind'] == 'city':
+            assert row['period'] == week_start(row['period'])
+        else:
+            assert row['period'].day == 1
+
+
+def test_week_start():
+    assert week_start(date(2030, 6, 5)) == date(2030, 6, 3)
+    assert week_start(date(2030, 6, 3)) == date(2030, 6, 3)
+
+
+def test_no_shows(db):
+    assert rollup_rows(db.session) == []
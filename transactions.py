@@ -0,0 +1,57 @@
+#----------------------------------------------------------------------------#
+# Imports.
+#----------------------------------------------------------------------------#
+import random
+import time
+
+from flask import current_app
+from sqlalchemy.exc import DBAPIError
+
+from models import db
+
+
+#----------------------------------------------------------------------------#
+# Unit of work.
+#----------------------------------------------------------------------------#
+# postgres error codes worth retrying: serialization_failure and
+# deadlock_detected. Both mean "run the same transaction again".
+RETRYABLE_PGCODES = ('40001', '40P01')
+
+
+def is_retryable(error):
+    # sqlite reports lock contention as "database is locked"
+    orig = getattr(error, 'orig', None)
+    if getattr(orig, 'pgcode', None) in RETRYABLE_PGCODES:
+        return True
+    return 'database is locked' in str(orig)
+
+
+def run_in_transaction(work):
+    """Run ``work(session)`` and commit it as one transaction.
+
+    ``work`` adds or changes any number of rows through the session it
+    is given; they are committed together or not at all. Serialization
+    failures and deadlocks roll back and run ``work`` again, with
+    exponential backoff, up to DB_RETRIES times. Any other error is
+    rolled back and raised to the caller.
+
+    The session is the request-scoped ``db.session``: Flask-SQLAlchemy
+    removes it when the request ends, so it is not closed here.
+    """
+    retries = current_app.config['DB_RETRIES']
+    backoff = current_app.config['DB_RETRY_BACKOFF']
+    attempt = 0
+    while True:
+        try:
+            result = work(db.session)
+            db.session.commit()
+            return result
+        except DBAPIError as error:
+            db.session.rollback()
+            if attempt >= retries or not is_retryable(error):
+                raise
+            time.sleep(backoff * (2 ** attempt) * (1 + random.random()))
+            attempt += 1
+        except Exception:
+            db.session.rollback()
+            raise
@@ -0,0 +1,77 @@
+#----------------------------------------------------------------------------#
+# Imports.
+#----------------------------------------------------------------------------#
+import json
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy.orm import configure_mappers
+
+
+#----------------------------------------------------------------------------#
+# Warm-up.
+#----------------------------------------------------------------------------#
+def urls_from_access_log(path, hours, limit):
+    """Most requested GET paths of the last ``hours`` of a json log.
+
+    Reads the 'request' events written by logs.init_logging.
+    """
+    since = datetime.now() - timedelta(hours=hours)
+    counts = Counter()
+    with open(path) as log_file:
+        for line in log_file:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if (entry.get('message') != 'request'
+                    or entry.get('method') != 'GET'
+                    or entry.get('status') != 200):
+                continue
+            try:
+                if datetime.strptime(entry['ts'], '%Y-%m-%dT%H:%M:%S') < since:
+                    continue
+            except (KeyError, ValueError):
+                continue
+            counts[entry['path']] += 1
+    return [url for url, _ in counts.most_common(limit)]
+
+
+def warm_up(app, urls, indexes=()):
+    """Prime templates, ORM mappers, indexes and caches of ``app``.
+
+    Every template is compiled (and stored in the bytecode cache), the
+    mappers are configured, the in-process ``indexes`` ((name, build
+    function) pairs) are built, then ``urls`` are requested through the
+    test client, which fills the in-process caches and the database
+    buffers. Returns a report: [(step, seconds, detail)].
+    """
+    report = []
+
+    start = time.perf_counter()
+    names = app.jinja_env.list_templates(extensions=['html'])
+    for name in names:
+        app.jinja_env.get_template(name)
+    report.append(('templates', time.perf_counter() - start,
+                   '%d compiled' % len(names)))
+
+    start = time.perf_counter()
+    configure_mappers()
+    report.append(('mappers', time.perf_counter() - start, 'configured'))
+
+    for name, build in indexes:
+        start = time.perf_counter()
+        with app.app_context():
+            build()
+        report.append((name, time.perf_counter() - start, 'built'))
+
+    client = app.test_client()
+    for url in urls:
+        start = time.perf_counter()
+        response = client.get(url)
+        response.get_data()
+        response.close()
+        report.append((url, time.perf_counter() - start,
+                       str(response.status_code)))
+    return report